@@ -1,6 +1,9 @@
 import yaml
 from smart_open import smart_open
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from .distance_from_best import DistanceFromBestTable, BestDistancePlotter
 from .thresholding import ModelGroupThresholder
@@ -8,6 +11,9 @@ from .regrets import SelectionRulePicker, SelectionRulePlotter
 from .selection_rule_performance import SelectionRulePerformancePlotter
 from .model_group_performance import ModelGroupPerformancePlotter
 from .selection_rule_grid import make_selection_rule_grid
+from .instrumentation import Instrumentation, stage
+from .queries import QueryExecutor
+from .batch import render_all_plots
 
 
 class Auditioner(object):
@@ -19,6 +25,16 @@ class Auditioner(object):
         initial_metric_filters,
         models_table=None,
         distance_table=None,
+        pick_cache=None,
+        lazy=False,
+        background=False,
+        rule_workers=None,
+        hooks=None,
+        query_executor=None,
+        memory_profile=False,
+        memory_budget_mb=None,
+        results_schema=None,
+        seed=None,
     ):
         """Filter model groups using a two-step process:
 
@@ -44,7 +60,9 @@ class Auditioner(object):
             and its format is detailed in that method's docstring
 
         Args:
-            db_engine (sqlalchemy.engine) A database engine with access to a results schema of a completed modeling run
+            db_engine (sqlalchemy.engine) A database engine with access to a results schema
+                of a completed modeling run. Postgres, or SQLite for results exported
+                to a single file
             model_group_ids (list) A large list of model groups to audition. No effort should
                 be needed to pick 'good' model groups, but they should all be groups that could
                 be used if they are found to perform well. They should also each have evaluations
@@ -66,37 +84,177 @@ class Auditioner(object):
             distance_table (string, optional) The name of the 'best distance' table to use.
                 Will default to 'best_distance', but this can be sent if you want to avoid
                 clobbering the results from a prior analysis.
+            pick_cache (audition.pick_cache.PickCache, optional) A disk cache of selection
+                rule picks, so that picks on unchanged data are looked up instead of
+                recomputed across runs. Only used along with 'seed'
+            lazy (boolean, optional) Don't populate the distance table until its data
+                is first needed, e.g. to compute thresholded model groups or plot
+            background (boolean, optional) Start populating the distance table in a
+                background thread and return immediately. Thresholds and selection
+                rules can be configured meanwhile, and the first access to the data
+                waits for population to finish. See 'populate'
+            rule_workers (int, optional) The number of threads picking the model groups
+                for 'selection_rule_model_group_ids'. Defaults to the ThreadPoolExecutor default
+            hooks (list, optional) Callables, each called with the record of every
+                measured stage as it ends; see 'stage_report'
+            query_executor (audition.queries.QueryExecutor, optional) Runs the queries
+                against the distance table, and can record them and their plans.
+                Defaults to one that records nothing
+            memory_profile (boolean, optional) Trace Python allocations, to find the
+                stages and selection rules that allocate the most; see 'memory_report'
+            memory_budget_mb (float, optional) The most memory the selection rule picker
+                keeps fetched histories in. See audition.regrets.SelectionRulePicker
+            results_schema (string, optional) The schema holding the evaluations, models
+                and model groups tables. Defaults to 'results' on postgres, and to
+                the database file itself on SQLite
+            seed (int, optional) Seeds the random tie-breaking of selection rules,
+                so that their picks are reproducible
         """
         self.metric_filters = initial_metric_filters
         # sort the train end times so we can reliably pick off the last time later
         self.train_end_times = sorted(train_end_times)
 
+        self.instrumentation = Instrumentation(hooks, track_memory=memory_profile)
+        self.instrumentation.attach(db_engine)
+        self.query_executor = query_executor or QueryExecutor(db_engine)
+
         models_table = models_table or 'models'
         distance_table = distance_table or 'best_distance'
         self.distance_from_best_table = DistanceFromBestTable(
             db_engine=db_engine,
             models_table=models_table,
-            distance_table=distance_table
+            distance_table=distance_table,
+            instrumentation=self.instrumentation,
+            query_executor=self.query_executor,
+            results_schema=results_schema
         )
-        self.best_distance_plotter = BestDistancePlotter(self.distance_from_best_table)
         self.model_group_thresholder = ModelGroupThresholder(
             distance_from_best_table=self.distance_from_best_table,
             train_end_times=train_end_times,
             initial_model_group_ids=model_group_ids,
-            initial_metric_filters=initial_metric_filters
+            initial_metric_filters=initial_metric_filters,
+            instrumentation=self.instrumentation
+        )
+        self.selection_rule_picker = SelectionRulePicker(
+            self.distance_from_best_table,
+            seed=seed,
+            pick_cache=pick_cache,
+            instrumentation=self.instrumentation,
+            memory_budget_mb=memory_budget_mb
         )
-        self.model_group_performance_plotter = ModelGroupPerformancePlotter(self.distance_from_best_table)
+        self._best_distance_plotter = None
+        self._model_group_performance_plotter = None
+        self._selection_rule_plotter = None
+        self._selection_rule_performance_plotter = None
+        self._regret_results = None
+        self._regret_results_key = None
+        self.rule_workers = rule_workers
+        self._selection_rule_model_group_ids = None
+        self._selection_rule_model_group_ids_key = None
+
+        self._model_group_ids = model_group_ids
+        self._population_metrics = self.metrics
+        self._population = None
+        self._population_lock = threading.Lock()
+        if background:
+            self.populate(background=True)
+        elif not lazy:
+            self.populate()
+
+    def populate(self, background=False):
+        """Populate the distance table, unless it has been or is being populated already
 
-        self.selection_rule_picker = SelectionRulePicker(self.distance_from_best_table)
-        self.selection_rule_plotter = SelectionRulePlotter(self.selection_rule_picker)
-        self.selection_rule_performance_plotter = SelectionRulePerformancePlotter(self.selection_rule_picker)
+        Args:
+            background (boolean, optional) Populate in a background thread
+                instead of waiting for population to finish
 
+        Returns: (concurrent.futures.Future) Resolves once the table is populated
+        """
+        with self._population_lock:
+            if self._population is None:
+                if background:
+                    executor = ThreadPoolExecutor(max_workers=1)
+                    self._population = executor.submit(self._populate)
+                    executor.shutdown(wait=False)
+                else:
+                    self._populate()
+                    self._population = Future()
+                    self._population.set_result(None)
+        return self._population
+
+    def _populate(self):
+        logging.info('Populating distance table %s', self.distance_from_best_table.distance_table)
         self.distance_from_best_table.create_and_populate(
-            model_group_ids,
+            self._model_group_ids,
             self.train_end_times,
-            self.metrics
+            self._population_metrics
         )
 
+    def _ensure_populated(self):
+        """Wait for the distance table to be populated, populating it now if needed"""
+        self.populate().result()
+
+    @property
+    def best_distance_plotter(self):
+        self._ensure_populated()
+        if self._best_distance_plotter is None:
+            self._best_distance_plotter = BestDistancePlotter(
+                self.distance_from_best_table,
+                client_side_ecdf=True
+            )
+        return self._best_distance_plotter
+
+    @property
+    def model_group_performance_plotter(self):
+        self._ensure_populated()
+        if self._model_group_performance_plotter is None:
+            self._model_group_performance_plotter = ModelGroupPerformancePlotter(
+                self.distance_from_best_table
+            )
+        return self._model_group_performance_plotter
+
+    @property
+    def selection_rule_plotter(self):
+        self._ensure_populated()
+        if self._selection_rule_plotter is None:
+            self._selection_rule_plotter = SelectionRulePlotter(self.selection_rule_picker)
+        return self._selection_rule_plotter
+
+    @property
+    def selection_rule_performance_plotter(self):
+        self._ensure_populated()
+        if self._selection_rule_performance_plotter is None:
+            self._selection_rule_performance_plotter = SelectionRulePerformancePlotter(
+                self.selection_rule_picker
+            )
+        return self._selection_rule_performance_plotter
+
+    @property
+    def stage_report(self):
+        """The measurements of every stage so far: population, each fetch from the
+        distance table, thresholding, each selection rule's picks and each plot
+
+        Returns: (list) of dicts with the keys 'stage', 'labels', 'seconds', 'rows',
+            'queries', 'peak_rss_mb' and 'allocated_peak_mb'.
+            See audition.instrumentation.Instrumentation
+        """
+        return self.instrumentation.report()
+
+    def memory_report(self, n=10):
+        """The stages and selection rules that allocated the most memory, when
+        constructed with memory_profile
+
+        Args:
+            n (int, optional) How many to report
+
+        Returns: (list) stage records, by descending 'allocated_peak_mb'
+        """
+        if not self.instrumentation.track_memory:
+            logging.warning(
+                'Memory is only profiled when the Auditioner is constructed with memory_profile'
+            )
+        return self.instrumentation.top_memory(n)
+
     @property
     def metrics(self):
         return [
@@ -112,34 +270,103 @@ class Auditioner(object):
 
         Returns: (list) of model group ids
         """
+        self._ensure_populated()
         return self.model_group_thresholder.model_group_ids
 
+    def _selection_rules_key(self):
+        return tuple(
+            (rule.descriptive_name, repr(sorted(rule.args.items())))
+            for rule in self.selection_rules
+        )
+
+    def _timed_pick(self, selection_rule, model_group_ids, train_end_time):
+        start = time.time()
+        model_group_id = self.selection_rule_picker.model_group_from_rule(
+            bound_selection_rule=selection_rule,
+            model_group_ids=model_group_ids,
+            train_end_time=train_end_time,
+        )
+        logging.info(
+            'For rule %s, model group %s was picked in %.3f seconds',
+            selection_rule,
+            model_group_id,
+            time.time() - start
+        )
+        return model_group_id
+
     @property
     def selection_rule_model_group_ids(self):
         """Calculate the current winners for each selection rule and the most recent date
 
+        The rules are evaluated concurrently, and the result is reused until the
+        selection rules or thresholded model groups change.
+
         Returns: (dict) keys are selection rule descriptive names, values are the model group id
             chosen by them
         """
-        logging.info('Calculating selection rule picks for all rules')
-        model_group_ids = dict()
         thresholded_ids = self.thresholded_model_group_ids
-        for selection_rule in self.selection_rules:
-            logging.info('Calculating selection rule picks for %s', selection_rule)
-            model_group_ids[selection_rule.descriptive_name] =\
-                self.selection_rule_picker.model_group_from_rule(
-                    bound_selection_rule=selection_rule,
-                    model_group_ids=thresholded_ids,
-                    # evaluate the selection rules for the most recent
-                    # time period and use those as candidate model groups
-                    train_end_time=self.train_end_times[-1],
+        # evaluate the selection rules for the most recent
+        # time period and use those as candidate model groups
+        train_end_time = self.train_end_times[-1]
+        key = (self._selection_rules_key(), frozenset(thresholded_ids), train_end_time)
+        if key != self._selection_rule_model_group_ids_key:
+            logging.info('Calculating selection rule picks for all rules')
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=self.rule_workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._timed_pick,
+                        selection_rule,
+                        thresholded_ids,
+                        train_end_time
+                    )
+                    for selection_rule in self.selection_rules
+                ]
+                self._selection_rule_model_group_ids = dict(
+                    (selection_rule.descriptive_name, future.result())
+                    for selection_rule, future in zip(self.selection_rules, futures)
                 )
             logging.info(
-                'For rule %s, model group %s was picked',
-                selection_rule,
-                model_group_ids[selection_rule.descriptive_name]
+                'Picked model groups for %s selection rules in %.3f seconds',
+                len(self.selection_rules),
+                time.time() - start
+            )
+            self._selection_rule_model_group_ids_key = key
+        return dict(self._selection_rule_model_group_ids)
+
+    @property
+    def regret_results(self):
+        """The picks of each selection rule over time, and their regrets against each
+        configured metric, for the currently thresholded model groups.
+
+        Computed once and reused until the selection rules, thresholded model groups
+        or metrics change. When only the thresholded model groups change, the picker
+        only picks again where the change could have changed a rule's pick; see
+        audition.regrets.SelectionRulePicker.
+
+        Returns: (audition.regrets.RegretResults)
+        """
+        thresholded_model_group_ids = self.thresholded_model_group_ids
+        # We can't calculate regrets for the most recent train end time,
+        # so don't send that in. Assumes that the train_end_times
+        # are sorted in the constructor
+        train_end_times = self.train_end_times[:-1]
+        key = (
+            self._selection_rules_key(),
+            frozenset(thresholded_model_group_ids),
+            tuple(train_end_times),
+            tuple((metric['metric'], metric['parameter']) for metric in self.metrics),
+        )
+        if key != self._regret_results_key:
+            logging.info('Calculating regrets for all selection rules')
+            self._regret_results = self.selection_rule_picker.regret_results(
+                bound_selection_rules=self.selection_rules,
+                model_group_ids=thresholded_model_group_ids,
+                train_end_times=train_end_times,
+                regret_metrics=self.metrics,
             )
-        return model_group_ids
+            self._regret_results_key = key
+        return self._regret_results
 
     def plot_model_groups(self):
         """Display model group plots, one of the below for each configured metric.
@@ -155,17 +382,19 @@ class Auditioner(object):
         if len(thresholded_model_group_ids) == 0:
             logging.warning('Zero model group ids found that passed configured thresholds. Nothing to plot')
             return
-        self.best_distance_plotter.plot_all_best_dist(
-            self.metrics,
-            thresholded_model_group_ids, 
-            self.train_end_times
-        )
+        with stage(self.instrumentation, 'plot', plot='best_distance'):
+            self.best_distance_plotter.plot_all_best_dist(
+                self.metrics,
+                thresholded_model_group_ids,
+                self.train_end_times
+            )
         logging.info('Showing model group performance plots for all metrics')
-        self.model_group_performance_plotter.plot_all(
-            metric_filters=self.metric_filters,
-            model_group_ids=thresholded_model_group_ids,
-            train_end_times=self.train_end_times
-        )
+        with stage(self.instrumentation, 'plot', plot='performance'):
+            self.model_group_performance_plotter.plot_all(
+                metric_filters=self.metric_filters,
+                model_group_ids=thresholded_model_group_ids,
+                train_end_times=self.train_end_times
+            )
 
     def update_metric_filters(self, new_filters, plot=True):
         """Update the thresholding metric filters
@@ -204,20 +433,45 @@ class Auditioner(object):
         2. A regret-over-time plot for each selection rule
         3. A metric-over-time plot for each selection rule
         """
+        regret_results = self.regret_results
+        thresholded_model_group_ids = self.thresholded_model_group_ids
         for metric_definition in self.metrics:
             common_kwargs = dict(
                 bound_selection_rules=self.selection_rules,
                 regret_metric=metric_definition['metric'],
                 regret_parameter=metric_definition['parameter'],
-                model_group_ids=self.thresholded_model_group_ids,
+                model_group_ids=thresholded_model_group_ids,
                 train_end_times=self.train_end_times[:-1],
                 # We can't calculate regrets for the most recent train end time,
                 # so don't send that in. Assumes that the train_end_times
                 # are sorted in the constructor
+                regret_results=regret_results,
+            )
+            labels = dict(
+                metric=metric_definition['metric'],
+                parameter=metric_definition['parameter']
             )
-            self.selection_rule_plotter.plot_all_selection_rules(**common_kwargs)
-            self.selection_rule_performance_plotter.plot(plot_type='regret', **common_kwargs)
-            self.selection_rule_performance_plotter.plot(plot_type='metric', **common_kwargs)
+            with stage(self.instrumentation, 'plot', plot='regret_cdf', **labels):
+                self.selection_rule_plotter.plot_all_selection_rules(**common_kwargs)
+            with stage(self.instrumentation, 'plot', plot='regret_over_time', **labels):
+                self.selection_rule_performance_plotter.plot(plot_type='regret', **common_kwargs)
+            with stage(self.instrumentation, 'plot', plot='metric_next_time', **labels):
+                self.selection_rule_performance_plotter.plot(plot_type='metric', **common_kwargs)
+
+    def render_plots(self, output_dir, formats=('png',), executor='process'):
+        """Write every model group and selection rule plot to files instead of
+        displaying them, e.g. for scheduled reports
+
+        Args:
+            output_dir (string) A directory to write the figures to
+            formats (list, optional) File extensions to write each figure as,
+                e.g. ['png', 'svg']
+            executor (concurrent.futures.Executor or string, optional) How to render
+                the figures; see audition.batch.render_all_plots
+
+        Returns: (list) A manifest with the paths and render time of each figure
+        """
+        return render_all_plots(self, output_dir, formats, executor)
 
     def register_selection_rule_grid(self, rule_grid, plot=True):
         """Register a grid of selection rules
@@ -270,6 +524,11 @@ class Auditioner(object):
         if plot:
             self.plot_selection_rules()
 
+    def close(self):
+        """Stop counting the queries run on the database engine. The stage
+        records are kept, and the results computed so far stay available"""
+        self.instrumentation.close()
+
     def write_tyra_config(self, write_path):
         """Write the final selection rules and model groups to a YAML file, for later use
         by the 'Tyra' webapp.
@@ -280,4 +539,8 @@ class Auditioner(object):
         """
         logging.info('Writing final model group ids to export to Tyra')
         with smart_open(write_path, 'w') as f:
-            yaml.dump({'selection_rule_model_groups': self.selection_rule_model_group_ids}, f)
+            # plain ints, so the file doesn't depend on numpy to be read
+            yaml.dump({'selection_rule_model_groups': dict(
+                (rule, int(model_group_id))
+                for rule, model_group_id in self.selection_rule_model_group_ids.items()
+            )}, f)
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+
+import numpy
+import pandas as pd
+
+from audition.utils import str_in_sql
+
+
+class PostgresBackend(object):
+    """The SQL audition runs against postgres, the database triage writes results to
+
+    Each backend supplies the parts of audition's queries that differ between
+    databases; everything else is written in SQL that both understand.
+    """
+    name = 'postgresql'
+    # where triage puts the evaluations, models and model groups tables
+    default_results_schema = 'results'
+    # whether the database can expand model groups by plotted distances itself
+    server_side_ecdf = True
+
+    def time(self, column):
+        """An expression for a timestamp column, comparable to 'times'"""
+        return column
+
+    def times(self, times):
+        """A list of timestamps, for use in 'in (...)'"""
+        return str_in_sql(times)
+
+    def metric_summaries(self, query_executor, distance_table, quantiles):
+        """Summary statistics of the raw values of each metric in a distance table
+
+        Args:
+            query_executor (audition.queries.QueryExecutor)
+            distance_table (string) The name of the table
+            quantiles (tuple) The quantiles to find, between 0 and 1
+
+        Returns: (list) of (metric, parameter, count, min, max, quantiles) rows,
+            quantiles being a list of the values at each of the given quantiles
+        """
+        query = '''
+            SELECT
+                metric,
+                parameter,
+                count(raw_value),
+                min(raw_value),
+                max(raw_value),
+                percentile_cont(array[{quantiles}]) WITHIN GROUP (ORDER BY raw_value)
+            FROM {distance_table} dist
+            GROUP BY metric, parameter
+        '''.format(
+            distance_table=distance_table,
+            quantiles=','.join(str(quantile) for quantile in quantiles)
+        )
+        return query_executor.execute(query)
+
+    def fingerprint(self, query_executor, distance_table):
+        """The row count and a digest of the contents of a distance table
+
+        The digest sums a hash of each row, so it needs neither a sort nor one
+        value holding the whole table, and doesn't depend on the row order.
+
+        Returns: (tuple) of the count and the digest
+        """
+        query = '''
+            SELECT count(*), coalesce(sum(hashtext(dist::text)::bigint), 0)
+            FROM {distance_table} dist
+        '''.format(distance_table=distance_table)
+        row_count, digest = next(iter(query_executor.execute(query)))
+        return row_count, str(digest)
+
+    def frame(self, df):
+        """Convert a fetched dataframe to the types postgres would have given it"""
+        return df
+
+
+class SQLiteBackend(PostgresBackend):
+    """SQL for a results database exported to a single SQLite file
+
+    SQLite (3.25 or later) has the window functions population relies on,
+    but no timestamp type, percentiles, digests or GENERATE_SERIES. Timestamps
+    are stored as text and normalized with datetime() before comparing them,
+    and summaries, fingerprints and plotted distances are computed from fetched rows.
+    Schemas are attached databases, 'main' being the file itself.
+    """
+    name = 'sqlite'
+    default_results_schema = 'main'
+    server_side_ecdf = False
+
+    def time(self, column):
+        return 'datetime({})'.format(column)
+
+    def times(self, times):
+        return ','.join("datetime('{}')".format(time) for time in times)
+
+    def metric_summaries(self, query_executor, distance_table, quantiles):
+        df = query_executor.read_sql(
+            'select metric, parameter, raw_value from {}'.format(distance_table)
+        )
+        rows = []
+        for (metric, parameter), values in df.groupby(['metric', 'parameter'])['raw_value']:
+            values = values.dropna()
+            if len(values) == 0:
+                rows.append((metric, parameter, 0, None, None, None))
+                continue
+            rows.append((
+                metric,
+                parameter,
+                len(values),
+                values.min(),
+                values.max(),
+                # linear interpolation, as percentile_cont does
+                list(numpy.quantile(values, quantiles)),
+            ))
+        return rows
+
+    def fingerprint(self, query_executor, distance_table):
+        rows = query_executor.execute('select * from {}'.format(distance_table))
+        digest = sum(
+            int(hashlib.md5(str(tuple(row)).encode('utf-8')).hexdigest()[:16], 16)
+            for row in rows
+        )
+        return len(rows), str(digest)
+
+    def frame(self, df):
+        if 'train_end_time' in df.columns and df['train_end_time'].dtype == object:
+            df['train_end_time'] = pd.to_datetime(df['train_end_time'])
+        return df
+
+
+BACKENDS = dict((backend.name, backend) for backend in (PostgresBackend, SQLiteBackend))
+
+
+def backend_for(db_engine):
+    """The backend for a database engine's dialect
+
+    Args:
+        db_engine (sqlalchemy.engine)
+
+    Returns: (PostgresBackend) or a subclass. Dialects without their own
+        backend get the postgres one
+    """
+    dialect = db_engine.dialect.name
+    if dialect not in BACKENDS:
+        logging.warning('No audition backend for %s databases, using the postgres SQL', dialect)
+    return BACKENDS.get(dialect, PostgresBackend)()
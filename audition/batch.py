@@ -0,0 +1,235 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+import logging
+import os
+import re
+import time
+
+from audition.distance_from_best import plot_best_dist
+from audition.model_group_performance import of_metric, plot_model_group_performance
+from audition.regrets import SelectionRulePlotter
+from audition.selection_rule_performance import SelectionRulePerformancePlotter
+
+
+def _slug(value):
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(value)).strip('_')
+
+
+def _render_best_distance(metric, parameter, df, save_path, aggregate_above, top_k):
+    plot_best_dist(
+        metric=metric,
+        parameter=parameter,
+        df_best_dist=df,
+        aggregate_above=aggregate_above,
+        top_k=top_k,
+        save_path=save_path
+    )
+
+
+def _render_performance(metric, parameter, df, save_path, train_end_times, aggregate_above, top_k):
+    plot_model_group_performance(
+        metric=metric,
+        parameter=parameter,
+        df_metric=df,
+        train_end_times=train_end_times,
+        aggregate_above=aggregate_above,
+        top_k=top_k,
+        save_path=save_path
+    )
+
+
+def _render_regret_cdf(metric, parameter, df, save_path, bounds):
+    SelectionRulePlotter.plot_from_dataframe(metric, parameter, df, bounds, save_path=save_path)
+
+
+def _render_regret_over_time(metric, parameter, df, save_path):
+    SelectionRulePerformancePlotter.regret_plot_from_dataframe(
+        metric=metric,
+        parameter=parameter,
+        df=df,
+        save_path=save_path
+    )
+
+
+def _render_metric_next_time(metric, parameter, df, save_path):
+    SelectionRulePerformancePlotter.raw_next_time_plot_from_dataframe(
+        metric=metric,
+        parameter=parameter,
+        df=df,
+        save_path=save_path
+    )
+
+
+RENDERERS = {
+    'best_distance': _render_best_distance,
+    'performance': _render_performance,
+    'regret_cdf': _render_regret_cdf,
+    'regret_over_time': _render_regret_over_time,
+    'metric_next_time': _render_metric_next_time,
+}
+
+
+def render_figure(plot, metric, parameter, df, save_paths, **kwargs):
+    """Render one figure to files; the entry point for worker processes
+
+    Args:
+        plot (string) A key of RENDERERS
+        metric (string) -- model evaluation metric, such as 'precision@'
+        parameter (string) -- model evaluation metric parameter, such as '300_abs'
+        df (pandas.DataFrame) The plot data
+        save_paths (list) The files to write the figure to
+        **kwargs Further arguments for the renderer
+
+    Returns: (dict) A manifest entry, with the keys 'plot', 'metric', 'parameter',
+        'paths' and 'seconds'
+    """
+    start = time.time()
+    RENDERERS[plot](metric, parameter, df, save_paths, **kwargs)
+    return {
+        'plot': plot,
+        'metric': metric,
+        'parameter': parameter,
+        'paths': save_paths,
+        'seconds': time.time() - start,
+    }
+
+
+def plot_tasks(auditioner, output_dir, formats):
+    """Compute the data for every plot of an Auditioner, fetching each dataset once
+
+    Args:
+        auditioner (audition.Auditioner)
+        output_dir (string) The directory figures will be written to
+        formats (list) File extensions to write each figure as, e.g. ['png', 'svg']
+
+    Returns: (list) keyword arguments for 'render_figure', one per figure
+    """
+    tasks = []
+
+    def add_task(plot, metric_definition, df, **kwargs):
+        metric, parameter = metric_definition['metric'], metric_definition['parameter']
+        name = '{}_{}_{}'.format(plot, _slug(metric), _slug(parameter))
+        tasks.append(dict(
+            plot=plot,
+            metric=metric,
+            parameter=parameter,
+            df=df,
+            save_paths=[
+                os.path.join(output_dir, '{}.{}'.format(name, extension))
+                for extension in formats
+            ],
+            **kwargs
+        ))
+
+    model_group_ids = auditioner.thresholded_model_group_ids
+    train_end_times = auditioner.train_end_times
+    metrics = auditioner.metrics
+    if len(model_group_ids) == 0:
+        logging.warning(
+            'Zero model group ids found that passed configured thresholds. Nothing to plot'
+        )
+        return tasks
+
+    best_distance_plotter = auditioner.best_distance_plotter
+    if best_distance_plotter.client_side_ecdf:
+        distances = best_distance_plotter.fetch_distances(metrics, model_group_ids, train_end_times)
+    performance_plotter = auditioner.model_group_performance_plotter
+    performance = performance_plotter.fetch_plot_data(metrics, model_group_ids, train_end_times)
+    for metric_definition in metrics:
+        metric, parameter = metric_definition['metric'], metric_definition['parameter']
+        if best_distance_plotter.client_side_ecdf:
+            best_distance = best_distance_plotter.ecdf_plot_data(distances, metric, parameter)
+        else:
+            best_distance = best_distance_plotter.generate_plot_data(
+                metric,
+                parameter,
+                model_group_ids,
+                train_end_times
+            )
+        add_task(
+            'best_distance',
+            metric_definition,
+            best_distance,
+            aggregate_above=best_distance_plotter.aggregate_above,
+            top_k=best_distance_plotter.aggregate_top_k
+        )
+        add_task(
+            'performance',
+            metric_definition,
+            of_metric(performance, metric, parameter),
+            train_end_times=train_end_times,
+            aggregate_above=performance_plotter.aggregate_above,
+            top_k=performance_plotter.aggregate_top_k
+        )
+
+    selection_rules = getattr(auditioner, 'selection_rules', None)
+    if not selection_rules:
+        return tasks
+    regret_results = auditioner.regret_results
+    for metric_definition in metrics:
+        metric, parameter = metric_definition['metric'], metric_definition['parameter']
+        common_kwargs = dict(
+            bound_selection_rules=selection_rules,
+            model_group_ids=model_group_ids,
+            train_end_times=train_end_times[:-1],
+            regret_metric=metric,
+            regret_parameter=parameter,
+            regret_results=regret_results,
+        )
+        bounds = auditioner.selection_rule_plotter.plot_bounds(metric, parameter)
+        add_task(
+            'regret_cdf',
+            metric_definition,
+            auditioner.selection_rule_plotter.create_plot_dataframe(bounds=bounds, **common_kwargs),
+            bounds=bounds
+        )
+        over_time = auditioner.selection_rule_performance_plotter.generate_plot_data(
+            **common_kwargs
+        )
+        add_task('regret_over_time', metric_definition, over_time)
+        add_task('metric_next_time', metric_definition, over_time)
+    return tasks
+
+
+def render_all_plots(auditioner, output_dir, formats=('png',), executor='process'):
+    """Render every Auditioner plot to files, without displaying them
+
+    All plot data is computed up front in this process, then the figures
+    are drawn by the executor. Each figure is closed as soon as it is written.
+
+    Args:
+        auditioner (audition.Auditioner)
+        output_dir (string) A directory to write the figures to. Created if missing
+        formats (list, optional) File extensions to write each figure as,
+            any format matplotlib can save, e.g. ['png', 'svg']
+        executor (concurrent.futures.Executor or string, optional) How to render
+            the figures. None renders them in this process, 'process' in a
+            process pool created for this call, and an Executor instance is used as given
+
+    Returns: (list) A manifest with an entry per figure, each a dict with
+        the keys 'plot', 'metric', 'parameter', 'paths' and 'seconds'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = plot_tasks(auditioner, output_dir, list(formats))
+    logging.info('Rendering %s figures to %s', len(tasks), output_dir)
+    if executor is None:
+        manifest = [render_figure(**task) for task in tasks]
+    elif isinstance(executor, Executor):
+        futures = [executor.submit(render_figure, **task) for task in tasks]
+        manifest = [future.result() for future in futures]
+    elif executor == 'process':
+        with ProcessPoolExecutor() as pool:
+            futures = [pool.submit(render_figure, **task) for task in tasks]
+            manifest = [future.result() for future in futures]
+    else:
+        raise ValueError('Unknown executor {}'.format(executor))
+    instrumentation = getattr(auditioner, 'instrumentation', None)
+    if instrumentation is not None:
+        for entry in manifest:
+            instrumentation.record(
+                'plot',
+                entry['seconds'],
+                plot=entry['plot'],
+                metric=entry['metric'],
+                parameter=entry['parameter']
+            )
+    return manifest
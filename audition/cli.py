@@ -0,0 +1,235 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+import yaml
+from smart_open import smart_open
+from sqlalchemy import create_engine
+
+from audition import Auditioner
+from audition.queries import QueryExecutor
+
+QUERY_KEYS = {
+    'model_group_ids': 'model_groups_query',
+    'train_end_times': 'train_end_times_query',
+}
+
+
+def load_config(path):
+    """Read and validate a YAML audition config
+
+    The config has the keys:
+
+        db_url (string) A SQLAlchemy database URL for the results schema
+        model_group_ids (list) The model groups to audition, or
+            model_groups_query (string) A query whose first column is the model group ids
+        train_end_times (list) The train end times to audition, or
+            train_end_times_query (string) A query whose first column is the train end times
+        metric_filters (list) Initial metric filters, as given to Auditioner
+        rule_grid (list) A selection rule grid, as given to
+            Auditioner.register_selection_rule_grid
+        models_table (string, optional) as given to Auditioner
+        distance_table (string, optional) as given to Auditioner
+        results_schema (string, optional) as given to Auditioner
+        rule_workers (int, optional) as given to Auditioner
+        tyra_config_path (string, optional) Where to write the Tyra config
+        results_path (string, optional) Where to write the results file
+        query_log_path (string, optional) Where to write the queries that were run
+        explain_queries (boolean, optional) Also write the plan of each query
+
+    Args:
+        path (string) The smart_open-ready path to the config
+
+    Returns: (dict) the config
+    """
+    with smart_open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    for key in ('db_url', 'metric_filters', 'rule_grid'):
+        if key not in config:
+            raise ValueError('Audition config is missing {}'.format(key))
+    for key, query_key in QUERY_KEYS.items():
+        if (key in config) == (query_key in config):
+            raise ValueError(
+                'Audition config needs exactly one of {} and {}'.format(key, query_key)
+            )
+    return config
+
+
+def _values(db_engine, config, key):
+    if key in config:
+        return config[key]
+    return [row[0] for row in db_engine.execute(config[QUERY_KEYS[key]])]
+
+
+@contextmanager
+def _timed(timings, stage):
+    start = time.time()
+    yield
+    timings[stage] = time.time() - start
+    logging.info('Finished %s in %.3f seconds', stage, timings[stage])
+
+
+def run(
+    config,
+    tyra_config_path=None,
+    results_path=None,
+    query_log_path=None,
+    explain_queries=None,
+    db_engine=None
+):
+    """Run audition end to end without plotting: populate the distance table,
+    threshold the model groups, and pick a model group with each selection rule
+
+    Args:
+        config (dict) An audition config; see load_config
+        tyra_config_path (string, optional) Where to write the Tyra config.
+            Defaults to the config's tyra_config_path, if any
+        results_path (string, optional) Where to write a JSON file with the
+            thresholded model groups, the picks, the regrets, the timings and
+            the totals of each instrumented stage.
+            Defaults to the config's results_path, if any
+        query_log_path (string, optional) Where to write a JSON file with the text,
+            duration and row count of every query against the distance table.
+            Defaults to the config's query_log_path, if any
+        explain_queries (boolean, optional) Also capture the EXPLAIN (ANALYZE, BUFFERS)
+            output of each query in the query log. Defaults to the config's explain_queries
+        db_engine (sqlalchemy.engine, optional) An engine for the config's database,
+            e.g. to share its connection pool. Created from the db_url by default
+
+    Returns: (dict) The results, as written to the results file
+    """
+    timings = dict()
+    db_engine = db_engine or create_engine(config['db_url'])
+    query_log_path = query_log_path or config.get('query_log_path')
+    if explain_queries is None:
+        explain_queries = config.get('explain_queries', False)
+    query_executor = QueryExecutor(
+        db_engine,
+        record=bool(query_log_path),
+        explain=explain_queries
+    )
+    with _timed(timings, 'setup'):
+        auditioner = Auditioner(
+            db_engine,
+            _values(db_engine, config, 'model_group_ids'),
+            _values(db_engine, config, 'train_end_times'),
+            config['metric_filters'],
+            models_table=config.get('models_table'),
+            distance_table=config.get('distance_table'),
+            results_schema=config.get('results_schema'),
+            rule_workers=config.get('rule_workers'),
+            lazy=True,
+            query_executor=query_executor,
+        )
+    try:
+        with _timed(timings, 'population'):
+            auditioner.populate()
+        with _timed(timings, 'thresholding'):
+            thresholded_model_group_ids = auditioner.thresholded_model_group_ids
+        with _timed(timings, 'selection rules'):
+            auditioner.register_selection_rule_grid(config['rule_grid'], plot=False)
+            selection_rule_model_groups = auditioner.selection_rule_model_group_ids
+        with _timed(timings, 'regrets'):
+            regret_results = auditioner.regret_results
+
+        tyra_config_path = tyra_config_path or config.get('tyra_config_path')
+        if tyra_config_path:
+            with _timed(timings, 'tyra config'):
+                auditioner.write_tyra_config(tyra_config_path)
+
+        results = {
+            'thresholded_model_group_ids': sorted(int(i) for i in thresholded_model_group_ids),
+            'selection_rule_model_groups': dict(
+                (rule, int(model_group_id))
+                for rule, model_group_id in selection_rule_model_groups.items()
+            ),
+            'regrets': json.loads(regret_results.dataframe[[
+                'selection_rule', 'train_end_time', 'model_group_id',
+                'metric', 'parameter', 'regret'
+            ]].to_json(orient='records', date_format='iso')),
+            'timings': timings,
+            'stages': auditioner.instrumentation.summary(),
+        }
+        results_path = results_path or config.get('results_path')
+        if results_path:
+            with smart_open(results_path, 'w') as f:
+                json.dump(results, f, indent=2)
+        if query_log_path:
+            query_executor.dump(query_log_path)
+    finally:
+        auditioner.close()
+    return results
+
+
+def format_timings(timings):
+    """A table of stage timings, one stage per line"""
+    width = max(len(stage) for stage in timings)
+    lines = [
+        '{:<{}}  {:>10.3f}s'.format(stage, width, seconds)
+        for stage, seconds in timings.items()
+    ]
+    lines.append('{:<{}}  {:>10.3f}s'.format('total', width, sum(timings.values())))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run audition headlessly from YAML configs')
+    parser.add_argument(
+        'configs',
+        nargs='+',
+        help='paths to YAML audition configs. Several are auditioned concurrently'
+    )
+    parser.add_argument('--tyra-config', help='where to write the Tyra config, for a single config')
+    parser.add_argument(
+        '--results',
+        help='where to write the JSON results file, combined across configs if several'
+    )
+    parser.add_argument(
+        '--query-log',
+        help='where to write the queries that were run as JSON, for a single config'
+    )
+    parser.add_argument(
+        '--explain',
+        action='store_true',
+        default=None,
+        help='capture EXPLAIN (ANALYZE, BUFFERS) output for each query in the query log'
+    )
+    parser.add_argument('--workers', type=int, help='how many configs to audition at once')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level)
+
+    if len(args.configs) == 1:
+        results = run(
+            load_config(args.configs[0]),
+            args.tyra_config,
+            args.results,
+            args.query_log,
+            args.explain
+        )
+        print(format_timings(results['timings']))
+        return 0
+
+    if args.tyra_config or args.query_log:
+        parser.error(
+            'with several configs, give tyra_config_path and query_log_path in each config'
+        )
+    from audition.experiments import audition_experiments
+    report = audition_experiments(
+        [load_config(path) for path in args.configs],
+        max_workers=args.workers,
+        report_path=args.results
+    )
+    for name, results in sorted(report['experiments'].items()):
+        print(name)
+        print(format_timings(results['timings']))
+    for name, error in sorted(report['failed'].items()):
+        print('{} failed: {}'.format(name, error))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,24 @@
-from audition.utils import str_in_sql
+from audition.utils import str_in_sql, ecdf
 from audition.metric_directionality import sql_rank_order
-from audition.plotting import plot_cats, plot_bounds
+from audition.plotting import plot_cats, plot_bounds, DEFAULT_AGGREGATE_ABOVE
+from audition.instrumentation import stage
+from audition.queries import QueryExecutor
 import pandas as pd
 import numpy as np
 import logging
+from decimal import Decimal
 
 
 class DistanceFromBestTable(object):
-    def __init__(self, db_engine, models_table, distance_table):
+    def __init__(
+        self,
+        db_engine,
+        models_table,
+        distance_table,
+        instrumentation=None,
+        query_executor=None,
+        results_schema=None
+    ):
         """A database table that stores the distance from models and the
         best model for that train end time for a variety of chosen metrics
 
@@ -16,20 +27,34 @@ class DistanceFromBestTable(object):
             models_table (string) The name of a models table in the database, pre-populated
             distance_table (string) The desired name of the distance table to be
                 produced by this class
+            instrumentation (audition.instrumentation.Instrumentation, optional)
+                Measures population and each fetch from the table
+            query_executor (audition.queries.QueryExecutor, optional) Runs the queries
+                against the table, and those of the plotters using it. Defaults
+                to one that records nothing. Its backend supplies the SQL that
+                differs between postgres and SQLite
+            results_schema (string, optional) The schema holding the evaluations,
+                models and model groups tables. Defaults to 'results' on postgres
+                and the database file itself ('main') on SQLite
         """
         self.db_engine = db_engine
         self.models_table = models_table
         self.distance_table = distance_table
+        self.instrumentation = instrumentation
+        self.query_executor = query_executor or QueryExecutor(db_engine)
+        self.backend = self.query_executor.backend
+        self.results_schema = results_schema or self.backend.default_results_schema
+        self._metric_summaries = None
 
     def _delete(self):
         """Delete the distance-from-best table if it exists"""
-        self.db_engine.execute(
+        self.query_executor.execute(
             'drop table if exists {}'.format(self.distance_table)
         )
 
     def _create(self):
         """Create the distance-from-best table"""
-        self.db_engine.execute('''create table {} (
+        self.query_executor.execute('''create table {} (
             model_group_id int,
             model_id int,
             train_end_time timestamp,
@@ -52,35 +77,35 @@ class DistanceFromBestTable(object):
                 row should be a dict with keys:
                         'metric' (e.g. 'precision@')
                         'parameter' (e.g. '100_abs')
-                All models should have the results.evaluations table populated
+                All models should have the evaluations table populated
                 for all given model group ids, train end times, and metric/param combos
         """
         for metric in metrics:
-            self.db_engine.execute('''
+            self.query_executor.execute('''
                 insert into {new_table}
                 WITH first_evals AS (
                     SELECT *, row_number() OVER (
-                        PARTITION BY model_id 
+                        PARTITION BY model_id
                         ORDER BY evaluation_start_time ASC, evaluation_end_time ASC
                         ) AS eval_rn
-                    FROM results.evaluations
+                    FROM {results_schema}.evaluations
                     WHERE metric='{metric}' AND parameter='{parameter}'
                 ),
                 model_ranks AS (
                     SELECT
                         m.model_group_id,
                         m.model_id,
-                        m.train_end_time,
+                        {model_train_end_time} AS train_end_time,
                         ev.value,
                         row_number() OVER (
-                            PARTITION BY m.train_end_time
+                            PARTITION BY {model_train_end_time}
                             ORDER BY ev.value {metric_value_order}, RANDOM()
                         ) AS rank
                   FROM first_evals ev
-                  JOIN results.{models_table} m USING(model_id)
-                  JOIN results.model_groups mg USING(model_group_id)
+                  JOIN {results_schema}.{models_table} m USING(model_id)
+                  JOIN {results_schema}.model_groups mg USING(model_group_id)
                   WHERE m.model_group_id IN ({model_group_ids})
-                        AND train_end_time in ({train_end_times})
+                        AND {model_train_end_time} in ({train_end_times})
                         AND ev.eval_rn = 1
                 ),
                 model_tols AS (
@@ -121,31 +146,70 @@ class DistanceFromBestTable(object):
                 order by train_end_time
             '''.format(
                 model_group_ids=str_in_sql(model_group_ids),
-                train_end_times=str_in_sql(train_end_times),
+                train_end_times=self.backend.times(train_end_times),
+                model_train_end_time=self.backend.time('m.train_end_time'),
                 models_table=self.models_table,
+                results_schema=self.results_schema,
                 metric=metric['metric'],
                 parameter=metric['parameter'],
                 metric_value_order=sql_rank_order(metric['metric']),
                 new_table=self.distance_table
             ))
 
+    SUMMARY_QUANTILES = (0.25, 0.5, 0.75)
+
+    @property
+    def metric_summaries(self):
+        """Summary statistics of the raw values of each metric in the table
+
+        Computed with a single scan when the table is populated (or on first
+        access, for a table populated elsewhere) and reused until it is repopulated.
+
+        Returns: (dict) keyed on (metric, parameter), each value a dict with the keys
+            'count', 'min', 'max' and 'quantiles', the last a dict mapping
+            each of SUMMARY_QUANTILES to the raw value at that quantile
+        """
+        if self._metric_summaries is None:
+            self._metric_summaries = dict(
+                ((metric, parameter), {
+                    'count': count,
+                    'min': minimum,
+                    'max': maximum,
+                    'quantiles': dict(zip(self.SUMMARY_QUANTILES, quantiles or [])),
+                })
+                for metric, parameter, count, minimum, maximum, quantiles
+                in self.backend.metric_summaries(
+                    self.query_executor,
+                    self.distance_table,
+                    self.SUMMARY_QUANTILES
+                )
+            )
+        return self._metric_summaries
+
     @property
     def observed_bounds(self):
-        query = '''
-            SELECT
-                metric,
-                parameter,
-                min(raw_value),
-                max(raw_value)
-            FROM {distance_table} dist
-            GROUP BY metric, parameter
-        '''.format(distance_table=self.distance_table)
+        """The lowest and highest raw value of each metric in the table
+
+        Returns: (dict) keyed on (metric, parameter), with (min, max) values
+        """
         return dict(
-            ((metric, parameter), (minimum, maximum))
-            for metric, parameter, minimum, maximum
-            in self.db_engine.execute(query)
+            (metric, (summary['min'], summary['max']))
+            for metric, summary in self.metric_summaries.items()
         )
 
+    @property
+    def fingerprint(self):
+        """A digest of the table's contents, which changes whenever the table is
+        repopulated with different data
+
+        It is computed from the contents on each access, so that repopulation by
+        any other object or process is seen. Only a pick cache asks for it.
+
+        Returns: (string)
+        """
+        row_count, digest = self.backend.fingerprint(self.query_executor, self.distance_table)
+        return '{}-{}'.format(row_count, digest)
+
     def create_and_populate(
         self,
         model_group_ids,
@@ -163,32 +227,86 @@ class DistanceFromBestTable(object):
                 row should be a dict with keys:
                         'metric' (e.g. 'precision@')
                         'parameter' (e.g. '100_abs')
-                All models should have the results.evaluations table populated
+                All models should have the evaluations table populated
                 for all given model group ids, train end times, and metric/param combos
             delete (boolean, optional) Delete any previous version of the
                 distance table if it exists
         """
-        if delete:
-            self._delete()
-        self._create()
-        self._populate(model_group_ids, train_end_times, metrics)
+        self._metric_summaries = None
+        with stage(
+            self.instrumentation,
+            'population',
+            distance_table=self.distance_table
+        ) as record:
+            if delete:
+                self._delete()
+            self._create()
+            self._populate(model_group_ids, train_end_times, metrics)
+            # summarize while the newly written table is still warm in the cache
+            record['rows'] = sum(summary['count'] for summary in self.metric_summaries.values())
+
+    def _subset_clause(self, model_group_ids, metrics=None, train_end_times=None):
+        """The where clause restricting the table to model groups, metrics and times"""
+        clause = 'model_group_id in ({})'.format(str_in_sql(model_group_ids))
+        if metrics:
+            clause += ' and (metric, parameter) in ({})'.format(
+                ','.join('({})'.format(str_in_sql(metric)) for metric in metrics)
+            )
+        if train_end_times:
+            clause += ' and {} in ({})'.format(
+                self.backend.time('train_end_time'),
+                self.backend.times(train_end_times)
+            )
+        return clause
 
-    def as_dataframe(self, model_group_ids):
+    def as_dataframe(self, model_group_ids, metrics=None, columns=None, train_end_times=None):
         """Return model-group-id subset of table as dataframe
 
         Args:
             model_group_ids (list) the desired model group ids
+            metrics (list, optional) (metric, parameter) tuples to restrict the rows to.
+                Defaults to all metrics in the table
+            columns (list, optional) the columns to fetch. Defaults to all columns
+            train_end_times (list, optional) the train end times to restrict the
+                rows to. Defaults to all train end times
 
         Returns: (pandas.DataFrame) The data from the table corresponding
             to those model group ids
         """
-        return pd.read_sql(
-            'select * from {} where model_group_id in ({})'.format(
+        with stage(
+            self.instrumentation,
+            'as_dataframe',
+            metrics=metrics,
+            columns=columns
+        ) as record:
+            df = self.query_executor.read_sql(
+                'select {} from {} where {}'.format(
+                    ', '.join(columns) if columns else '*',
+                    self.distance_table,
+                    self._subset_clause(model_group_ids, metrics, train_end_times)
+                )
+            )
+            record['rows'] = len(df)
+        return df
+
+    def row_counts(self, model_group_ids, metrics=None):
+        """The number of rows of each train end time in a model-group-id subset
+        of the table, to size it before fetching it
+
+        Args:
+            model_group_ids (list) the desired model group ids
+            metrics (list, optional) (metric, parameter) tuples to restrict the rows to.
+                Defaults to all metrics in the table
+
+        Returns: (dict) row counts keyed by train end time (pandas.Timestamp)
+        """
+        rows = self.query_executor.execute(
+            'select train_end_time, count(*) from {} where {} group by train_end_time'.format(
                 self.distance_table,
-                str_in_sql(model_group_ids)
-            ),
-            self.db_engine
+                self._subset_clause(model_group_ids, metrics)
+            )
         )
+        return dict((pd.Timestamp(train_end_time), count) for train_end_time, count in rows)
 
     def dataframe_as_of(self, model_group_ids, train_end_time):
         """Return model group id/train end time subset of table as dataframe
@@ -205,15 +323,38 @@ class DistanceFromBestTable(object):
 
 
 class BestDistancePlotter(object):
-    def __init__(self, distance_from_best_table):
+    def __init__(
+        self,
+        distance_from_best_table,
+        client_side_ecdf=False,
+        aggregate_above=DEFAULT_AGGREGATE_ABOVE,
+        aggregate_top_k=None
+    ):
         """Generate a plot illustrating the effect of different below-best maximum
         thresholds across the dataset.
 
         Args:
             distance_from_best_table (audition.DistanceFromBestTable)
                 A pre-populated distance-from-best database table
+            client_side_ecdf (boolean, optional) Fetch the distances from best
+                once for all metrics and compute the fraction of time within each
+                distance here, instead of expanding every model group by every
+                distance in the database. Always done on databases that can't,
+                such as SQLite
+            aggregate_above (int, optional) Above this many model groups, plot the median
+                and quantile band of each model type instead of every model group.
+                None to always plot every model group
+            aggregate_top_k (int, optional) When aggregating, also plot this many
+                model groups that are most often close to the best
         """
         self.distance_from_best_table = distance_from_best_table
+        self.client_side_ecdf = client_side_ecdf
+        self.aggregate_above = aggregate_above
+        self.aggregate_top_k = aggregate_top_k
+
+    def _client_side_ecdf(self):
+        # without GENERATE_SERIES, as on SQLite, the plot data is always computed here
+        return self.client_side_ecdf or not self.distance_from_best_table.backend.server_side_ecdf
 
     def plot_bounds(self, metric, parameter):
         observed_min, observed_max = \
@@ -224,6 +365,84 @@ class BestDistancePlotter(object):
         dist = plot_max - plot_min
         return dist/100.0
 
+    def plot_ticks(self, plot_min, plot_max):
+        """The distances to plot, exactly as GENERATE_SERIES produces them
+        from the same bounds
+
+        Returns: (numpy.ndarray)
+        """
+        series_start = Decimal(str(plot_min))
+        series_end = Decimal(str(plot_max))
+        series_tick = Decimal(str(self.plot_tick_dist(plot_min, plot_max)))
+        num_ticks = int((series_end - series_start) / series_tick) + 1
+        return np.array([float(series_start + tick * series_tick) for tick in range(num_ticks)])
+
+    def fetch_distances(self, metrics, model_group_ids, train_end_times):
+        """Fetch the distances from best for a set of metrics in one query
+
+        Arguments:
+            metrics (list) The metrics to fetch. Each element should be
+                a dict with the keys 'metric' and 'parameter'
+            model_group_ids (list) - Model group ids to include in the dataset
+            train_end_times (list) - Train end times to include in the dataset
+
+        Returns: (pandas.DataFrame) with columns 'model_group_id', 'model_type',
+            'metric', 'parameter' and 'dist_from_best_case'
+        """
+        query = """
+            SELECT dist.model_group_id, mg.model_type, dist.metric, dist.parameter,
+                   dist.dist_from_best_case
+            FROM {distance_table} dist
+            JOIN {results_schema}.model_groups mg using (model_group_id)
+            WHERE
+                (dist.metric, dist.parameter) in ({metrics})
+                and model_group_id in ({model_group_str})
+                and {train_end_time} in ({train_end_str})
+        """.format(
+            distance_table=self.distance_from_best_table.distance_table,
+            results_schema=self.distance_from_best_table.results_schema,
+            metrics=','.join(
+                '({})'.format(str_in_sql([metric['metric'], metric['parameter']]))
+                for metric in metrics
+            ),
+            model_group_str=str_in_sql(model_group_ids),
+            train_end_time=self.distance_from_best_table.backend.time('train_end_time'),
+            train_end_str=self.distance_from_best_table.backend.times(train_end_times),
+        )
+        return self.distance_from_best_table.query_executor.read_sql(query)
+
+    def ecdf_plot_data(self, distances, metric, parameter):
+        """Compute the plot data from fetched distances
+
+        Each model group's distances are sorted once, and the fraction within
+        every plotted distance is found with a binary search.
+
+        Arguments:
+            distances (pandas.DataFrame) The result of 'fetch_distances'
+            metric (string) -- model evaluation metric, such as 'precision@'
+            parameter (string) -- model evaluation metric parameter,
+                such as '300_abs'
+
+        Returns: (pandas.DataFrame) The same data as 'generate_plot_data'
+        """
+        of_metric = distances[
+            (distances['metric'] == metric) &
+            (distances['parameter'] == parameter)
+        ]
+        ticks = self.plot_ticks(*self.plot_bounds(metric, parameter))
+        groups = list(of_metric.groupby(['model_group_id', 'model_type'])['dist_from_best_case'])
+        return pd.DataFrame({
+            'model_group_id': np.repeat(
+                [model_group_id for (model_group_id, _), _ in groups],
+                len(ticks)
+            ),
+            'distance': np.tile(ticks, len(groups)),
+            'model_type': np.repeat([model_type for (_, model_type), _ in groups], len(ticks)),
+            'num_models': np.repeat([len(group) for _, group in groups], len(ticks)),
+            'pct_of_time': np.concatenate([ecdf(group, ticks) for _, group in groups])
+            if groups else np.array([], dtype=float),
+        }, columns=['model_group_id', 'distance', 'model_type', 'num_models', 'pct_of_time'])
+
     def generate_plot_data(
         self,
         metric,
@@ -243,6 +462,16 @@ class BestDistancePlotter(object):
         Returns: (pandas.DataFrame) The relevant models and the percentage of time
             each was within various thresholds of the best model at that time
         """
+        if self._client_side_ecdf():
+            return self.ecdf_plot_data(
+                self.fetch_distances(
+                    [{'metric': metric, 'parameter': parameter}],
+                    model_group_ids,
+                    train_end_times
+                ),
+                metric,
+                parameter
+            )
         model_group_union_sql = ' union all '.join([
             '(select {} as model_group_id)'.format(model_group_id)
             for model_group_id in model_group_ids
@@ -254,8 +483,10 @@ class BestDistancePlotter(object):
             'parameter': parameter,
             'model_group_union_sql': model_group_union_sql,
             'distance_table': self.distance_from_best_table.distance_table,
+            'results_schema': self.distance_from_best_table.results_schema,
             'model_group_str': str_in_sql(model_group_ids),
-            'train_end_str': str_in_sql(train_end_times),
+            'train_end_time': self.distance_from_best_table.backend.time('train_end_time'),
+            'train_end_str': self.distance_from_best_table.backend.times(train_end_times),
             'series_start': plot_min,
             'series_end': plot_max,
             'series_tick': plot_tick_dist,
@@ -274,19 +505,20 @@ class BestDistancePlotter(object):
                 )
                 SELECT dist.model_group_id, distance, mg.model_type,
                        COUNT(*) AS num_models,
-                       AVG(CASE WHEN dist_from_best_case <= distance THEN 1 ELSE 0 END) AS pct_of_time
+                       AVG(CASE WHEN dist_from_best_case <= distance THEN 1 ELSE 0 END)
+                           AS pct_of_time
                 FROM {distance_table} dist
                 JOIN x_vals USING(model_group_id)
-                JOIN results.model_groups mg using (model_group_id)
+                JOIN {results_schema}.model_groups mg using (model_group_id)
                 WHERE
                     dist.metric='{metric}'
                     AND dist.parameter='{parameter}'
                     and model_group_id in ({model_group_str})
-                    and train_end_time in ({train_end_str})
+                    and {train_end_time} in ({train_end_str})
                 GROUP BY 1,2,3
             """.format(**sel_params)
 
-        return pd.read_sql(sel, self.distance_from_best_table.db_engine)\
+        return self.distance_from_best_table.query_executor.read_sql(sel)\
             .sort_values(['model_group_id', 'distance'])
 
     def plot_all_best_dist(self, metric_filters, model_group_ids, train_end_times):
@@ -305,22 +537,37 @@ class BestDistancePlotter(object):
             train_end_times (list) - Train end times to include in the plot
 
         """
+        client_side_ecdf = self._client_side_ecdf()
+        if client_side_ecdf:
+            distances = self.fetch_distances(metric_filters, model_group_ids, train_end_times)
         for metric_filter in metric_filters:
-            logging.info('Building best distance plot for %s and %s', metric_filter, train_end_times)
-            df = self.generate_plot_data(
-                metric=metric_filter['metric'],
-                parameter=metric_filter['parameter'],
-                model_group_ids=model_group_ids,
-                train_end_times=train_end_times
+            logging.info(
+                'Building best distance plot for %s and %s',
+                metric_filter,
+                train_end_times
             )
+            if client_side_ecdf:
+                df = self.ecdf_plot_data(
+                    distances,
+                    metric_filter['metric'],
+                    metric_filter['parameter']
+                )
+            else:
+                df = self.generate_plot_data(
+                    metric=metric_filter['metric'],
+                    parameter=metric_filter['parameter'],
+                    model_group_ids=model_group_ids,
+                    train_end_times=train_end_times
+                )
             plot_best_dist(
                 metric=metric_filter['metric'],
                 parameter=metric_filter['parameter'],
-                df_best_dist=df
+                df_best_dist=df,
+                aggregate_above=self.aggregate_above,
+                top_k=self.aggregate_top_k
             )
 
 
-
 def plot_best_dist(metric, parameter, df_best_dist, **plt_format_args):
     """Generates a plot of the percentage of time that a model group is
     within X percentage points of the best-performing model group using a
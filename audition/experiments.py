@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import json
+import logging
+import re
+import time
+
+from smart_open import smart_open
+from sqlalchemy import create_engine
+
+from audition.cli import run
+
+
+def _slug(value):
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(value)).strip('_').lower()
+
+
+def experiment_configs(configs):
+    """Name each experiment and give each its own distance table
+
+    Args:
+        configs (list) audition configs, see audition.cli.load_config, each
+            optionally with a 'name'. Defaults to the results schema, if given
+
+    Returns: (list) of (name, config) pairs, with a distance_table in each config
+        ('best_distance_<name>' unless given) and its rule_workers (1 unless
+        given, as the experiments already run concurrently)
+    """
+    named = []
+    for position, config in enumerate(configs):
+        name = config.get('name') or config.get('results_schema') \
+            or 'experiment_{}'.format(position)
+        named.append((name, dict(
+            config,
+            distance_table=config.get('distance_table') or 'best_distance_{}'.format(_slug(name)),
+            rule_workers=config.get('rule_workers') or 1
+        )))
+    duplicate_names = [
+        name for name, count in Counter(name for name, _ in named).items()
+        if count > 1
+    ]
+    if duplicate_names:
+        raise ValueError(
+            'Experiment names must be unique, found {} more than once'.format(duplicate_names)
+        )
+    tables = Counter((config['db_url'], config['distance_table']) for _, config in named)
+    shared_tables = [table for (_, table), count in tables.items() if count > 1]
+    if shared_tables:
+        raise ValueError(
+            'Experiments on the same database need their own distance tables, {} is shared'
+            .format(shared_tables)
+        )
+    return named
+
+
+def _engines(configs, max_workers):
+    """One engine per database, pooling a connection per thread that can query
+    it at once: each worker's selection rule threads"""
+    rule_workers = dict()
+    for _, config in configs:
+        url = config['db_url']
+        rule_workers[url] = max(rule_workers.get(url, 1), config['rule_workers'])
+    engines = dict()
+    for url, workers in rule_workers.items():
+        try:
+            engines[url] = create_engine(url, pool_size=max_workers * workers, max_overflow=0)
+        except TypeError:
+            # the dialect's default pool isn't sized, as for sqlite
+            engines[url] = create_engine(url)
+    return engines
+
+
+def audition_experiments(configs, max_workers=None, report_path=None):
+    """Audition several experiments concurrently, each end to end as in audition.cli.run,
+    and combine their results
+
+    Experiments can be in different databases or in different results schemas of
+    the same database. Those on the same database share one engine, whose
+    connections are pooled between the workers and their selection rule threads
+    (one per experiment, unless a config gives rule_workers). A failing experiment
+    is reported without stopping the others.
+
+    Args:
+        configs (list) audition configs, see audition.cli.load_config and experiment_configs
+        max_workers (int, optional) How many experiments to audition at once.
+            Defaults to all of them
+        report_path (string, optional) The smart_open-ready path to write the
+            combined report to, as JSON
+
+    Returns: (dict) the combined report, with the keys:
+        'experiments' (dict) the results of each succeeding experiment, by name
+        'failed' (dict) the error of each failing experiment, by name
+        'seconds' (float) the wall time of the whole run
+    """
+    named_configs = experiment_configs(configs)
+    max_workers = max_workers or len(named_configs)
+    engines = _engines(named_configs, max_workers)
+    start = time.time()
+    report = {'experiments': dict(), 'failed': dict(), 'seconds': None}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (name, executor.submit(run, config, db_engine=engines[config['db_url']]))
+            for name, config in named_configs
+        ]
+        for name, future in futures:
+            try:
+                report['experiments'][name] = future.result()
+            except Exception as error:
+                logging.exception('Auditioning experiment %s failed', name)
+                report['failed'][name] = repr(error)
+    report['seconds'] = time.time() - start
+    logging.info(
+        'Auditioned %s experiments in %.3f seconds, %s failed',
+        len(named_configs),
+        report['seconds'],
+        len(report['failed'])
+    )
+    if report_path:
+        with smart_open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,350 @@
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from audition.utils import tie_breaking
+
+
+class HistoryView(object):
+    """Past-only views of a distance table dataframe, without copying
+
+    The dataframe is projected once to hide the columns that look into the future,
+    and sorted by train end time so that the rows available as of any train end time
+    are a prefix of it. A view is then a positional slice, which shares memory with
+    the sorted dataframe; callers that modify their input need to copy it.
+
+    Args:
+        df (pandas.DataFrame) rows of the distance table
+        presorted (boolean, optional) Whether the dataframe is already projected
+            and sorted, as when loaded from a snapshot
+    """
+    FUTURE_COLUMNS = ['dist_from_best_case_next_time', 'raw_value_next_time']
+
+    def __init__(self, df, presorted=False):
+        if not presorted:
+            df = df.drop([column for column in self.FUTURE_COLUMNS if column in df.columns], axis=1)
+            df = df.sort_values('train_end_time', kind='mergesort').reset_index(drop=True)
+        self.dataframe = df
+        self._train_end_times = pandas.to_datetime(self.dataframe['train_end_time']).values
+        self._nbytes = None
+
+    @property
+    def nbytes(self):
+        """The memory held by the view's dataframe, in bytes"""
+        if self._nbytes is None:
+            self._nbytes = int(self.dataframe.memory_usage(deep=True).sum()) \
+                + self._train_end_times.nbytes
+        return self._nbytes
+
+    def estimated_nbytes(self, rows):
+        """The memory the view would hold with the given number of rows like its own
+
+        Args:
+            rows (int) The number of rows
+
+        Returns: (float) the estimated size in bytes
+        """
+        index_bytes = self.dataframe.index.memory_usage()
+        return index_bytes + (self.nbytes - index_bytes) * rows / max(len(self.dataframe), 1)
+
+    def offset(self, train_end_time):
+        """The number of rows at or before the given train end time"""
+        return numpy.searchsorted(
+            self._train_end_times,
+            pandas.Timestamp(train_end_time).to_datetime64(),
+            side='right'
+        )
+
+    def as_of(self, train_end_time):
+        """The rows at or before the given train end time
+
+        Args:
+            train_end_time (timestamp) The latest train end time to include
+
+        Returns: (pandas.DataFrame) a positional slice of the sorted dataframe
+        """
+        return self.dataframe.iloc[:self.offset(train_end_time)]
+
+    def time_slices(self, last_time):
+        """The rows of each train end time up to the given one, in order
+
+        Args:
+            last_time (pandas.Timestamp) The latest train end time to include
+
+        Returns: (generator) of (pandas.Timestamp, pandas.DataFrame) pairs
+        """
+        for train_end_time, time_slice in self.dataframe.groupby('train_end_time'):
+            train_end_time = pandas.Timestamp(train_end_time)
+            if train_end_time > last_time:
+                break
+            yield train_end_time, time_slice
+
+    def save(self, directory):
+        """Write the view to a directory as one .npy file per column, which
+        worker processes read once instead of receiving the data per task
+
+        Text columns are stored as integer codes plus their distinct values,
+        missing values having the code -1.
+
+        Args:
+            directory (string) An existing, empty directory
+        """
+        columns = []
+        for position, column in enumerate(self.dataframe.columns):
+            values = self.dataframe[column].values
+            uniques = None
+            if values.dtype == object:
+                values, uniques = pandas.factorize(values)
+                uniques = list(uniques)
+            numpy.save(os.path.join(directory, '{}.npy'.format(position)), values)
+            columns.append((column, uniques))
+        with open(os.path.join(directory, 'columns.pkl'), 'wb') as f:
+            pickle.dump(columns, f)
+
+    @classmethod
+    def load(cls, directory):
+        """Load a view written by 'save'
+
+        The columns are memory-mapped while reading, but building the dataframe
+        copies them into this process's memory, so a loaded view holds as much
+        as the view that was saved.
+
+        Args:
+            directory (string) The directory given to 'save'
+
+        Returns: (HistoryView)
+        """
+        with open(os.path.join(directory, 'columns.pkl'), 'rb') as f:
+            columns = pickle.load(f)
+        data = dict()
+        for position, (column, uniques) in enumerate(columns):
+            values = numpy.load(os.path.join(directory, '{}.npy'.format(position)), mmap_mode='r')
+            if uniques is not None:
+                # append a missing value for the code -1, which would otherwise
+                # index the last of the distinct values
+                values = numpy.array(uniques + [numpy.nan], dtype=object)[values]
+            data[column] = values
+        return cls(
+            pandas.DataFrame(data, columns=[column for column, _ in columns]),
+            presorted=True
+        )
+
+
+class SlicedHistory(object):
+    """A history fetched one train end time at a time, for histories too big to
+    hold at once
+
+    Only selection rules with an incremental implementation can read it, folding
+    each train end time's rows into their state as they are fetched.
+
+    Args:
+        fetch (function) Fetches the rows of one train end time as a dataframe
+        train_end_times (list) The train end times that have rows
+    """
+    def __init__(self, fetch, train_end_times):
+        self.fetch = fetch
+        self.train_end_times = sorted(
+            pandas.Timestamp(train_end_time) for train_end_time in train_end_times
+        )
+
+    def time_slices(self, last_time):
+        """Fetch the rows of each train end time up to the given one, in order
+
+        Args:
+            last_time (pandas.Timestamp) The latest train end time to include
+
+        Returns: (generator) of (pandas.Timestamp, pandas.DataFrame) pairs
+        """
+        for train_end_time in self.train_end_times:
+            if train_end_time > last_time:
+                break
+            yield train_end_time, HistoryView(self.fetch(train_end_time)).dataframe
+
+
+def seed_for(seed, bound_selection_rule, train_end_time):
+    """A random number generator to break ties with, so that a pick is
+    reproducible no matter which process makes it or in which order
+
+    Args:
+        seed (int or None) The base seed
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+        train_end_time (timestamp) The train end time being picked for
+
+    Returns: (numpy.random.RandomState) seeded for the rule and time,
+        or None if no base seed is given
+    """
+    if seed is None:
+        return None
+    key = '{}|{}'.format(
+        bound_selection_rule.descriptive_name,
+        pandas.Timestamp(train_end_time).isoformat()
+    )
+    return numpy.random.RandomState((zlib.crc32(key.encode('utf-8')) ^ seed) & 0xffffffff)
+
+
+def pick_as_of(history_view, bound_selection_rule, train_end_time, seed=None):
+    """Run a selection rule on the history up to a train end time
+
+    Args:
+        history_view (HistoryView) The rows the rule reads
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+        train_end_time (timestamp) Current train end time
+        seed (int, optional) Base seed for breaking ties
+
+    Returns: (int) The model group id chosen by the rule
+    """
+    localized_df = history_view.as_of(train_end_time)
+    if bound_selection_rule.requirements.mutates_input:
+        localized_df = localized_df.copy()
+    with tie_breaking(seed_for(seed, bound_selection_rule, train_end_time)):
+        return bound_selection_rule.pick(localized_df, train_end_time)
+
+
+def _incremental_states(history_view, bound_selection_rule, train_end_times):
+    """Fold each train end time's rows into the rule's incremental state once,
+    yielding the state as of each of the given train end times, in order"""
+    requested_times = sorted(set(
+        pandas.Timestamp(train_end_time) for train_end_time in train_end_times
+    ))
+    position = 0
+    state = bound_selection_rule.initial_state()
+    for train_end_time, time_slice in history_view.time_slices(requested_times[-1]):
+        while position < len(requested_times) and requested_times[position] < train_end_time:
+            yield requested_times[position], state
+            position += 1
+        bound_selection_rule.update_state(state, time_slice, train_end_time)
+    for requested_time in requested_times[position:]:
+        yield requested_time, state
+
+
+def incremental_picks(history_view, bound_selection_rule, train_end_times, seed=None, scores=None):
+    """Pick a model group for each train end time with the rule's incremental
+    implementation, folding in each train end time's rows once
+
+    Args:
+        history_view (HistoryView or SlicedHistory) The rows the rule reads
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+            A selection rule with an incremental implementation
+        train_end_times (list) The train end times to pick for
+        seed (int, optional) Base seed for breaking ties
+        scores (dict, optional) If given, filled with the score of every
+            model group each pick was made from, keyed by train end time
+
+    Returns: (list) The model group id chosen for each of the train end times
+    """
+    picks = dict()
+    states = _incremental_states(history_view, bound_selection_rule, train_end_times)
+    for train_end_time, state in states:
+        if scores is not None:
+            scores[train_end_time] = bound_selection_rule.scores_from_state(state)
+        with tie_breaking(seed_for(seed, bound_selection_rule, train_end_time)):
+            picks[train_end_time] = bound_selection_rule.pick_from_state(state, train_end_time)
+    return [picks[pandas.Timestamp(train_end_time)] for train_end_time in train_end_times]
+
+
+def incremental_scores(history_view, bound_selection_rule, train_end_times):
+    """Score the model groups in a history as of each train end time, without picking
+
+    Args:
+        history_view (HistoryView or SlicedHistory) The rows the rule reads
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+            A selection rule with an incremental implementation
+        train_end_times (list) The train end times to score as of
+
+    Returns: (dict) the scores (pandas.Series indexed by model group id) as of
+        each train end time
+    """
+    states = _incremental_states(history_view, bound_selection_rule, train_end_times)
+    return dict(
+        (train_end_time, bound_selection_rule.scores_from_state(state))
+        for train_end_time, state in states
+    )
+
+
+def picks_from_history(history_view, bound_selection_rule, train_end_times, seed=None):
+    """Pick a model group for each of the given train end times
+
+    Args:
+        history_view (HistoryView or SlicedHistory) The rows the rule reads;
+            only rules with an incremental implementation can read a SlicedHistory
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+        train_end_times (list) The train end times to pick for
+        seed (int, optional) Base seed for breaking ties
+
+    Returns: (list) The model group id chosen for each of the train end times
+    """
+    if bound_selection_rule.is_incremental:
+        return incremental_picks(history_view, bound_selection_rule, train_end_times, seed)
+    return [
+        pick_as_of(history_view, bound_selection_rule, train_end_time, seed)
+        for train_end_time in train_end_times
+    ]
+
+
+# the snapshots loaded in this process, least recently used first, so that a
+# worker only reads each history's files once however its tasks are interleaved
+_loaded_snapshots = OrderedDict()
+_loaded_snapshots_lock = threading.Lock()
+
+
+def _loaded_snapshot(directory, memory_budget_mb=None):
+    """Load a snapshot, or reuse it if this process has already loaded it
+
+    Snapshots whose directory has been removed, as at the end of the batch that
+    wrote them, are forgotten, and beyond the memory budget the least recently
+    used others are too.
+
+    Args:
+        directory (string) A directory written by HistoryView.save
+        memory_budget_mb (float, optional) The most memory to keep loaded snapshots in
+
+    Returns: (HistoryView)
+    """
+    with _loaded_snapshots_lock:
+        if directory in _loaded_snapshots:
+            _loaded_snapshots.move_to_end(directory)
+        else:
+            _loaded_snapshots[directory] = HistoryView.load(directory)
+        for loaded_directory in list(_loaded_snapshots):
+            if loaded_directory != directory and not os.path.isdir(loaded_directory):
+                del _loaded_snapshots[loaded_directory]
+        if memory_budget_mb is not None:
+            total = sum(view.nbytes for view in _loaded_snapshots.values())
+            for loaded_directory in list(_loaded_snapshots):
+                if total <= memory_budget_mb * 1024 * 1024:
+                    break
+                if loaded_directory != directory:
+                    total -= _loaded_snapshots.pop(loaded_directory).nbytes
+        return _loaded_snapshots[directory]
+
+
+def picks_from_snapshot(
+    directory,
+    bound_selection_rule,
+    train_end_times,
+    seed=None,
+    memory_budget_mb=None
+):
+    """Pick model groups from a history snapshot; the entry point for worker processes
+
+    Args:
+        directory (string) A directory written by HistoryView.save
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+        train_end_times (list) The train end times to pick for
+        seed (int, optional) Base seed for breaking ties
+        memory_budget_mb (float, optional) The most memory the worker keeps
+            loaded snapshots in
+
+    Returns: (list) The model group id chosen for each of the train end times
+    """
+    return picks_from_history(
+        _loaded_snapshot(directory, memory_budget_mb),
+        bound_selection_rule,
+        train_end_times,
+        seed
+    )
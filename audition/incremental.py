@@ -0,0 +1,577 @@
+import logging
+import pickle
+
+import numpy
+import pandas
+from smart_open import smart_open
+
+from audition.history import HistoryView
+from audition.metric_directionality import best_in_series, greater_is_better
+from audition.utils import random_state
+
+
+def _of_metric(df, metric, parameter):
+    return df.loc[
+        (df['metric'] == metric) &
+        (df['parameter'] == parameter)
+    ]
+
+
+def _add(running, batch):
+    """Add a per-model-group batch aggregate to a running one
+
+    Args:
+        running (pandas.Series) running aggregate, indexed by model group id
+        batch (pandas.Series) aggregate of a single time slice, indexed by model group id
+
+    Returns: (pandas.Series) the combined aggregate
+    """
+    return running.add(batch, fill_value=0)
+
+
+def _combine_moments(moments, values_by_group):
+    """Fold a batch of values into running (count, mean, M2) moments per model group
+
+    Uses the parallel form of Welford's algorithm, so a time slice with
+    several rows per model group is folded in at once.
+
+    Args:
+        moments (pandas.DataFrame) indexed by model group id, columns 'count', 'mean', 'm2'
+        values_by_group (pandas.core.groupby.SeriesGroupBy) the raw values of the
+            time slice, grouped by model group id
+
+    Returns: (pandas.DataFrame) the updated moments
+    """
+    batch = pandas.DataFrame({
+        'count': values_by_group.count().astype('float'),
+        'mean': values_by_group.mean(),
+        'm2': values_by_group.var(ddof=0) * values_by_group.count(),
+    })
+    index = moments.index.union(batch.index)
+    moments = moments.reindex(index).fillna(0.0)
+    batch = batch.reindex(index).fillna(0.0)
+
+    count = moments['count'] + batch['count']
+    delta = batch['mean'] - moments['mean']
+    return pandas.DataFrame({
+        'count': count,
+        'mean': moments['mean'] + delta * batch['count'] / count,
+        'm2': moments['m2'] + batch['m2'] + delta ** 2 * moments['count'] * batch['count'] / count,
+    })
+
+
+def _stdev(moments):
+    """Sample standard deviation from running moments, null for single observations"""
+    return numpy.sqrt(
+        moments['m2'] / (moments['count'] - 1).where(moments['count'] > 1)
+    )
+
+
+def _empty_moments():
+    return pandas.DataFrame(
+        {'count': [], 'mean': [], 'm2': []},
+        index=pandas.Index([], name='model_group_id')
+    )
+
+
+class IncrementalSelectionRule(object):
+    """A selection rule that keeps running aggregates instead of
+    recomputing from the full history every time
+
+    The state is a plain dictionary of picklable values, created by
+    'initial_state', advanced one train end time at a time by 'update',
+    and turned into a model group id by 'pick'. Subclasses take the same
+    keyword arguments as the matching function in audition.selection_rules
+    (minus 'df' and 'train_end_time') and should pick the same model groups.
+
+    Subclasses whose score for a model group depends only on that group's own
+    rows set 'independent_scores', which lets the SelectionRulePicker reuse earlier
+    scores when the candidate model groups change.
+    """
+    independent_scores = False
+
+    def initial_state(self):
+        """Create a state representing no history
+
+        Returns: (dict) An empty state
+        """
+        return {'train_end_time': None, 'model_group_ids': set()}
+
+    def update(self, state, df, train_end_time):
+        """Fold the rows of one train end time into the state
+
+        Args:
+            state (dict) A state created by 'initial_state'
+            df (pandas.DataFrame) rows of the distance table for a single train
+                end time, without the 'next time' columns
+            train_end_time (timestamp) The train end time of the given rows.
+                Must be later than any previously given train end time
+
+        Returns: (dict) the updated state
+        """
+        train_end_time = pandas.Timestamp(train_end_time)
+        if state['train_end_time'] is not None and train_end_time <= state['train_end_time']:
+            raise ValueError(
+                'Train end times must be added in order: {} is not after {}'
+                .format(train_end_time, state['train_end_time'])
+            )
+        state['model_group_ids'] |= set(df['model_group_id'])
+        self._update(state, df, train_end_time)
+        state['train_end_time'] = train_end_time
+        return state
+
+    def _update(self, state, df, train_end_time):
+        raise NotImplementedError
+
+    def scores(self, state):
+        """Score each model group seen so far
+
+        Returns: (pandas.Series) scores indexed by model group id, the best
+            of which (according to 'greater_is_better') is picked
+        """
+        raise NotImplementedError
+
+    def greater_is_better(self):
+        return greater_is_better(self.metric)
+
+    def pick(self, state, train_end_time):
+        """Pick a model group from the state
+
+        Args:
+            state (dict) A state that has been updated through train_end_time
+            train_end_time (timestamp) current train end time
+
+        Returns: (int) the model group id to select
+        """
+        # sample(frac=1) to shuffle rows so we don't accidentally introduce bias in breaking ties
+        return getattr(
+            self.scores(state).sample(frac=1, random_state=random_state()),
+            'idxmax' if self.greater_is_better() else 'idxmin'
+        )()
+
+
+class IncrementalRandomModelGroup(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.random_model_group"""
+    def _update(self, state, df, train_end_time):
+        pass
+
+    def pick(self, state, train_end_time):
+        return pandas.Series(sorted(state['model_group_ids']))\
+            .sample(frac=1, random_state=random_state())\
+            .tolist()[0]
+
+
+class IncrementalBestCurrentValue(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.best_current_value
+
+    Only the most recent values are kept: the best of each model group's
+    models, as a model group can have several models at a train end time.
+    """
+    independent_scores = True
+
+    def __init__(self, metric, parameter):
+        self.metric = metric
+        self.parameter = parameter
+
+    def initial_state(self):
+        state = super(IncrementalBestCurrentValue, self).initial_state()
+        state['current'] = pandas.Series([], dtype='float')
+        return state
+
+    def _update(self, state, df, train_end_time):
+        state['current'] = _of_metric(df, self.metric, self.parameter)\
+            .groupby('model_group_id')['raw_value']\
+            .agg(best_in_series(self.metric))
+
+    def scores(self, state):
+        return state['current']
+
+
+class IncrementalBestAverageValue(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.best_average_value
+
+    Keeps a running sum and count of values per model group.
+    """
+    independent_scores = True
+
+    def __init__(self, metric, parameter):
+        self.metric = metric
+        self.parameter = parameter
+
+    def initial_state(self):
+        state = super(IncrementalBestAverageValue, self).initial_state()
+        state['sums'] = pandas.Series([], dtype='float')
+        state['counts'] = pandas.Series([], dtype='float')
+        return state
+
+    def _update(self, state, df, train_end_time):
+        grouped = _of_metric(df, self.metric, self.parameter).groupby('model_group_id')['raw_value']
+        state['sums'] = _add(state['sums'], grouped.sum())
+        state['counts'] = _add(state['counts'], grouped.count())
+
+    def scores(self, state):
+        return state['sums'] / state['counts']
+
+
+class IncrementalLowestMetricVariance(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.lowest_metric_variance
+
+    Keeps running moments per model group using Welford's algorithm.
+    """
+    independent_scores = True
+
+    def __init__(self, metric, parameter):
+        self.metric = metric
+        self.parameter = parameter
+
+    def initial_state(self):
+        state = super(IncrementalLowestMetricVariance, self).initial_state()
+        state['moments'] = _empty_moments()
+        return state
+
+    def _update(self, state, df, train_end_time):
+        state['moments'] = _combine_moments(
+            state['moments'],
+            _of_metric(df, self.metric, self.parameter).groupby('model_group_id')['raw_value']
+        )
+
+    def scores(self, state):
+        return _stdev(state['moments'])
+
+    def greater_is_better(self):
+        return False
+
+    def pick(self, state, train_end_time):
+        stdevs = self.scores(state)
+        if stdevs.isnull().sum() == stdevs.shape[0]:
+            # variance will be undefined in first time window since we only have one obseravtion
+            # per model group
+            logging.info("Null metric variances for {} {} at {}; picking at random"
+                         .format(self.metric, self.parameter, train_end_time))
+            return IncrementalRandomModelGroup().pick(state, train_end_time)
+        elif stdevs.isnull().sum() > 0:
+            raise ValueError(
+                "Mix of null and non-null metric variances for or {} {} at {}"
+                .format(self.metric, self.parameter, train_end_time)
+            )
+        return super(IncrementalLowestMetricVariance, self).pick(state, train_end_time)
+
+
+class IncrementalMostFrequentBestDist(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.most_frequent_best_dist
+
+    Keeps a running count of times within the distance, and of times seen,
+    per model group.
+    """
+    independent_scores = True
+
+    def __init__(self, metric, parameter, dist_from_best_case):
+        self.metric = metric
+        self.parameter = parameter
+        self.dist_from_best_case = dist_from_best_case
+
+    def initial_state(self):
+        state = super(IncrementalMostFrequentBestDist, self).initial_state()
+        state['within'] = pandas.Series([], dtype='float')
+        state['counts'] = pandas.Series([], dtype='float')
+        return state
+
+    def _update(self, state, df, train_end_time):
+        met_df = _of_metric(df, self.metric, self.parameter)
+        within_dist = (met_df['dist_from_best_case'] <= self.dist_from_best_case)\
+            .astype('int')\
+            .groupby(met_df['model_group_id'])
+        state['within'] = _add(state['within'], within_dist.sum())
+        state['counts'] = _add(state['counts'], within_dist.count())
+
+    def scores(self, state):
+        return state['within'] / state['counts']
+
+    def greater_is_better(self):
+        return True
+
+
+class IncrementalBestAverageTwoMetrics(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.best_average_two_metrics
+
+    Keeps a running sum of the weighted combination per train end time,
+    and the number of train end times, per model group.
+    """
+    independent_scores = True
+
+    def __init__(self, metric1, parameter1, metric2, parameter2, metric1_weight=0.5):
+        if metric1_weight < 0 or metric1_weight > 1:
+            raise ValueError("Metric weight must be between 0 and 1")
+        if greater_is_better(metric1) != greater_is_better(metric2):
+            raise ValueError("Metric directionalities must be the same")
+        self.metric = metric1
+        self.parameter1 = parameter1
+        self.metric2 = metric2
+        self.parameter2 = parameter2
+        self.metric1_weight = metric1_weight
+
+    def initial_state(self):
+        state = super(IncrementalBestAverageTwoMetrics, self).initial_state()
+        state['sums'] = pandas.Series([], dtype='float')
+        state['counts'] = pandas.Series([], dtype='float')
+        return state
+
+    def _update(self, state, df, train_end_time):
+        metric1_df = _of_metric(df, self.metric, self.parameter1)
+        metric2_df = _of_metric(df, self.metric2, self.parameter2)
+        weighted = pandas.concat([
+            metric1_df['raw_value'] * self.metric1_weight,
+            metric2_df['raw_value'] * (1.0 - self.metric1_weight),
+        ])
+        model_group_ids = pandas.concat([
+            metric1_df['model_group_id'],
+            metric2_df['model_group_id'],
+        ])
+        weighted_by_group = weighted.groupby(model_group_ids).sum()
+        state['sums'] = _add(state['sums'], weighted_by_group)
+        state['counts'] = _add(state['counts'], pandas.Series(1.0, index=weighted_by_group.index))
+
+    def scores(self, state):
+        return state['sums'] / state['counts']
+
+
+class IncrementalBestAvgVarPenalized(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.best_avg_var_penalized
+
+    Keeps running moments per model group using Welford's algorithm.
+    """
+    def __init__(self, metric, parameter, stdev_penalty):
+        self.metric = metric
+        self.parameter = parameter
+        # for metrics where smaller values are better, the penalty for instability should
+        # add to the mean, so introduce a factor of -1
+        self.stdev_penalty = stdev_penalty if greater_is_better(metric) else -1.0*stdev_penalty
+
+    def initial_state(self):
+        state = super(IncrementalBestAvgVarPenalized, self).initial_state()
+        state['moments'] = _empty_moments()
+        return state
+
+    def _update(self, state, df, train_end_time):
+        state['moments'] = _combine_moments(
+            state['moments'],
+            _of_metric(df, self.metric, self.parameter).groupby('model_group_id')['raw_value']
+        )
+
+    def scores(self, state):
+        averages = state['moments']['mean']
+        stdevs = _stdev(state['moments'])
+        if stdevs.isnull().sum() == stdevs.shape[0]:
+            # variance will be undefined in first time window since we only have one obseravtion
+            # per model group, so just use the mean
+            return averages
+        elif stdevs.isnull().sum() > 0:
+            raise ValueError(
+                "Mix of null and non-null metric variances for or {} {} at {}"
+                .format(self.metric, self.parameter, state['train_end_time'])
+            )
+        return averages - self.stdev_penalty * (stdevs - stdevs.min())
+
+
+class IncrementalBestAvgRecencyWeight(IncrementalSelectionRule):
+    """Incremental version of audition.selection_rules.best_avg_recency_weight
+
+    The weights depend on the span between the first and the current train end time,
+    which grows with every update. For linear decay the weighted average can be
+    recovered from running sums of values and day-weighted values. Exponential
+    decay does not factor that way, so it keeps one column of values per train end
+    time and reweights them (vectorized over model groups) when picking.
+    """
+    def __init__(self, metric, parameter, curr_weight, decay_type):
+        if decay_type not in ('linear', 'exponential'):
+            raise ValueError('Must specify linear or exponential decay type')
+        self.metric = metric
+        self.parameter = parameter
+        self.curr_weight = curr_weight
+        self.decay_type = decay_type
+
+    def initial_state(self):
+        state = super(IncrementalBestAvgRecencyWeight, self).initial_state()
+        state['first_train_end_time'] = None
+        state['days_out'] = []
+        if self.decay_type == 'linear':
+            state['sums'] = pandas.DataFrame({'n': [], 'days': [], 'values': [], 'day_values': []})
+        else:
+            state['sums'] = pandas.DataFrame([])
+            state['counts'] = pandas.DataFrame([])
+        return state
+
+    def _update(self, state, df, train_end_time):
+        if state['first_train_end_time'] is None:
+            state['first_train_end_time'] = train_end_time
+        days_out = float((train_end_time - state['first_train_end_time']).days)
+        state['days_out'].append(days_out)
+
+        values = _of_metric(df, self.metric, self.parameter).groupby('model_group_id')['raw_value']
+        if self.decay_type == 'linear':
+            count = values.count().astype('float')
+            batch = pandas.DataFrame({
+                'n': count,
+                'days': count * days_out,
+                'values': values.sum(),
+                'day_values': values.sum() * days_out,
+            })
+            state['sums'] = state['sums'].add(batch, fill_value=0)
+        else:
+            position = len(state['days_out']) - 1
+            state['sums'] = pandas.concat([state['sums'], values.sum().rename(position)], axis=1)
+            state['counts'] = pandas.concat(
+                [state['counts'], values.count().rename(position)],
+                axis=1
+            )
+
+    def scores(self, state):
+        tmax = state['days_out'][-1]
+        if self.decay_type == 'linear':
+            sums = state['sums']
+            if tmax == 0:
+                # only one date (must be on first time point), so everything gets a weight of 1
+                return sums['values'] / sums['n']
+            # weight = (curr_weight - 1.0) * (t/tmax) + 1.0
+            slope = (self.curr_weight - 1.0) / tmax
+            return (slope * sums['day_values'] + sums['values']) \
+                / (slope * sums['days'] + sums['n'])
+
+        if tmax == 0:
+            weights = numpy.ones(len(state['days_out']))
+        else:
+            # weight = exp(ln(curr_weight)*t/tmax)
+            weights = numpy.exp(numpy.log(self.curr_weight) * numpy.array(state['days_out']) / tmax)
+        return pandas.Series(
+            numpy.nansum(state['sums'].values * weights, axis=1) /
+            numpy.nansum(state['counts'].values * weights, axis=1),
+            index=state['sums'].index
+        )
+
+
+class IncrementalSelectionRulePicker(object):
+    def __init__(self, bound_selection_rules):
+        """Keeps selection rule state between train end times, so that each
+        new train end time only requires folding in its own rows
+
+        Rules with an incremental implementation keep running aggregates;
+        any others are run on an accumulated history of the rows seen so far.
+
+        Args:
+            bound_selection_rules (list of audition.selection_rules.BoundSelectionRule)
+                The selection rules to maintain picks for
+        """
+        self.bound_selection_rules = bound_selection_rules
+        self.train_end_time = None
+        self.states = dict(
+            (rule.descriptive_name, rule.initial_state())
+            for rule in bound_selection_rules
+            if rule.is_incremental
+        )
+        self.history = None
+
+    def update(self, df, train_end_time):
+        """Add the rows for a new train end time to every rule's state
+
+        Args:
+            df (pandas.DataFrame) rows of the distance table; only those for
+                the given train end time are used
+            train_end_time (timestamp) The new train end time
+        """
+        train_end_time = pandas.Timestamp(train_end_time)
+        time_slice = df[df['train_end_time'] == train_end_time]
+        time_slice = time_slice.drop(
+            [column for column in HistoryView.FUTURE_COLUMNS if column in time_slice.columns],
+            axis=1
+        )
+
+        for rule in self.bound_selection_rules:
+            if rule.is_incremental:
+                rule.update_state(self.states[rule.descriptive_name], time_slice, train_end_time)
+        if any(not rule.is_incremental for rule in self.bound_selection_rules):
+            self.history = pandas.concat([self.history, time_slice], ignore_index=True)
+        self.train_end_time = train_end_time
+
+    def update_from_table(self, distance_from_best_table, model_group_ids, train_end_time):
+        """Add a new train end time, read from a populated distance table
+
+        Args:
+            distance_from_best_table (audition.DistanceFromBestTable)
+            model_group_ids (list) The model group ids to consider
+            train_end_time (timestamp) The new train end time
+        """
+        self.update(
+            distance_from_best_table.dataframe_as_of(model_group_ids, train_end_time),
+            train_end_time
+        )
+
+    @property
+    def model_group_ids(self):
+        """The current pick of each selection rule
+
+        Returns: (dict) keys are selection rule descriptive names, values are the model group id
+            chosen by them
+        """
+        if self.train_end_time is None:
+            raise ValueError('No train end times have been added yet')
+        picks = dict()
+        for rule in self.bound_selection_rules:
+            if rule.is_incremental:
+                picks[rule.descriptive_name] = rule.pick_from_state(
+                    self.states[rule.descriptive_name],
+                    self.train_end_time
+                )
+            else:
+                picks[rule.descriptive_name] = rule.pick(self.history.copy(), self.train_end_time)
+        return picks
+
+    def save(self, path):
+        """Persist the rule states, so a later run can continue from them
+
+        Args:
+            path (string) The smart_open-ready path to write to
+        """
+        with smart_open(path, 'wb') as f:
+            pickle.dump({
+                'train_end_time': self.train_end_time,
+                'history': self.history,
+                'states': dict(
+                    (rule.descriptive_name, {
+                        'args': rule.args,
+                        'state': self.states[rule.descriptive_name],
+                    })
+                    for rule in self.bound_selection_rules
+                    if rule.is_incremental
+                ),
+            }, f)
+
+    @classmethod
+    def load(cls, path, bound_selection_rules):
+        """Restore a picker saved with 'save'
+
+        Args:
+            path (string) The smart_open-ready path to read from
+            bound_selection_rules (list of audition.selection_rules.BoundSelectionRule)
+                The selection rules to maintain picks for. Each must have been
+                part of the saved picker with the same arguments
+
+        Returns: (IncrementalSelectionRulePicker)
+        """
+        with smart_open(path, 'rb') as f:
+            saved = pickle.load(f)
+        picker = cls(bound_selection_rules)
+        for rule in bound_selection_rules:
+            if not rule.is_incremental:
+                continue
+            saved_rule = saved['states'].get(rule.descriptive_name)
+            if saved_rule is None or saved_rule['args'] != rule.args:
+                raise ValueError(
+                    'No saved state matches selection rule {}'.format(rule.descriptive_name)
+                )
+            picker.states[rule.descriptive_name] = saved_rule['state']
+        needs_history = any(not rule.is_incremental for rule in bound_selection_rules)
+        if needs_history and saved['history'] is None and saved['train_end_time'] is not None:
+            raise ValueError('Saved state has no history for non-incremental selection rules')
+        picker.history = saved['history']
+        picker.train_end_time = saved['train_end_time']
+        return picker
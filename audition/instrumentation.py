@@ -0,0 +1,297 @@
+from contextlib import contextmanager
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+
+from sqlalchemy import event
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MEGABYTE = 1024.0 * 1024.0
+
+# tracemalloc's peak is process-wide, so memory is sampled under one lock, and
+# each sample's peak is folded into every stage tracking memory, in any thread
+_memory_lock = threading.Lock()
+_memory_records = []
+# how many Instrumentation objects track memory, and whether tracing
+# was started for them, so that the last one to close stops it
+_tracing = {'users': 0, 'started': False}
+
+
+def _sample_memory():
+    """Fold the allocation peak since the last sample into the stages tracking
+    memory, and start a new sampling interval. Called with _memory_lock held
+
+    Returns: (int) the bytes allocated now
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for record in _memory_records:
+        record['allocated_peak_mb'] = max(record['allocated_peak_mb'], peak)
+    return current
+
+
+def _query_counter(instrumentation_ref):
+    """A query listener counting queries for an Instrumentation without
+    keeping it alive"""
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        instrumentation = instrumentation_ref()
+        if instrumentation is not None:
+            instrumentation._count_query()
+    return count_query
+
+
+def peak_rss_mb():
+    """The peak resident memory of this process so far, in megabytes
+
+    Returns: (float) or None where the platform doesn't report it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak / MEGABYTE if sys.platform == 'darwin' else peak / 1024.0
+
+
+class Instrumentation(object):
+    def __init__(self, hooks=None, track_memory=False):
+        """Records the wall time, rows, database queries and peak memory of
+        each stage of an audition
+
+        Each stage produces a record, a dict with the keys:
+
+            stage (string) -- e.g. 'population', 'as_dataframe', 'thresholding', 'picks', 'plot'
+            labels (dict) -- what the stage worked on, such as the selection rule
+            seconds (float) -- wall time
+            rows (int) -- rows fetched or produced, or None where not meaningful
+            queries (int) -- queries run by the stage's thread on attached engines,
+                including those of nested stages
+            peak_rss_mb (float) -- the process' peak resident memory when the stage ended
+            allocated_peak_mb (float) -- with track_memory, the most memory allocated
+                by Python during the stage, above what was allocated when it started.
+                Includes allocations by other threads running at the same time, as
+                tracemalloc measures the whole process
+
+        Args:
+            hooks (list, optional) Callables, each called with every record
+                as its stage ends, e.g. to export them to a metrics system
+            track_memory (boolean, optional) Trace allocations with tracemalloc to
+                find each stage's allocation peak, until 'close'. Slows Python
+                code down noticeably. Needs Python 3.9 or later; ignored, with a
+                warning, before
+        """
+        self.records = []
+        self.hooks = list(hooks or [])
+        if track_memory and not hasattr(tracemalloc, 'reset_peak'):
+            # before Python 3.9 tracemalloc's peak can't be reset, so it would be
+            # the peak since tracing started rather than each stage's own
+            logging.warning('Allocation peaks need Python 3.9 or later, so they are not tracked')
+            track_memory = False
+        self.track_memory = track_memory
+        if track_memory:
+            with _memory_lock:
+                if _tracing['users'] == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracing['started'] = True
+                _tracing['users'] += 1
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engines = []
+
+    def attach(self, db_engine):
+        """Count the queries run on a database engine, until 'detach' or 'close',
+        or until the Instrumentation is garbage collected"""
+        if any(engine is db_engine for engine, _ in self._engines):
+            return
+        listener = _query_counter(weakref.ref(self))
+        event.listen(db_engine, 'before_cursor_execute', listener)
+        # the listener is removed when the Instrumentation is collected, so an
+        # unclosed one doesn't leave it on the caller's engine
+        finalizer = weakref.finalize(
+            self,
+            event.remove,
+            db_engine,
+            'before_cursor_execute',
+            listener
+        )
+        finalizer.atexit = False
+        self._engines.append((db_engine, finalizer))
+
+    def detach(self, db_engine):
+        """Stop counting the queries run on a database engine"""
+        for engine, finalizer in self._engines:
+            if engine is db_engine:
+                finalizer()
+        self._engines = [
+            (engine, finalizer) for engine, finalizer in self._engines
+            if engine is not db_engine
+        ]
+
+    def close(self):
+        """Stop measuring: detach every engine and stop tracking memory, ending
+        tracing if this was the last tracker and tracing was started for it.
+        The records are kept"""
+        for engine, _ in list(self._engines):
+            self.detach(engine)
+        if self.track_memory:
+            self.track_memory = False
+            with _memory_lock:
+                _tracing['users'] -= 1
+                if _tracing['users'] == 0 and _tracing['started']:
+                    tracemalloc.stop()
+                    _tracing['started'] = False
+
+    def add_hook(self, hook):
+        """Call a function with every record from now on"""
+        self.hooks.append(hook)
+
+    def _active_records(self):
+        if not hasattr(self._local, 'records'):
+            self._local.records = []
+        return self._local.records
+
+    def _count_query(self):
+        for record in self._active_records():
+            record['queries'] += 1
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+        logging.debug(
+            'Stage %s %s took %.3f seconds',
+            record['stage'],
+            record['labels'],
+            record['seconds']
+        )
+        for hook in self.hooks:
+            hook(record)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Measure a stage
+
+        Args:
+            name (string) The kind of stage
+            **labels What the stage works on
+
+        Yields: (dict) The stage's record, in which 'rows' can be set
+        """
+        record = {
+            'stage': name,
+            'labels': labels,
+            'seconds': None,
+            'rows': None,
+            'queries': 0,
+            'peak_rss_mb': None,
+            'allocated_peak_mb': None,
+        }
+        track_memory = self.track_memory
+        if track_memory:
+            with _memory_lock:
+                # held in bytes, as an absolute peak, until the stage ends
+                baseline = _sample_memory()
+                record['allocated_peak_mb'] = baseline
+                _memory_records.append(record)
+        active_records = self._active_records()
+        active_records.append(record)
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.time() - start
+            record['peak_rss_mb'] = peak_rss_mb()
+            if track_memory:
+                with _memory_lock:
+                    _sample_memory()
+                    _memory_records.remove(record)
+                record['allocated_peak_mb'] = (record['allocated_peak_mb'] - baseline) / MEGABYTE
+            active_records.remove(record)
+            self._add(record)
+
+    def record(self, name, seconds, rows=None, queries=0, **labels):
+        """Add a stage measured elsewhere, e.g. in a worker process"""
+        self._add({
+            'stage': name,
+            'labels': labels,
+            'seconds': seconds,
+            'rows': rows,
+            'queries': queries,
+            'peak_rss_mb': None,
+            'allocated_peak_mb': None,
+        })
+
+    def report(self):
+        """Returns: (list) every record so far, in the order their stages ended"""
+        with self._lock:
+            return list(self.records)
+
+    def top_memory(self, n=10):
+        """The stages that allocated the most memory, when tracking memory
+
+        Args:
+            n (int, optional) How many stages to return
+
+        Returns: (list) records, by descending 'allocated_peak_mb'
+        """
+        return sorted(
+            (record for record in self.report() if record['allocated_peak_mb'] is not None),
+            key=lambda record: record['allocated_peak_mb'],
+            reverse=True
+        )[:n]
+
+    def summary(self):
+        """Totals per kind of stage
+
+        Returns: (dict) keyed on stage name, each value a dict with the keys
+            'count', 'seconds', 'rows', 'queries', and the highest 'peak_rss_mb'
+            and 'allocated_peak_mb' seen
+        """
+        summary = dict()
+        for record in self.report():
+            totals = summary.setdefault(record['stage'], {
+                'count': 0,
+                'seconds': 0.0,
+                'rows': 0,
+                'queries': 0,
+                'peak_rss_mb': None,
+                'allocated_peak_mb': None,
+            })
+            totals['count'] += 1
+            totals['seconds'] += record['seconds']
+            totals['rows'] += record['rows'] or 0
+            totals['queries'] += record['queries']
+            for peak in ('peak_rss_mb', 'allocated_peak_mb'):
+                if record[peak] is not None:
+                    totals[peak] = max(totals[peak] or 0, record[peak])
+        return summary
+
+    def clear(self):
+        """Forget all records"""
+        with self._lock:
+            self.records = []
+
+
+@contextmanager
+def _unmeasured():
+    yield dict()
+
+
+def stage(instrumentation, name, **labels):
+    """Measure a stage with the given instrumentation, if there is any
+
+    Args:
+        instrumentation (Instrumentation or None)
+        name (string) The kind of stage
+        **labels What the stage works on
+
+    Returns: a context manager yielding the stage's record
+    """
+    if instrumentation is None:
+        return _unmeasured()
+    return instrumentation.stage(name, **labels)
@@ -1,17 +1,67 @@
-from catwalk.evaluation import ModelEvaluator
 import operator
 import logging
 
 
-def greater_is_better(metric):
-    """Whether or not a metric wants higher values
+# Whether greater is better for the metrics catwalk evaluates, so that
+# the common case doesn't need to import catwalk and its dependencies
+GREATER_IS_BETTER = {
+    'accuracy': True,
+    'average precision score': True,
+    'f1': True,
+    'false negatives@': False,
+    'false positives@': False,
+    'fbeta@': True,
+    'fpr@': False,
+    'precision@': True,
+    'recall@': True,
+    'roc_auc': True,
+    'true negatives@': True,
+    'true positives@': True,
+}
+
+
+def _catwalk_metrics():
+    """The metrics available in catwalk, imported on first use
+
+    Returns: (dict) catwalk's ModelEvaluator.available_metrics
+    """
+    from catwalk.evaluation import ModelEvaluator
+    return ModelEvaluator.available_metrics
+
+
+# directionality given by users, which takes precedence over the known metrics
+_overrides = {}
+
+# every metric resolved so far, so each is only looked up (and warned about) once
+_resolved = {}
+
+
+def register_metric_directionality(metric, greater_is_better):
+    """Declare whether greater is better for a metric, such as a custom metric
+    that catwalk doesn't know about. Takes precedence over the known metrics
 
     Args:
         metric (str): The name of a metric, ie 'precision@'
-    Returns: (bool) Whether or not greater is better for the metric
+        greater_is_better (bool): Whether higher values of the metric are better
     """
-    if metric in ModelEvaluator.available_metrics:
-        return ModelEvaluator.available_metrics[metric].greater_is_better
+    _overrides[metric] = bool(greater_is_better)
+    _resolved.pop(metric, None)
+
+
+def clear_metric_directionality():
+    """Forget user-registered directionality and all resolved metrics"""
+    _overrides.clear()
+    _resolved.clear()
+
+
+def _resolve_greater_is_better(metric):
+    if metric in _overrides:
+        return _overrides[metric]
+    if metric in GREATER_IS_BETTER:
+        return GREATER_IS_BETTER[metric]
+    available_metrics = _catwalk_metrics()
+    if metric in available_metrics:
+        return available_metrics[metric].greater_is_better
     else:
         logging.warning(
             'Metric %s not found in available metrics, assuming greater is better',
@@ -20,6 +70,23 @@ def greater_is_better(metric):
         return True
 
 
+def greater_is_better(metric):
+    """Whether or not a metric wants higher values
+
+    Each metric is resolved once, from user-registered directionality,
+    then the known metrics, then catwalk, and the result reused.
+
+    Args:
+        metric (str): The name of a metric, ie 'precision@'
+    Returns: (bool) Whether or not greater is better for the metric
+    """
+    try:
+        return _resolved[metric]
+    except KeyError:
+        _resolved[metric] = _resolve_greater_is_better(metric)
+        return _resolved[metric]
+
+
 def sql_rank_order(metric):
     """SQL Rank Order for a metric
 
@@ -72,4 +139,4 @@ def idxbest(metric):
     if greater_is_better(metric):
         return 'idxmax'
     else:
-        return 'idxmin'
\ No newline at end of file
+        return 'idxmin'
@@ -1,19 +1,31 @@
 from audition.utils import str_in_sql
-from audition.plotting import plot_cats
-import pandas as pd
+from audition.plotting import plot_cats, DEFAULT_AGGREGATE_ABOVE
+from audition.metric_directionality import greater_is_better
 import numpy as np
 import logging
 
 
 class ModelGroupPerformancePlotter(object):
-    def __init__(self, distance_from_best_table):
+    def __init__(
+        self,
+        distance_from_best_table,
+        aggregate_above=DEFAULT_AGGREGATE_ABOVE,
+        aggregate_top_k=None
+    ):
         """Generate a plot illustrating the performance of a model group over time
 
         Args:
             distance_from_best_table (audition.DistanceFromBestTable)
                 A pre-populated distance-from-best database table
+            aggregate_above (int, optional) Above this many model groups, plot the median
+                and quantile band of each model type instead of every model group.
+                None to always plot every model group
+            aggregate_top_k (int, optional) When aggregating, also plot this many
+                model groups with the best average value
         """
         self.distance_from_best_table = distance_from_best_table
+        self.aggregate_above = aggregate_above
+        self.aggregate_top_k = aggregate_top_k
 
     def plot_all(self, metric_filters, model_group_ids, train_end_times):
         """For each metric, plot the value of that metric over time
@@ -29,36 +41,34 @@ class ModelGroupPerformancePlotter(object):
             train_end_times (list) - Train end times to include in the plot
 
         """
+        df = self.fetch_plot_data(metric_filters, model_group_ids, train_end_times)
         for metric_filter in metric_filters:
-            logging.info('Plotting model group performance for %s, %s', metric_filter, train_end_times)
-            df = self.generate_plot_data(
-                metric=metric_filter['metric'],
-                parameter=metric_filter['parameter'],
-                model_group_ids=model_group_ids,
-                train_end_times=train_end_times
+            logging.info(
+                'Plotting model group performance for %s, %s',
+                metric_filter,
+                train_end_times
             )
             self.plot(
                 metric=metric_filter['metric'],
                 parameter=metric_filter['parameter'],
-                df_metric=df,
+                df_metric=of_metric(df, metric_filter['metric'], metric_filter['parameter']),
                 train_end_times=train_end_times
             )
 
-    def generate_plot_data(self, metric, parameter, model_group_ids, train_end_times):
-        """Fetch data necessary for producing the plot from the distance table
+    def fetch_plot_data(self, metrics, model_group_ids, train_end_times):
+        """Fetch the data for a set of metrics from the distance table in one query
 
         Arguments:
-            metric (string) -- model evaluation metric, such as 'precision@'
-            parameter (string) -- model evaluation metric parameter,
-                such as '300_abs'
+            metrics (list) The metrics to fetch. Each element should be
+                a dict with the keys 'metric' and 'parameter'
             model_group_ids (list) - Model group ids to include in the dataset
             train_end_times (list) - Train end times to include in the dataset
 
         Returns: (pandas.DataFrame) The relevant models and their performance
-        on the given metric over time
+        on the given metrics over time, along with the best case for each
+        metric and time as model group 0
         """
-
-        base_df = pd.read_sql(
+        return self.distance_from_best_table.query_executor.read_sql(
             '''select
     model_group_id,
     metric,
@@ -67,10 +77,12 @@ class ModelGroupPerformancePlotter(object):
     raw_value,
     mg.model_type
 from {dist_table} dist
-join results.model_groups mg using (model_group_id)
+join {results_schema}.model_groups mg using (model_group_id)
 where model_group_id in ({model_group_ids})
-union
-select
+    and (metric, parameter) in ({metrics})
+    and {train_end_time} in ({train_end_times})
+union all
+select distinct
     0 model_group_id,
     metric,
     parameter,
@@ -78,19 +90,43 @@ select
     best_case,
     'best case' model_type
 from {dist_table}
-group by 1, 2, 3, 4, 5, 6
+where (metric, parameter) in ({metrics})
+    and {train_end_time} in ({train_end_times})
             '''.format(
                 dist_table=self.distance_from_best_table.distance_table,
-                model_group_ids=str_in_sql(model_group_ids)
+                results_schema=self.distance_from_best_table.results_schema,
+                model_group_ids=str_in_sql(model_group_ids),
+                metrics=','.join(
+                    '({})'.format(str_in_sql([metric['metric'], metric['parameter']]))
+                    for metric in metrics
+                ),
+                train_end_time=self.distance_from_best_table.backend.time('train_end_time'),
+                train_end_times=self.distance_from_best_table.backend.times(train_end_times),
+            )
+        )
+
+    def generate_plot_data(self, metric, parameter, model_group_ids, train_end_times):
+        """Fetch data necessary for producing the plot from the distance table
+
+        Arguments:
+            metric (string) -- model evaluation metric, such as 'precision@'
+            parameter (string) -- model evaluation metric parameter,
+                such as '300_abs'
+            model_group_ids (list) - Model group ids to include in the dataset
+            train_end_times (list) - Train end times to include in the dataset
+
+        Returns: (pandas.DataFrame) The relevant models and their performance
+        on the given metric over time
+        """
+        return of_metric(
+            self.fetch_plot_data(
+                [{'metric': metric, 'parameter': parameter}],
+                model_group_ids,
+                train_end_times
             ),
-            self.distance_from_best_table.db_engine
+            metric,
+            parameter
         )
-        df = base_df[
-            (base_df['train_end_time'].isin(train_end_times)) &
-            (base_df['metric'] == metric) &
-            (base_df['parameter'] == parameter)
-        ]
-        return df
 
     def plot(self, metric, parameter, df_metric, train_end_times, **plt_format_args):
         """Draw the plot representing the given data
@@ -102,34 +138,75 @@ group by 1, 2, 3, 4, 5, 6
             train_end_times (list) - Train end times to use for ticks
             **plt_format_args -- formatting arguments passed through to plot_cats()
         """
-        cat_col = 'model_type'
-        plt_title = '{} {} over time'.format(metric, parameter)
-
-        # when setting the ticks, matplotlib sometimes has problems with datetimes given
-        # as numpy.datetime64 objects, and converting from them to datetimes is ugly.
-        # to get around this, we use the train_end_times given to the plot call as ticks
-        # But to be defensive, we verify that these two versions of the list are the same
-        for given_time, matrix_time in zip(
+        plt_format_args.setdefault('aggregate_above', self.aggregate_above)
+        plt_format_args.setdefault('top_k', self.aggregate_top_k)
+        plot_model_group_performance(
+            metric,
+            parameter,
+            df_metric,
             train_end_times,
-            sorted(df_metric['train_end_time'].unique()),
-        ):
-            given_time_as_numpy = np.datetime64(given_time) 
-            if given_time_as_numpy != matrix_time:
-                raise ValueError(
-                    'Train times given to the plotter do not match up with those extracted from the database. %s (given time) does not equal %s (matrix time)',
-                    given_time_as_numpy,
-                    matrix_time
-                )
-
-        plot_cats(
-            frame=df_metric,
-            x_col='train_end_time',
-            y_col='raw_value',
-            cat_col=cat_col,
-            highlight_grp='best case',
-            title=plt_title,
-            x_label='train end time',
-            y_label='value of {}'.format(metric),
-            x_ticks=train_end_times,
             **plt_format_args
         )
+
+
+def of_metric(df, metric, parameter):
+    """The rows of a dataframe for one metric and parameter
+
+    Arguments:
+        df (pandas.DataFrame) -- with 'metric' and 'parameter' columns, such as
+            the data from ModelGroupPerformancePlotter.fetch_plot_data
+        metric (string) -- model evaluation metric, such as 'precision@'
+        parameter (string) -- model evaluation metric parameter, such as '300_abs'
+
+    Returns: (pandas.DataFrame)
+    """
+    return df[
+        (df['metric'] == metric) &
+        (df['parameter'] == parameter)
+    ]
+
+
+def plot_model_group_performance(metric, parameter, df_metric, train_end_times, **plt_format_args):
+    """Plot the value of a metric over time for each model group, along with the
+    best case, from data fetched by a ModelGroupPerformancePlotter
+
+    Arguments:
+        metric (string) -- model evaluation metric, such as 'precision@'
+        parameter (string) -- model evaluation metric parameter, such as '300_abs'
+        df_metric (pandas.DataFrame)
+        train_end_times (list) - Train end times to use for ticks
+        **plt_format_args -- formatting arguments passed through to plot_cats()
+    """
+    cat_col = 'model_type'
+    plt_title = '{} {} over time'.format(metric, parameter)
+
+    # when setting the ticks, matplotlib sometimes has problems with datetimes given
+    # as numpy.datetime64 objects, and converting from them to datetimes is ugly.
+    # to get around this, we use the train_end_times given to the plot call as ticks
+    # But to be defensive, we verify that these two versions of the list are the same
+    for given_time, matrix_time in zip(
+        train_end_times,
+        sorted(df_metric['train_end_time'].unique()),
+    ):
+        given_time_as_numpy = np.datetime64(given_time)
+        if given_time_as_numpy != matrix_time:
+            raise ValueError(
+                'Train times given to the plotter do not match up with those extracted '
+                'from the database. %s (given time) does not equal %s (matrix time)',
+                given_time_as_numpy,
+                matrix_time
+            )
+
+    plt_format_args.setdefault('top_k_greater_is_better', greater_is_better(metric))
+    plot_cats(
+        frame=df_metric,
+        x_col='train_end_time',
+        y_col='raw_value',
+        cat_col=cat_col,
+        highlight_grp='best case',
+        title=plt_title,
+        x_label='train end time',
+        y_label='value of {}'.format(metric),
+        x_ticks=train_end_times,
+        **plt_format_args
+    )
@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import types
+
+import pandas
+
+
+def model_group_set_hash(model_group_ids):
+    """A hash of a set of candidate model group ids, independent of their order"""
+    return hashlib.sha256(
+        ','.join(str(model_group_id) for model_group_id in sorted(model_group_ids)).encode('utf-8')
+    ).hexdigest()
+
+
+def _code_signature(code):
+    """The bytecode and constants of a code object, with nested code objects
+    (such as lambdas) replaced by their own signatures, since their repr holds
+    a memory address"""
+    return (code.co_code, tuple(
+        _code_signature(constant) if isinstance(constant, types.CodeType) else constant
+        for constant in code.co_consts
+    ))
+
+
+def _function_digest(function):
+    """A digest of what a function computes: its code, defaults and the
+    values it closes over, so that lambdas and closures sharing a name differ"""
+    cells = []
+    for cell in function.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # an empty cell
+            cells.append(None)
+    return hashlib.sha256(repr((
+        _code_signature(function.__code__),
+        function.__defaults__,
+        function.__kwdefaults__,
+        cells,
+    )).encode('utf-8')).hexdigest()
+
+
+def rule_signature(bound_selection_rule):
+    """A string identifying a selection rule function and its bound arguments
+
+    Rules given by name are identified by that name; rules given as functions
+    by the function's module, qualified name and a digest of its code, defaults
+    and closed-over values.
+
+    Args:
+        bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+
+    Returns: (string)
+    """
+    function = bound_selection_rule.function
+    function_name = bound_selection_rule.function_name or '{}.{}:{}'.format(
+        function.__module__,
+        function.__qualname__,
+        _function_digest(function)
+    )
+    return '{}({})'.format(function_name, repr(sorted(bound_selection_rule.args.items())))
+
+
+class PickCache(object):
+    """A disk-backed cache of selection rule picks
+
+    Picks are stored one file per entry, grouped in a directory per distance
+    table fingerprint, so that invalidating a table's picks is a directory removal.
+    Lookups refresh an entry's modification time, and when the cache grows past
+    'max_entries' the least recently used entries are evicted.
+
+    Args:
+        directory (string) A local directory to keep the cache in. Created if missing
+        max_entries (int, optional) The maximum number of picks to keep
+    """
+    def __init__(self, directory, max_entries=100000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entry_count = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, fingerprint, model_group_ids, bound_selection_rule, train_end_time, seed=None):
+        """The cache key for one pick
+
+        Args:
+            fingerprint (string) The distance table fingerprint
+            model_group_ids (list) The candidate model group ids
+            bound_selection_rule (audition.selection_rules.BoundSelectionRule)
+            train_end_time (timestamp) The train end time picked for
+            seed (int, optional) The seed used to break ties
+
+        Returns: (tuple) of the fingerprint and a hash of the other parts
+        """
+        return (fingerprint, hashlib.sha256('|'.join([
+            model_group_set_hash(model_group_ids),
+            rule_signature(bound_selection_rule),
+            pandas.Timestamp(train_end_time).isoformat(),
+            repr(seed),
+        ]).encode('utf-8')).hexdigest())
+
+    def _path(self, key):
+        fingerprint, entry = key
+        return os.path.join(self.directory, fingerprint, entry)
+
+    def get(self, key):
+        """Look up a pick
+
+        Args:
+            key (tuple) A key from 'key'
+
+        Returns: the picked model group id, or None if not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                model_group_id = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return model_group_id
+
+    def set(self, key, model_group_id):
+        """Store a pick, evicting the least recently used picks if the cache is full
+
+        Args:
+            key (tuple) A key from 'key'
+            model_group_id (int) The picked model group id
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new = not os.path.exists(path)
+        # write then rename, so concurrent readers never see a partial entry
+        handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(model_group_id, f)
+        os.replace(temporary_path, path)
+        if is_new:
+            self._entry_count = self._count_entries() if self._entry_count is None \
+                else self._entry_count + 1
+            if self._entry_count > self.max_entries:
+                self._evict()
+
+    def invalidate(self, fingerprint=None):
+        """Remove cached picks
+
+        Args:
+            fingerprint (string, optional) Only remove the picks made on the
+                distance table with this fingerprint. Defaults to all picks
+        """
+        if fingerprint is None:
+            targets = self._fingerprint_directories()
+        else:
+            targets = [os.path.join(self.directory, fingerprint)]
+        for target in targets:
+            shutil.rmtree(target, ignore_errors=True)
+        self._entry_count = None
+
+    def _fingerprint_directories(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        ]
+
+    def _entries(self):
+        return [
+            os.path.join(fingerprint_directory, name)
+            for fingerprint_directory in self._fingerprint_directories()
+            for name in os.listdir(fingerprint_directory)
+        ]
+
+    def _count_entries(self):
+        return len(self._entries())
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache is within its bound"""
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        logging.info('Evicting %s selection rule picks from cache', max(excess, 0))
+        for _, path in entries[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._entry_count = min(len(entries), self.max_entries)
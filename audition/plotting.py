@@ -1,9 +1,45 @@
-import matplotlib
+import importlib
 import numpy as np
-import matplotlib.lines as mlines
+import pandas as pd
+from audition.utils import make_list
 
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
+# matplotlib is slow to import and only needed to draw, so its modules are
+# imported on first use
+_LAZY_MODULES = {
+    'plt': 'matplotlib.pyplot',
+    'mdates': 'matplotlib.dates',
+    'mlines': 'matplotlib.lines',
+    'mcollections': 'matplotlib.collections',
+}
+_loaded_modules = {}
+
+# above this many model groups, plotters switch from one line per
+# model group to aggregated bands per category
+DEFAULT_AGGREGATE_ABOVE = 300
+
+
+def _load(name):
+    """Import one of the lazily loaded matplotlib modules
+
+    Args:
+        name (string) A key of _LAZY_MODULES
+
+    Returns: (module)
+    """
+    if name not in _loaded_modules:
+        if name == 'plt':
+            import matplotlib
+            matplotlib.use('Agg')
+        _loaded_modules[name] = importlib.import_module(_LAZY_MODULES[name])
+    return _loaded_modules[name]
+
+
+def get_pyplot():
+    """The matplotlib.pyplot module audition draws with, imported on first use
+
+    Returns: (module)
+    """
+    return _load('plt')
 
 
 def plot_bounds(observed_min, observed_max):
@@ -31,7 +67,7 @@ def category_colordict(cmap_name, categories, highlight_grp=None):
     # across the entire range, so create an even spacing from 0 to 1
     # with as many steps as in the color map (cmap.N), then repeat it
     # enough times to ensure we cover all our categories
-    cmap = plt.get_cmap(cmap_name)
+    cmap = get_pyplot().get_cmap(cmap_name)
     categories_with_colors = [cat for cat in categories if cat != highlight_grp]
     ncyc = int(np.ceil(1.0*len(categories_with_colors) / cmap.N))
     colors = (cmap.colors * ncyc)[:len(categories_with_colors)]
@@ -55,13 +91,106 @@ def category_styledict(colordict, highlight_grp):
     return dict((key, '--' if key == highlight_grp else '-') for key in colordict.keys())
 
 
-def _plot_lines(frame, x_col, y_col, ax, grp_col, colordict, cat_col, styledict):
-    # plot the lines, one for each model group,
-    # looking up the color by model type from above
-    for grp_val in np.unique(frame[grp_col]):
-        df = frame.loc[frame[grp_col] == grp_val]
-        cat = df.iloc[0][cat_col]
-        df.plot(x_col, y_col, ax=ax, c=colordict[cat], style=styledict[cat], legend=False)
+def _x_values(frame, x_col):
+    """The x column as numbers matplotlib can draw, converting datetimes to date numbers"""
+    x_values = frame[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x_values = _load('mdates').date2num(x_values.values)
+    return np.asarray(x_values, dtype=float)
+
+
+def _plot_lines(frame, x_col, y_col, ax, grp_col, colordict, cat_col, styledict, linewidth=None):
+    # plot the lines, one for each model group, as a single collection
+    # per category so that the cost is in the points rather than the lines
+    points = np.column_stack([_x_values(frame, x_col), frame[y_col].values.astype(float)])
+
+    # each group is drawn in its first row's category
+    group_codes, _ = pd.factorize(frame[grp_col])
+    group_categories = frame[cat_col].groupby(group_codes, sort=True).first()
+    row_categories = group_categories.values[group_codes]
+
+    for cat in sorted(colordict.keys()):
+        in_category = np.flatnonzero(row_categories == cat)
+        if len(in_category) == 0:
+            continue
+        # a stable sort keeps each group's points in frame order
+        rows = in_category[np.argsort(group_codes[in_category], kind='mergesort')]
+        boundaries = np.flatnonzero(np.diff(group_codes[rows])) + 1
+        ax.add_collection(_load('mcollections').LineCollection(
+            np.split(points[rows], boundaries),
+            colors=colordict[cat],
+            linestyles=styledict[cat],
+            linewidths=linewidth,
+        ))
+    ax.autoscale_view()
+
+
+def _plot_bands(
+    frame,
+    x_col,
+    y_col,
+    ax,
+    grp_col,
+    colordict,
+    cat_col,
+    styledict,
+    band_quantiles,
+    top_k,
+    top_k_greater_is_better,
+    highlight_grp=None
+):
+    # plot one median line and quantile band per category, plus optionally
+    # the individual lines of the top k model groups by average value,
+    # leaving out the highlighted category, which is a reference (like the
+    # best case) rather than a model group
+    low, high = band_quantiles
+    stats = frame[[cat_col, y_col]]\
+        .assign(_x=_x_values(frame, x_col))\
+        .groupby([cat_col, '_x'])[y_col]\
+        .quantile([low, 0.5, high])\
+        .unstack()
+    for cat in sorted(colordict.keys()):
+        if cat not in stats.index.get_level_values(0):
+            continue
+        cat_stats = stats.xs(cat, level=0)
+        ax.plot(
+            cat_stats.index.values,
+            cat_stats[0.5].values,
+            color=colordict[cat],
+            linestyle=styledict[cat]
+        )
+        ax.fill_between(
+            cat_stats.index.values,
+            cat_stats[low].values,
+            cat_stats[high].values,
+            color=colordict[cat],
+            alpha=0.25,
+            linewidth=0
+        )
+
+    if top_k:
+        group_means = frame[frame[cat_col] != highlight_grp].groupby(grp_col)[y_col].mean()
+        top_groups = group_means.nlargest(top_k) if top_k_greater_is_better \
+            else group_means.nsmallest(top_k)
+        _plot_lines(
+            frame[frame[grp_col].isin(top_groups.index)],
+            x_col,
+            y_col,
+            ax,
+            grp_col,
+            colordict,
+            cat_col,
+            styledict,
+            linewidth=0.75
+        )
+    ax.autoscale_view()
+
+
+def _as_axis_values(values):
+    """Convert datetime-like axis ticks or limits to matplotlib's date numbers"""
+    if values is None:
+        return None
+    return _load('mdates').date2num(pd.to_datetime(list(values)).values)
 
 
 def generate_plot_lines(colordict, label_fcn, styledict):
@@ -69,7 +198,7 @@ def generate_plot_lines(colordict, label_fcn, styledict):
     # plot_labs = []
     for cat_val in sorted(colordict.keys()):
         # http://matplotlib.org/users/legend_guide.html
-        lin = mlines.Line2D(
+        lin = _load('mlines').Line2D(
             xdata=[],
             ydata=[],
             linestyle=styledict[cat_val],
@@ -116,9 +245,14 @@ def plot_cats(frame, x_col, y_col, cat_col='model_type', grp_col='model_group_id
               figsize=[12, 6], x_ticks=None, y_ticks=None, x_lim=None, y_lim=None,
               legend_loc=None, legend_fontsize=12,
               label_fontsize=12, title_fontsize=16,
-              label_fcn=None):
+              label_fcn=None, aggregate_above=None, band_quantiles=(0.25, 0.75),
+              top_k=None, top_k_greater_is_better=True, save_path=None):
     """Plot a line plot with each line colored by a category variable.
 
+    With many groups, individual lines become unreadable, so above
+    'aggregate_above' groups each category is instead drawn as a median line
+    with a band between two quantiles, computed across its groups at each x value.
+
     Arguments:
         frame (DataFrame) -- a dataframe containing the data to be plotted
         x_col (string) -- name of the x-axis column
@@ -142,8 +276,19 @@ def plot_cats(frame, x_col, y_col, cat_col='model_type', grp_col='model_group_id
         title_fontsize (int) -- allows specifying font size for plot title
         label_fcn (method) -- function to map category names to more readable
                                 names, accepting values of cat_col
+        aggregate_above (int) -- draw aggregated bands instead of lines when there
+                                 are more groups than this, not counting those in
+                                 the highlighted category. Defaults to never
+        band_quantiles (tuple) -- the lower and upper quantiles of the aggregated bands
+        top_k (int) -- when aggregating, also draw the lines of this many groups
+                       with the best average y value, outside the highlighted category
+        top_k_greater_is_better (bool) -- whether a higher average y value is better
+                                          when picking the top k groups
+        save_path (string or list) -- write the figure to this file, or each of these
+                                      files, and close it instead of showing it
     """
 
+    plt = get_pyplot()
     fig, ax = plt.subplots(1, 1, figsize=figsize)
 
     # function for parsing cat_col values into more readable legend lables
@@ -157,9 +302,31 @@ def plot_cats(frame, x_col, y_col, cat_col='model_type', grp_col='model_group_id
     colordict = category_colordict(cmap_name, categories, highlight_grp)
     styledict = category_styledict(colordict, highlight_grp)
 
-    # plot the lines, one for each model group,
-    # looking up the color by model type from above
-    _plot_lines(frame, x_col, y_col, ax, grp_col, colordict, cat_col, styledict)
+    # plot the lines, one for each model group, or bands summarizing them
+    # if there are too many, looking up the color by model type from above
+    # the highlighted category is a reference (like the best case), not a group
+    group_count = frame.loc[frame[cat_col] != highlight_grp, grp_col].nunique()
+    if aggregate_above is not None and group_count > aggregate_above:
+        _plot_bands(
+            frame,
+            x_col,
+            y_col,
+            ax,
+            grp_col,
+            colordict,
+            cat_col,
+            styledict,
+            band_quantiles,
+            top_k,
+            top_k_greater_is_better,
+            highlight_grp
+        )
+    else:
+        _plot_lines(frame, x_col, y_col, ax, grp_col, colordict, cat_col, styledict)
+    if pd.api.types.is_datetime64_any_dtype(frame[x_col]):
+        ax.xaxis_date()
+        x_ticks = _as_axis_values(x_ticks)
+        x_lim = _as_axis_values(x_lim)
 
     # have to set the legend manually since we don't want one legend
     # entry per line on the plot, just one per model type.
@@ -184,4 +351,9 @@ def plot_cats(frame, x_col, y_col, cat_col='model_type', grp_col='model_group_id
         label_fontsize=label_fontsize,
     )
 
-    plt.show()
+    if save_path is None:
+        plt.show()
+    else:
+        for path in make_list(save_path):
+            fig.savefig(path)
+        plt.close(fig)
@@ -0,0 +1,121 @@
+import json
+import logging
+import re
+import time
+
+import pandas as pd
+from smart_open import smart_open
+
+from audition.backends import backend_for
+
+# statements that postgres can EXPLAIN
+EXPLAINABLE = re.compile(
+    r'^\s*(select|insert|update|delete|values|with|create\s+table\s+\S+\s+as)\b',
+    re.IGNORECASE
+)
+
+
+class QueryExecutor(object):
+    def __init__(self, db_engine, record=False, explain=False):
+        """Runs every SQL statement audition issues, optionally recording each one
+
+        Each record is a dict with the keys:
+
+            sql (string) -- the statement
+            params (dict or list) -- its bound parameters, if any
+            seconds (float) -- how long it took to run, excluding any EXPLAIN
+            rows (int) -- the rows it returned, or affected if it returned none
+            plan (list) -- the lines of its EXPLAIN (ANALYZE, BUFFERS) output,
+                or None if not explained
+
+        Args:
+            db_engine (sqlalchemy.engine) Postgres or SQLite, whose SQL differences
+                are handled by the 'backend' chosen for it; see audition.backends
+            record (boolean, optional) Record every statement
+            explain (boolean, optional) Also record the plan of every explainable
+                statement, if the database is postgres. This runs each such statement
+                twice, the first time in a transaction that is rolled back
+        """
+        self.db_engine = db_engine
+        self.backend = backend_for(db_engine)
+        self.record = record
+        self.explain = explain
+        self.records = []
+
+    def _plan(self, sql, params):
+        explainable = EXPLAINABLE.match(sql) and self.db_engine.dialect.name == 'postgresql'
+        if not (self.explain and explainable):
+            return None
+        with self.db_engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                return [
+                    row[0] for row in
+                    connection.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params or {})
+                ]
+            finally:
+                transaction.rollback()
+
+    def _add_record(self, sql, params, seconds, rows, plan):
+        logging.debug('Query returned %s rows in %.3f seconds', rows, seconds)
+        if self.record:
+            self.records.append({
+                'sql': sql,
+                'params': params,
+                'seconds': seconds,
+                'rows': rows,
+                'plan': plan,
+            })
+
+    def execute(self, sql, params=None):
+        """Run a statement
+
+        Args:
+            sql (string)
+            params (dict, optional) Bound parameters
+
+        Returns: (list) The rows returned by the statement, empty if it returns none
+        """
+        plan = self._plan(sql, params)
+        start = time.time()
+        if params:
+            result = self.db_engine.execute(sql, params)
+        else:
+            result = self.db_engine.execute(sql)
+        rows = result.fetchall() if result.returns_rows else []
+        self._add_record(
+            sql,
+            params,
+            time.time() - start,
+            len(rows) if result.returns_rows else result.rowcount,
+            plan
+        )
+        return rows
+
+    def read_sql(self, sql, params=None):
+        """Run a query into a dataframe
+
+        Args:
+            sql (string)
+            params (dict, optional) Bound parameters
+
+        Returns: (pandas.DataFrame) with timestamps as the backend converts them
+        """
+        plan = self._plan(sql, params)
+        start = time.time()
+        df = self.backend.frame(pd.read_sql(sql, self.db_engine, params=params))
+        self._add_record(sql, params, time.time() - start, len(df), plan)
+        return df
+
+    def dump(self, path):
+        """Write the records to a JSON file
+
+        Args:
+            path (string) The smart_open-ready path to the file
+        """
+        with smart_open(path, 'w') as f:
+            json.dump(self.records, f, indent=2, default=str)
+
+    def clear(self):
+        """Forget all records"""
+        self.records = []
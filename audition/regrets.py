@@ -1,12 +1,83 @@
-import copy
 from audition.selection_rules import *
+from audition.history import HistoryView, SlicedHistory, incremental_picks, incremental_scores, \
+    pick_as_of, picks_from_history, picks_from_snapshot
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import logging
 import numpy
 import pandas
+import pickle
+import shutil
+import tempfile
+import threading
 from audition.plotting import plot_cats, plot_bounds
+from audition.utils import ecdf
+from audition.instrumentation import stage
+from audition.pick_cache import rule_signature
+
+
+class RegretResults(object):
+    """The model groups picked by selection rules over time, and how they
+    performed the next time, for one or more regret metrics
+
+    Args:
+        dataframe (pandas.DataFrame) One row per selection rule, train end time and
+            regret metric, with the columns 'selection_rule', 'train_end_time',
+            'model_group_id', the distance table columns for the picked model group,
+            and 'regret' (the distance from the best case next time)
+    """
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+
+    def for_metric(self, metric, parameter):
+        """The results judged by one regret metric
+
+        Args:
+            metric (string) -- model evaluation metric, such as 'precision@'
+            parameter (string) -- model evaluation metric parameter,
+                such as '300_abs'
+
+        Returns: (pandas.DataFrame) rows ordered by selection rule, then train end time
+        """
+        return self.dataframe[
+            (self.dataframe['metric'] == metric) &
+            (self.dataframe['parameter'] == parameter)
+        ].reset_index(drop=True)
+
+    @property
+    def picks(self):
+        """The model group picked by each selection rule at each train end time
+
+        Returns: (pandas.DataFrame) indexed by selection rule, with a column per train end time
+        """
+        return self.dataframe\
+            .drop_duplicates(['selection_rule', 'train_end_time'])\
+            .pivot(index='selection_rule', columns='train_end_time', values='model_group_id')
+
+    def regrets(self, metric, parameter):
+        """The regret of each selection rule at each train end time
+
+        Args:
+            metric (string) -- model evaluation metric, such as 'precision@'
+            parameter (string) -- model evaluation metric parameter,
+                such as '300_abs'
+
+        Returns: (pandas.DataFrame) indexed by selection rule, with a column per train end time
+        """
+        return self.for_metric(metric, parameter)\
+            .pivot(index='selection_rule', columns='train_end_time', values='regret')
 
 
 class SelectionRulePicker(object):
-    def __init__(self, distance_from_best_table):
+    def __init__(
+        self,
+        distance_from_best_table,
+        executor=None,
+        seed=None,
+        pick_cache=None,
+        instrumentation=None,
+        memory_budget_mb=None
+    ):
         """Runs simulations of different model group selection rules
 
         Can look at different results of selection rules, like 'regrets'
@@ -19,8 +90,58 @@ class SelectionRulePicker(object):
         Args:
             distance_from_best_table (audition.DistanceFromBestTable)
                 A pre-populated distance-from-best database table
+            executor (concurrent.futures.Executor or string, optional) How to
+                run a grid of selection rules in regret_results. None runs them
+                serially, 'process' runs them in a process pool created for each
+                call, and an Executor instance is used as given. Selection rules
+                that can't be pickled, such as closures, always run in this process
+            seed (int, optional) Seeds the random tie-breaking of each pick, so
+                results are reproducible and the same whether run serially or in parallel
+            pick_cache (audition.pick_cache.PickCache, optional) A disk cache of picks,
+                keyed by the distance table's fingerprint, the candidate model groups,
+                the rule and its arguments, the train end time and the seed. Picks
+                found in it are looked up instead of recomputed. Only used with a
+                seed, as unseeded picks break ties differently each time
+            instrumentation (audition.instrumentation.Instrumentation, optional)
+                Measures the picks of each selection rule
+            memory_budget_mb (float, optional) The most memory to spend on histories
+                fetched for selection rules. Beyond it, the least recently used
+                histories are released. A history estimated to be bigger than the
+                budget on its own is fetched one train end time at a time and folded
+                into the state of rules with an incremental implementation; other
+                rules fail on it with a ValueError. One that turns out bigger once
+                fetched is used for one rule's picks and then released, leaving the
+                kept ones
+
+        The picker keeps the last backtest of each selection rule whose incremental
+        implementation scores each group independently of the others: its candidates
+        and, at each train end time, its pick, the pick's score and the model groups
+        tied with it, rather than every candidate's score. When the same rule is
+        backtested again on different candidates, as after loosening a threshold,
+        a previous pick is kept wherever it is still a candidate, was not tied with
+        another remaining candidate, and scores strictly better than every newly
+        admitted group (which are scored on their own rows). Only the other train
+        end times are picked again. Picks fanned out to an executor don't use or
+        update these backtests.
         """
         self.distance_from_best_table = distance_from_best_table
+        self.executor = executor
+        self.seed = seed
+        self.pick_cache = pick_cache
+        if pick_cache is not None and seed is None:
+            logging.warning('Selection rule picks are only cached when a seed is given')
+        self.instrumentation = instrumentation
+        self.memory_budget_mb = memory_budget_mb
+        self._history_views = OrderedDict()
+        self._history_view_locks = dict()
+        self._history_view_locks_lock = threading.Lock()
+        self._backtests = dict()
+
+    def clear_cache(self):
+        """Forget the dataframes fetched from the distance table and the last
+        backtests, e.g. after it has been repopulated"""
+        self._history_views = OrderedDict()
+        self._backtests = dict()
 
     def results_for_rule(
         self,
@@ -56,16 +177,14 @@ class SelectionRulePicker(object):
             'raw_value_next_time'
         """
 
-        df = self.distance_from_best_table.as_dataframe(model_group_ids)
+        df = self.distance_from_best_table.as_dataframe(
+            model_group_ids,
+            metrics=[(regret_metric, regret_parameter)]
+        )
         choices = []
+        picks = self.picks_for_rule(bound_selection_rule, model_group_ids, train_end_times)
 
-        for train_end_time in train_end_times:
-            model_group_id = self.model_group_from_rule(
-                bound_selection_rule,
-                model_group_ids,
-                train_end_time
-            )
-
+        for train_end_time, model_group_id in zip(train_end_times, picks):
             choice = df[
                 (df['model_group_id'] == model_group_id) &
                 (df['train_end_time'] == train_end_time) &
@@ -76,6 +195,270 @@ class SelectionRulePicker(object):
             choices.append(choice.squeeze().to_dict())
         return choices
 
+    def regret_results(
+        self,
+        bound_selection_rules,
+        model_group_ids,
+        train_end_times,
+        regret_metrics
+    ):
+        """Simulate a set of selection rules once and calculate their regrets
+            against each of a set of metrics
+
+        The model group picked by a rule does not depend on the metric used to
+        judge it, so each rule is only run once per train end time.
+
+        Arguments:
+            bound_selection_rules (list of .selection_rules.BoundSelectionRule)
+                The selection rules to simulate
+            model_group_ids (list) The list of model group ids to include in
+                the regret analysis
+            train_end_times (list) The list of train end times to include in
+                the regret analysis
+            regret_metrics (list) The metrics to calculate regrets against. Each
+                element should be a dict with the keys 'metric' and 'parameter'
+
+        Returns: (RegretResults)
+        """
+        picks = pandas.DataFrame.from_records([
+            {
+                'selection_rule': bound_selection_rule.descriptive_name,
+                'train_end_time': pandas.Timestamp(train_end_time),
+                'model_group_id': model_group_id,
+                'rule_order': rule_order,
+                'time_order': time_order,
+            }
+            for rule_order, (bound_selection_rule, rule_picks) in enumerate(zip(
+                bound_selection_rules,
+                self.picks_for_rules(bound_selection_rules, model_group_ids, train_end_times)
+            ))
+            for time_order, (train_end_time, model_group_id) in enumerate(zip(
+                train_end_times,
+                rule_picks
+            ))
+        ], columns=[
+            'selection_rule', 'train_end_time', 'model_group_id', 'rule_order', 'time_order'
+        ])
+        # only the picked model groups are needed to judge the picks
+        df = self.distance_from_best_table.as_dataframe(
+            sorted(set(picks['model_group_id'])) or model_group_ids,
+            metrics=[(metric['metric'], metric['parameter']) for metric in regret_metrics]
+        )
+        df['train_end_time'] = pandas.to_datetime(df['train_end_time'])
+        results = picks.merge(df, on=['model_group_id', 'train_end_time'])
+        if len(results) != len(picks) * len(regret_metrics):
+            raise ValueError(
+                'Expected one row per pick and regret metric, found {} for {} picks and {} metrics'
+                .format(len(results), len(picks), len(regret_metrics))
+            )
+        results['regret'] = results['dist_from_best_case_next_time']
+        return RegretResults(
+            results.sort_values(['metric', 'parameter', 'rule_order', 'time_order'])
+            .drop(['rule_order', 'time_order'], axis=1)
+            .reset_index(drop=True)
+        )
+
+    def picks_for_rules(self, bound_selection_rules, model_group_ids, train_end_times):
+        """Pick a model group for each of the given selection rules and train end times,
+        using the picker's executor
+
+        Arguments:
+            bound_selection_rules (list of .selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+            train_end_times (list) The train end times to pick for
+
+        Returns: (list) For each selection rule, the model group id chosen for
+            each of the train end times
+        """
+        if self.executor is None:
+            return [
+                self.picks_for_rule(bound_selection_rule, model_group_ids, train_end_times)
+                for bound_selection_rule in bound_selection_rules
+            ]
+        if isinstance(self.executor, Executor):
+            with stage(
+                self.instrumentation,
+                'picks_batch',
+                rules=len(bound_selection_rules)
+            ) as record:
+                record['rows'] = len(bound_selection_rules) * len(train_end_times)
+                return self._parallel_picks(
+                    self.executor,
+                    bound_selection_rules,
+                    model_group_ids,
+                    train_end_times
+                )
+        if self.executor == 'process':
+            with stage(
+                self.instrumentation,
+                'picks_batch',
+                rules=len(bound_selection_rules)
+            ) as record, ProcessPoolExecutor() as executor:
+                record['rows'] = len(bound_selection_rules) * len(train_end_times)
+                return self._parallel_picks(
+                    executor,
+                    bound_selection_rules,
+                    model_group_ids,
+                    train_end_times
+                )
+        raise ValueError('Unknown executor {}'.format(self.executor))
+
+    def picks_for_rule(self, bound_selection_rule, model_group_ids, train_end_times):
+        """Pick a model group for each of the given train end times
+
+        Arguments:
+            bound_selection_rule (.selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+            train_end_times (list) The train end times to pick for
+
+        Returns: (list) The model group id chosen for each of the train end times
+        """
+        with stage(
+            self.instrumentation,
+            'picks',
+            rule=bound_selection_rule.descriptive_name
+        ) as record:
+            record['rows'] = len(train_end_times)
+            keys, cached_picks = self._cached_picks(
+                bound_selection_rule,
+                model_group_ids,
+                train_end_times
+            )
+            missing_times = [
+                train_end_time for train_end_time, pick in zip(train_end_times, cached_picks)
+                if pick is None
+            ]
+            if not missing_times:
+                return cached_picks
+            picks = self._fill_picks(
+                cached_picks,
+                self._backtest(bound_selection_rule, model_group_ids, missing_times)
+            )
+            self._store_picks(keys, cached_picks, picks)
+            return picks
+
+    def _backtest(self, bound_selection_rule, model_group_ids, train_end_times):
+        """Pick for each train end time, reusing the rule's last backtest wherever
+        the change in candidate model groups can't have changed its pick
+
+        Arguments:
+            bound_selection_rule (.selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+            train_end_times (list) The train end times to pick for
+
+        Returns: (list) The model group id chosen for each of the train end times
+        """
+        if not bound_selection_rule.has_independent_scores:
+            return picks_from_history(
+                self._history_view(bound_selection_rule, model_group_ids),
+                bound_selection_rule,
+                train_end_times,
+                self.seed
+            )
+        train_end_times = [pandas.Timestamp(train_end_time) for train_end_time in train_end_times]
+        rule_key = rule_signature(bound_selection_rule)
+        picks = self._reusable_picks(
+            self._backtests.get(rule_key),
+            bound_selection_rule,
+            model_group_ids,
+            train_end_times
+        )
+        rerun_times = [
+            train_end_time for train_end_time in train_end_times
+            if train_end_time not in picks
+        ]
+        if rerun_times:
+            scores = dict()
+            rerun_picks = incremental_picks(
+                self._history_view(bound_selection_rule, model_group_ids),
+                bound_selection_rule,
+                rerun_times,
+                self.seed,
+                scores
+            )
+            for train_end_time, pick in zip(rerun_times, rerun_picks):
+                picks[train_end_time] = (pick,) + self._pick_score(pick, scores.pop(train_end_time))
+        logging.info(
+            'Reused %s of %s picks for %s from its last backtest',
+            len(train_end_times) - len(rerun_times),
+            len(train_end_times),
+            bound_selection_rule.descriptive_name
+        )
+        self._backtests[rule_key] = {
+            'model_group_ids': frozenset(model_group_ids),
+            'picks': picks,
+        }
+        return [picks[train_end_time][0] for train_end_time in train_end_times]
+
+    @staticmethod
+    def _pick_score(pick, scores):
+        """What reusing a pick needs to keep of the scores it was made from
+
+        Arguments:
+            pick (int) The picked model group id
+            scores (pandas.Series) The score of every candidate, indexed by model group id
+
+        Returns: (float, frozenset) the pick's score, and the other model groups
+            with the same score
+        """
+        score = scores.get(pick)
+        if score is None or pandas.isnull(score):
+            return numpy.nan, frozenset()
+        return score, frozenset(scores.index[scores == score]) - {pick}
+
+    def _reusable_picks(self, backtest, bound_selection_rule, model_group_ids, train_end_times):
+        """The picks of a previous backtest that still hold for new candidates
+
+        Arguments:
+            backtest (dict) The rule's last backtest, with the keys 'model_group_ids'
+                and 'picks', or None if there is none
+            bound_selection_rule (.selection_rules.BoundSelectionRule) A rule
+                with independent scores
+            model_group_ids (list) The new candidate model group ids
+            train_end_times (list of pandas.Timestamp) The train end times to pick for
+
+        Returns: (dict) the reused picks, keyed by train end time, each a tuple
+            of the pick, its score and the model groups tied with it
+        """
+        picks = dict()
+        if backtest is None:
+            return picks
+        candidates = set(model_group_ids)
+        reusable_times = [
+            train_end_time for train_end_time in train_end_times
+            if train_end_time in backtest['picks']
+            and backtest['picks'][train_end_time][0] in candidates
+        ]
+        if not reusable_times:
+            return picks
+        admitted = sorted(candidates - backtest['model_group_ids'])
+        if admitted:
+            admitted_scores = incremental_scores(
+                HistoryView(self.distance_from_best_table.as_dataframe(
+                    admitted,
+                    metrics=bound_selection_rule.required_metrics,
+                    columns=bound_selection_rule.required_columns,
+                )),
+                bound_selection_rule,
+                reusable_times
+            )
+        greater_is_better = bound_selection_rule.incremental_rule.greater_is_better()
+        for train_end_time in reusable_times:
+            pick, score, tied = backtest['picks'][train_end_time]
+            if pandas.isnull(score):
+                continue
+            # a tie is broken at random among the candidates, so it may go differently
+            if tied & candidates:
+                continue
+            if admitted:
+                new_scores = admitted_scores[train_end_time]
+                if new_scores.isnull().any():
+                    continue
+                if (new_scores >= score if greater_is_better else new_scores <= score).any():
+                    continue
+            picks[train_end_time] = (pick, score, frozenset())
+        return picks
+
     def model_group_from_rule(self, bound_selection_rule, model_group_ids, train_end_time):
         """Pick a model group that best selects the given selection rule
 
@@ -83,7 +466,10 @@ class SelectionRulePicker(object):
         with all data after the given train end time removed, both rows representing
         later time periods but also columns that have access to later data. Calculating and
         passing this allows the selection rules to be written without specific code
-        to exclude the future
+        to exclude the future. Only the metrics and columns that the rule declares
+        it needs are fetched, once per set of model groups, and the subset is a
+        positional slice of that fetch rather than a copy. Rules that declare that they
+        modify their input are given a copy.
 
         Arguments:
             bound_selection_rule (function) A function that returns a model group
@@ -95,13 +481,284 @@ class SelectionRulePicker(object):
 
         Returns: (int) The model group id chosen by the input selection rule
         """
-        df = self.distance_from_best_table.as_dataframe(model_group_ids)
-        localized_df = copy.deepcopy(
-            df[df['train_end_time'] <= train_end_time]
+        with stage(
+            self.instrumentation,
+            'picks',
+            rule=bound_selection_rule.descriptive_name
+        ) as record:
+            record['rows'] = 1
+            keys, cached_picks = self._cached_picks(
+                bound_selection_rule,
+                model_group_ids,
+                [train_end_time]
+            )
+            if cached_picks[0] is not None:
+                return cached_picks[0]
+            pick = pick_as_of(
+                self._history_view(bound_selection_rule, model_group_ids),
+                bound_selection_rule,
+                train_end_time,
+                self.seed
+            )
+            self._store_picks(keys, cached_picks, [pick])
+            return pick
+
+    def _cached_picks(self, bound_selection_rule, model_group_ids, train_end_times):
+        """Look up picks in the pick cache
+
+        Arguments:
+            bound_selection_rule (.selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+            train_end_times (list) The train end times to pick for
+
+        Returns: (list, list) The cache keys, or None if picks aren't cached, and
+            the cached pick for each train end time, or None where there is none
+        """
+        if self.pick_cache is None or self.seed is None:
+            return None, [None] * len(train_end_times)
+        fingerprint = self.distance_from_best_table.fingerprint
+        keys = [
+            self.pick_cache.key(
+                fingerprint,
+                model_group_ids,
+                bound_selection_rule,
+                train_end_time,
+                self.seed
+            )
+            for train_end_time in train_end_times
+        ]
+        return keys, [self.pick_cache.get(key) for key in keys]
+
+    def _store_picks(self, keys, cached_picks, picks):
+        """Store the picks that were not already in the pick cache"""
+        if keys is None:
+            return
+        for key, cached_pick, pick in zip(keys, cached_picks, picks):
+            if cached_pick is None:
+                self.pick_cache.set(key, pick)
+
+    @staticmethod
+    def _fill_picks(picks, computed_picks):
+        """Fill the missing picks, in order, with the computed ones"""
+        computed_picks = iter(computed_picks)
+        return [next(computed_picks) if pick is None else pick for pick in picks]
+
+    def _history_view_key(self, bound_selection_rule, model_group_ids):
+        metrics = bound_selection_rule.required_metrics
+        columns = bound_selection_rule.required_columns
+        return (
+            tuple(sorted(model_group_ids)),
+            tuple(metrics) if metrics is not None else None,
+            tuple(columns) if columns is not None else None,
         )
-        del localized_df['dist_from_best_case_next_time']
 
-        return bound_selection_rule.pick(localized_df, train_end_time)
+    def _history_view(self, bound_selection_rule, model_group_ids):
+        """Fetch the rows and columns a selection rule declares it needs,
+        reusing an earlier fetch of the same subset
+
+        Safe to call from several threads; each subset is fetched once.
+
+        Arguments:
+            bound_selection_rule (.selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+
+        Returns: (HistoryView or SlicedHistory) The subset of the distance table
+            the rule reads, sliced by train end time if it doesn't fit in the
+            memory budget
+        """
+        key = self._history_view_key(bound_selection_rule, model_group_ids)
+        with self._history_view_locks_lock:
+            lock = self._history_view_locks.setdefault(key, threading.Lock())
+        with lock:
+            with self._history_view_locks_lock:
+                view = self._history_views.get(key)
+                if view is not None:
+                    self._history_views.move_to_end(key)
+            if view is None:
+                view = self._fetch_history(bound_selection_rule, model_group_ids)
+                if isinstance(view, SlicedHistory):
+                    return view
+                with self._history_view_locks_lock:
+                    self._history_views[key] = view
+                    self._enforce_memory_budget(key)
+            return view
+
+    def _fetch_history(self, bound_selection_rule, model_group_ids):
+        """Fetch the rows a selection rule reads, or, when they are estimated
+        to exceed the memory budget, a history that fetches them one train
+        end time at a time
+
+        The size is estimated from the row count of each train end time and the
+        size of the earliest train end time's rows, which costs two small queries.
+
+        Arguments:
+            bound_selection_rule (.selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+
+        Returns: (HistoryView or SlicedHistory)
+
+        Raises: ValueError if the history exceeds the memory budget and the rule
+            has no incremental implementation to read it slice by slice
+        """
+        metrics = bound_selection_rule.required_metrics
+        columns = bound_selection_rule.required_columns
+
+        def fetch(**time_args):
+            return self.distance_from_best_table.as_dataframe(
+                model_group_ids,
+                metrics=metrics,
+                columns=columns,
+                **time_args
+            )
+
+        def fetch_time(train_end_time):
+            return fetch(train_end_times=[train_end_time])
+
+        if self.memory_budget_mb is not None:
+            row_counts = self.distance_from_best_table.row_counts(model_group_ids, metrics=metrics)
+            if row_counts:
+                first_slice = HistoryView(fetch_time(min(row_counts)))
+                estimate = first_slice.estimated_nbytes(sum(row_counts.values()))
+                if estimate > self.memory_budget_mb * 1024 * 1024:
+                    if not bound_selection_rule.is_incremental:
+                        raise ValueError(
+                            'The history of {} is estimated at {:.1f} MB, over the memory '
+                            'budget of {} MB, and the rule has no incremental '
+                            'implementation to evaluate it one train end time at a time'
+                            .format(
+                                bound_selection_rule.descriptive_name,
+                                estimate / (1024.0 * 1024.0),
+                                self.memory_budget_mb
+                            )
+                        )
+                    logging.warning(
+                        'The history of %s is estimated at %.1f MB, over the memory '
+                        'budget of %s MB, so it is fetched one train end time at a time',
+                        bound_selection_rule.descriptive_name,
+                        estimate / (1024.0 * 1024.0),
+                        self.memory_budget_mb
+                    )
+                    return SlicedHistory(fetch_time, row_counts.keys())
+        return HistoryView(fetch())
+
+    def _enforce_memory_budget(self, new_key):
+        """Release the least recently used histories until those kept fit in the
+        memory budget. A new history that doesn't fit on its own is released
+        instead, leaving the others kept"""
+        if self.memory_budget_mb is None:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        new_bytes = self._history_views[new_key].nbytes
+        if new_bytes > budget:
+            logging.warning(
+                'A history of %.1f MB exceeds the memory budget of %s MB, so it will '
+                'be fetched again for each selection rule that needs it',
+                new_bytes / (1024.0 * 1024.0),
+                self.memory_budget_mb
+            )
+            del self._history_views[new_key]
+            return
+        total = sum(view.nbytes for view in self._history_views.values())
+        for key in list(self._history_views):
+            if total <= budget:
+                return
+            if key != new_key:
+                total -= self._history_views.pop(key).nbytes
+
+    def _parallel_picks(self, executor, bound_selection_rules, model_group_ids, train_end_times):
+        """Fan the picks for a grid of selection rules out to an executor
+
+        Each history the rules read is fetched once here and written to a
+        temporary snapshot that each worker reads once, so the data isn't
+        sent with every task. Rules with an incremental implementation are one
+        task each, since their state carries over between train end times;
+        other rules are one task per train end time. Results are gathered in
+        submission order, so they don't depend on scheduling.
+
+        Arguments:
+            executor (concurrent.futures.Executor)
+            bound_selection_rules (list of .selection_rules.BoundSelectionRule)
+            model_group_ids (list) The list of model group ids to consider
+            train_end_times (list) The train end times to pick for
+
+        Returns: (list) For each selection rule, the model group id chosen for
+            each of the train end times
+        """
+        snapshot_root = tempfile.mkdtemp(prefix='audition_history_')
+        try:
+            snapshots = dict()
+            # for each rule: the cache keys, the cached picks, and futures
+            # whose results are consecutive runs of the missing picks
+            pending = []
+            for bound_selection_rule in bound_selection_rules:
+                try:
+                    pickle.dumps(bound_selection_rule)
+                except (pickle.PicklingError, AttributeError, TypeError):
+                    local_picks = Future()
+                    local_picks.set_result(self.picks_for_rule(
+                        bound_selection_rule,
+                        model_group_ids,
+                        train_end_times
+                    ))
+                    pending.append((None, [None] * len(train_end_times), [local_picks]))
+                    continue
+                keys, cached_picks = self._cached_picks(
+                    bound_selection_rule,
+                    model_group_ids,
+                    train_end_times
+                )
+                missing_times = [
+                    train_end_time for train_end_time, pick in zip(train_end_times, cached_picks)
+                    if pick is None
+                ]
+                if not missing_times:
+                    pending.append((keys, cached_picks, []))
+                    continue
+                key = self._history_view_key(bound_selection_rule, model_group_ids)
+                if key not in snapshots:
+                    view = self._history_view(bound_selection_rule, model_group_ids)
+                    if isinstance(view, SlicedHistory):
+                        snapshots[key] = None
+                    else:
+                        snapshots[key] = tempfile.mkdtemp(dir=snapshot_root)
+                        view.save(snapshots[key])
+                if snapshots[key] is None:
+                    # too big to snapshot, so its slices are folded in this process
+                    local_picks = Future()
+                    local_picks.set_result(self._backtest(
+                        bound_selection_rule,
+                        model_group_ids,
+                        missing_times
+                    ))
+                    pending.append((keys, cached_picks, [local_picks]))
+                    continue
+                if bound_selection_rule.is_incremental:
+                    time_batches = [missing_times]
+                else:
+                    time_batches = [[train_end_time] for train_end_time in missing_times]
+                pending.append((keys, cached_picks, [
+                    executor.submit(
+                        picks_from_snapshot,
+                        snapshots[key],
+                        bound_selection_rule,
+                        time_batch,
+                        self.seed,
+                        self.memory_budget_mb
+                    )
+                    for time_batch in time_batches
+                ]))
+            results = []
+            for keys, cached_picks, futures in pending:
+                picks = self._fill_picks(
+                    cached_picks,
+                    [model_group_id for future in futures for model_group_id in future.result()]
+                )
+                self._store_picks(keys, cached_picks, picks)
+                results.append(picks)
+            return results
+        finally:
+            shutil.rmtree(snapshot_root, ignore_errors=True)
+
 
 class SelectionRulePlotter(object):
     """Plot selection rules
@@ -134,6 +791,9 @@ class SelectionRulePlotter(object):
 
     def regret_thresholds(self, regret_metric, regret_parameter):
         plot_min, plot_max = self.plot_bounds(regret_metric, regret_parameter)
+        return self._thresholds_within(plot_min, plot_max)
+
+    def _thresholds_within(self, plot_min, plot_max):
         regret_threshold_dist = self.regret_threshold_dist(plot_min, plot_max)
         return numpy.arange(plot_min, plot_max, regret_threshold_dist)
 
@@ -143,7 +803,9 @@ class SelectionRulePlotter(object):
         model_group_ids,
         train_end_times,
         regret_metric,
-        regret_parameter
+        regret_parameter,
+        regret_results=None,
+        bounds=None
     ):
         """Create a dataframe suitable for plotting selection rule regrets
 
@@ -158,30 +820,43 @@ class SelectionRulePlotter(object):
                 regrets against
             regret_parameter (string) The metric parameter (i.e. 100_abs) to
                 calculate regrets against
+            regret_results (.RegretResults, optional) Precomputed results covering
+                the given rules, model groups, and train end times. If not given,
+                the selection rules are simulated here
+            bounds (tuple, optional) The plot bounds for the regret metric, if
+                already computed
 
         Returns: (pandas.DataFrame) A dataframe with columns 'regret',
             'pct_of_time', and 'selection_rule'
         """
-        accumulator = list()
-        for selection_rule in bound_selection_rules:
-            regrets = [
-                result['dist_from_best_case_next_time'] for result in
-                self.selection_rule_picker.results_for_rule(
-                    selection_rule,
-                    model_group_ids,
-                    train_end_times,
-                    regret_metric,
-                    regret_parameter
-                )
-            ]
-            for regret_threshold in self.regret_thresholds(regret_metric, regret_parameter):
-                pct_of_time = numpy.mean([1 if regret < regret_threshold else 0 for regret in regrets])
-                accumulator.append({
-                    'regret': regret_threshold,
-                    'pct_of_time': pct_of_time,
-                    'selection_rule': selection_rule.descriptive_name,
-                })
-        return pandas.DataFrame.from_records(accumulator)
+        if regret_results is None:
+            regret_results = self.selection_rule_picker.regret_results(
+                bound_selection_rules,
+                model_group_ids,
+                train_end_times,
+                [{'metric': regret_metric, 'parameter': regret_parameter}]
+            )
+        metric_results = regret_results.for_metric(regret_metric, regret_parameter)
+        if bounds is None:
+            bounds = self.plot_bounds(regret_metric, regret_parameter)
+        regret_thresholds = self._thresholds_within(*bounds)
+        regrets_by_rule = metric_results.groupby('selection_rule')['regret']
+        selection_rule_names = [
+            selection_rule.descriptive_name for selection_rule in bound_selection_rules
+        ]
+        pct_of_time = [
+            ecdf(
+                regrets_by_rule.get_group(name) if name in regrets_by_rule.groups else [],
+                regret_thresholds,
+                strict=True
+            )
+            for name in selection_rule_names
+        ]
+        return pandas.DataFrame({
+            'regret': numpy.tile(regret_thresholds, len(selection_rule_names)),
+            'pct_of_time': numpy.concatenate(pct_of_time) if pct_of_time else [],
+            'selection_rule': numpy.repeat(selection_rule_names, len(regret_thresholds)),
+        }, columns=['regret', 'pct_of_time', 'selection_rule'])
 
     def plot_all_selection_rules(
         self,
@@ -189,7 +864,8 @@ class SelectionRulePlotter(object):
         model_group_ids,
         train_end_times,
         regret_metric,
-        regret_parameter
+        regret_parameter,
+        regret_results=None
     ):
         """Plot the regrets of all given selection rules
 
@@ -204,17 +880,35 @@ class SelectionRulePlotter(object):
                 regrets against
             regret_parameter (string) The metric parameter (i.e. 100_abs) to
                 calculate regrets against
+            regret_results (.RegretResults, optional) Precomputed results covering
+                the given rules, model groups, and train end times
         """
+        bounds = self.plot_bounds(regret_metric, regret_parameter)
         df_regrets = self.create_plot_dataframe(
             bound_selection_rules,
             model_group_ids,
             train_end_times,
             regret_metric,
-            regret_parameter
+            regret_parameter,
+            regret_results,
+            bounds
         )
+        self.plot_from_dataframe(regret_metric, regret_parameter, df_regrets, bounds)
+
+    @staticmethod
+    def plot_from_dataframe(regret_metric, regret_parameter, df_regrets, bounds, **plt_format_args):
+        """Plot selection rule regrets from a dataframe made by 'create_plot_dataframe'
+
+        Args:
+            regret_metric (string) The metric (i.e. precision@) regrets were calculated against
+            regret_parameter (string) The metric parameter (i.e. 100_abs) regrets
+                were calculated against
+            df_regrets (pandas.DataFrame) The plot data
+            bounds (tuple) The plot bounds for the regret metric
+            **plt_format_args -- formatting arguments passed through to plot_cats()
+        """
         cat_col = 'selection_rule'
         plt_title = 'Fraction of models X pp worse than best {} {} next time'.format(regret_metric, regret_parameter)
-        plot_min, plot_max = self.plot_bounds(regret_metric, regret_parameter)
 
         plot_cats(
             frame=df_regrets,
@@ -225,5 +919,6 @@ class SelectionRulePlotter(object):
             title=plt_title,
             x_label='distance from best {} next time'.format(regret_metric),
             y_label='fraction of models',
-            x_lim=self.plot_bounds(regret_metric, regret_parameter)
+            x_lim=bounds,
+            **plt_format_args
         )
@@ -23,7 +23,8 @@ class SelectionRulePerformancePlotter(object):
         regret_parameter,
         model_group_ids,
         train_end_times,
-        plot_type='regret'
+        plot_type='regret',
+        regret_results=None
     ):
         """Generate a selection rule performance plot for one metric
 
@@ -38,6 +39,8 @@ class SelectionRulePerformancePlotter(object):
             train_end_times (list of timestamps) The timestamps to include in
                 calculating the data
             plot_type (string) The plot type to show (either 'regret' or 'metric')
+            regret_results (audition.regrets.RegretResults, optional) Precomputed
+                results covering the given rules, model groups, and train end times
         """
         df = self.generate_plot_data(
             bound_selection_rules=bound_selection_rules,
@@ -45,6 +48,7 @@ class SelectionRulePerformancePlotter(object):
             train_end_times=train_end_times,
             regret_metric=regret_metric,
             regret_parameter=regret_parameter,
+            regret_results=regret_results,
         )
         if plot_type == 'regret':
             self.regret_plot_from_dataframe(
@@ -67,7 +71,8 @@ class SelectionRulePerformancePlotter(object):
         model_group_ids,
         train_end_times,
         regret_metric,
-        regret_parameter
+        regret_parameter,
+        regret_results=None
     ):
         """Create a dataframe suitable for plotting regrets over time
 
@@ -81,10 +86,23 @@ class SelectionRulePerformancePlotter(object):
             regret_metric (string) -- model evaluation metric, such as 'precision@'
             regret_parameter (string) -- model evaluation metric parameter,
                 such as '300_abs'
+            regret_results (audition.regrets.RegretResults, optional) Precomputed
+                results covering the given rules, model groups, and train end times.
+                If not given, the selection rules are simulated here
 
         Returns: (pandas.DataFrame) A dataframe with columns 'regret',
             'train_end_time', and 'selection_rule'
         """
+        if regret_results is not None:
+            rule_names = [
+                selection_rule.descriptive_name for selection_rule in bound_selection_rules
+            ]
+            df = regret_results.for_metric(regret_metric, regret_parameter)
+            return df.loc[
+                df['selection_rule'].isin(rule_names),
+                ['train_end_time', 'regret', 'selection_rule', 'raw_value_next_time']
+            ].reset_index(drop=True)
+
         accumulator = list()
         for selection_rule in bound_selection_rules:
             results = self.selection_rule_picker.results_for_rule(
@@ -103,7 +121,8 @@ class SelectionRulePerformancePlotter(object):
                 })
         return pandas.DataFrame.from_records(accumulator)
 
-    def regret_plot_from_dataframe(self, metric, parameter, df, **plt_format_args):
+    @staticmethod
+    def regret_plot_from_dataframe(metric, parameter, df, **plt_format_args):
         """Generate a regret-over-time plot from a given dataframe
 
         Args:
@@ -128,7 +147,8 @@ class SelectionRulePerformancePlotter(object):
             **plt_format_args
         )
 
-    def raw_next_time_plot_from_dataframe(self, metric, parameter, df, **plt_format_args):
+    @staticmethod
+    def raw_next_time_plot_from_dataframe(metric, parameter, df, **plt_format_args):
         """Generate a 'raw-value-next-time' plot from a given dataframe
 
         Args:
@@ -1,9 +1,104 @@
 import logging
 from numpy import exp, log, average
 from audition.metric_directionality import greater_is_better, best_in_series, idxbest
+from audition.utils import random_state
+from audition.incremental import IncrementalRandomModelGroup, \
+    IncrementalBestCurrentValue, \
+    IncrementalBestAverageValue, \
+    IncrementalLowestMetricVariance, \
+    IncrementalMostFrequentBestDist, \
+    IncrementalBestAverageTwoMetrics, \
+    IncrementalBestAvgVarPenalized, \
+    IncrementalBestAvgRecencyWeight
 import inspect
 
 
+SELECTION_RULES = {}
+
+# columns every selection rule can rely on, as the picker needs them to pick by time
+BASE_COLUMNS = ['model_group_id', 'train_end_time', 'metric', 'parameter']
+
+
+class SelectionRuleRequirements(object):
+    """The data a selection rule needs from the distance table
+
+    Args:
+        metric_args (list of tuples, optional) Pairs of argument names that
+            hold the metric and parameter a rule reads, e.g. [('metric', 'parameter')].
+            None means the rule may read any metric
+        columns (list, optional) Columns read beyond BASE_COLUMNS.
+            None means the rule may read any column
+        incremental (class, optional) An audition.incremental.IncrementalSelectionRule
+            subclass implementing the same rule
+        mutates_input (boolean, optional) Whether the rule modifies the dataframe
+            it is given, and so needs its own copy. Assumed for unregistered rules
+    """
+    def __init__(self, metric_args=None, columns=None, incremental=None, mutates_input=True):
+        self.metric_args = metric_args
+        self.columns = columns
+        self.incremental = incremental
+        self.mutates_input = mutates_input
+
+    def metrics(self, args):
+        """The metric/parameter combinations needed given the bound arguments
+
+        Args:
+            args (dict) The arguments the rule is bound with
+
+        Returns: (list) of (metric, parameter) tuples, or None if any may be needed
+        """
+        if not self.metric_args:
+            return None
+        return [(args[metric], args[parameter]) for metric, parameter in self.metric_args]
+
+    def all_columns(self):
+        """The columns needed, or None if any may be needed"""
+        if self.columns is None:
+            return None
+        return BASE_COLUMNS + [column for column in self.columns if column not in BASE_COLUMNS]
+
+
+def register_selection_rule(
+    metric_args=(('metric', 'parameter'),),
+    columns=('raw_value',),
+    incremental=None,
+    mutates_input=False,
+    name=None
+):
+    """Register a function as a selection rule, usable by name in selection rule grids
+
+    The declared requirements let the SelectionRulePicker fetch only the
+    rows and columns the rule reads, and use the incremental implementation
+    when simulating the rule over many train end times.
+
+    Args:
+        metric_args (sequence of tuples) Pairs of argument names that hold
+            the metrics and parameters the rule reads. Pass None if the rule
+            may read rows for any metric
+        columns (sequence) Columns read beyond model_group_id, train_end_time,
+            metric and parameter. Pass None if the rule may read any column
+        incremental (class, optional) An audition.incremental.IncrementalSelectionRule
+            subclass implementing the same rule
+        mutates_input (boolean, optional) Whether the rule modifies the dataframe
+            it is given. Rules that do are given a copy, the others a shared view
+        name (string, optional) The name to register under. Defaults to the
+            function's name
+
+    Returns: (function) a decorator registering the function
+    """
+    def register(function):
+        function.selection_rule_requirements = SelectionRuleRequirements(
+            metric_args=list(metric_args) if metric_args is not None else None,
+            columns=list(columns) if columns is not None else None,
+            incremental=incremental,
+            mutates_input=mutates_input,
+        )
+        SELECTION_RULES[name or function.__name__] = function
+        return function
+    return register
+
+
+@register_selection_rule(metric_args=(), columns=(), incremental=IncrementalRandomModelGroup)
 def random_model_group(df, train_end_time):
     """Pick a random model group (as a baseline)
 
@@ -19,7 +114,10 @@ def random_model_group(df, train_end_time):
                 below_best
     Returns: (int) the model group id to select, with highest current raw metric value
     """
-    return df['model_group_id'].drop_duplicates().sample(frac=1).tolist()[0]
+    return df['model_group_id']\
+        .drop_duplicates()\
+        .sample(frac=1, random_state=random_state())\
+        .tolist()[0]
 
 
 def _mg_best_avg_by(df, value_col, metric):
@@ -31,11 +129,13 @@ def _mg_best_avg_by(df, value_col, metric):
         metric (str) the name of the column
     """
     return getattr(
-        df.groupby(['model_group_id'])[value_col].mean().sample(frac=1),
+        df.groupby(['model_group_id'])[value_col].mean()
+        .sample(frac=1, random_state=random_state()),
         idxbest(metric)
     )()
 
 
+@register_selection_rule(incremental=IncrementalBestCurrentValue)
 def best_current_value(df, train_end_time, metric, parameter):
     """Pick the model group with the best current metric value
 
@@ -64,10 +164,11 @@ def best_current_value(df, train_end_time, metric, parameter):
     best_raw_value = getattr(curr_df['raw_value'], best_in_series(metric))()
     return curr_df\
         .loc[curr_df['raw_value'] == best_raw_value, 'model_group_id']\
-        .sample(frac=1)\
+        .sample(frac=1, random_state=random_state())\
         .tolist()[0]
 
 
+@register_selection_rule(incremental=IncrementalBestAverageValue)
 def best_average_value(df, train_end_time, metric, parameter):
     """Pick the model with the highest average metric value so far
 
@@ -95,6 +196,7 @@ def best_average_value(df, train_end_time, metric, parameter):
     return _mg_best_avg_by(met_df, 'raw_value', metric)
   
   
+@register_selection_rule(incremental=IncrementalLowestMetricVariance)
 def lowest_metric_variance(df, train_end_time, metric, parameter):
     """Pick the model with the lowest metric variance so far
 
@@ -127,7 +229,10 @@ def lowest_metric_variance(df, train_end_time, metric, parameter):
         logging.info("Null metric variances for {} {} at {}; picking at random"\
             .format(metric, parameter, train_end_time)
             )
-        return df['model_group_id'].drop_duplicates().sample(frac=1).tolist()[0]
+        return df['model_group_id']\
+            .drop_duplicates()\
+            .sample(frac=1, random_state=random_state())\
+            .tolist()[0]
     elif met_df.isnull().sum() > 0:
         # the variances should be all null or no nulls, a mix shouldn't be possible
         # since we should have the same number of observations for every model group
@@ -137,9 +242,13 @@ def lowest_metric_variance(df, train_end_time, metric, parameter):
             )
 
     # sample(frac=1) to shuffle rows so we don't accidentally introduce bias in breaking ties
-    return met_df.sample(frac=1).idxmin()
+    return met_df.sample(frac=1, random_state=random_state()).idxmin()
 
 
+@register_selection_rule(
+    columns=('dist_from_best_case',),
+    incremental=IncrementalMostFrequentBestDist
+)
 def most_frequent_best_dist(df, train_end_time, metric, parameter, dist_from_best_case):
     """Pick the model that is most frequently within `dist_from_best_case` from the
     best-performing model group across test sets so far
@@ -167,9 +276,16 @@ def most_frequent_best_dist(df, train_end_time, metric, parameter, dist_from_bes
             ]
     met_df['within_dist'] = (df['dist_from_best_case'] <= dist_from_best_case).astype('int')
     # sample(frac=1) to shuffle rows so we don't accidentally introduce bias in breaking ties
-    return met_df.groupby(['model_group_id'])['within_dist'].mean().sample(frac=1).idxmax()
+    return met_df.groupby(['model_group_id'])['within_dist']\
+        .mean()\
+        .sample(frac=1, random_state=random_state())\
+        .idxmax()
 
 
+@register_selection_rule(
+    metric_args=(('metric1', 'parameter1'), ('metric2', 'parameter2')),
+    incremental=IncrementalBestAverageTwoMetrics
+)
 def best_average_two_metrics(
     df,
     train_end_time,
@@ -243,6 +359,7 @@ def best_average_two_metrics(
     return _mg_best_avg_by(met_df_wt, 'weighted_raw', metric1)
 
 
+@register_selection_rule(incremental=IncrementalBestAvgVarPenalized)
 def best_avg_var_penalized(df, train_end_time, metric, parameter, stdev_penalty):
     """Pick the model with the highest average metric value so far, penalized
     for relative variance as:
@@ -285,7 +402,7 @@ def best_avg_var_penalized(df, train_end_time, metric, parameter, stdev_penalty)
             .format(metric, parameter, train_end_time)
             )
         return getattr(
-          met_df_grp['raw_avg'].sample(frac=1),
+          met_df_grp['raw_avg'].sample(frac=1, random_state=random_state()),
           idxbest(metric)
         )()
     elif met_df_grp['raw_stdev'].isnull().sum() > 0:
@@ -301,11 +418,12 @@ def best_avg_var_penalized(df, train_end_time, metric, parameter, stdev_penalty)
 
     # sample(frac=1) to shuffle rows so we don't accidentally introduce bias in breaking ties
     return getattr(
-        met_df_grp['penalized_avg'].sample(frac=1),
+        met_df_grp['penalized_avg'].sample(frac=1, random_state=random_state()),
         idxbest(metric)
     )() 
 
 
+@register_selection_rule(incremental=IncrementalBestAvgRecencyWeight, mutates_input=True)
 def best_avg_recency_weight(df, train_end_time, metric, parameter, curr_weight, decay_type):
     """Pick the model with the highest average metric value so far, penalized
     for relative variance as:
@@ -362,23 +480,13 @@ def best_avg_recency_weight(df, train_end_time, metric, parameter, curr_weight,
             ]
     # sample(frac=1) to shuffle rows so we don't accidentally introduce bias in breaking ties
     return getattr(
-        met_df.groupby(['model_group_id']).aggregate({'raw_value': wm}).sample(frac=1),
+        met_df.groupby(['model_group_id'])
+        .aggregate({'raw_value': wm})
+        .sample(frac=1, random_state=random_state()),
         idxbest(metric)
     )()[0]
 
 
-SELECTION_RULES = {
-    'random_model_group': random_model_group,
-    'best_current_value': best_current_value,
-    'best_average_value': best_average_value,
-    'lowest_metric_variance': lowest_metric_variance,
-    'most_frequent_best_dist': most_frequent_best_dist,
-    'best_average_two_metrics': best_average_two_metrics,
-    'best_avg_var_penalized': best_avg_var_penalized,
-    'best_avg_recency_weight': best_avg_recency_weight    
-}
-
-
 class BoundSelectionRule(object):
     """A selection rule bound with a set of arguments
 
@@ -408,6 +516,49 @@ class BoundSelectionRule(object):
             self._function = SELECTION_RULES[self.function_name]
         return self._function
 
+    @property
+    def requirements(self):
+        """The data requirements declared when the rule was registered
+
+        Functions that were not registered get requirements covering
+        every row and column.
+
+        Returns: (SelectionRuleRequirements)
+        """
+        return getattr(self.function, 'selection_rule_requirements', SelectionRuleRequirements())
+
+    @property
+    def required_metrics(self):
+        """The metric/parameter combinations the rule reads, or None if unknown"""
+        return self.requirements.metrics(self.args)
+
+    @property
+    def required_columns(self):
+        """The columns the rule reads, or None if unknown"""
+        return self.requirements.all_columns()
+
+    @property
+    def is_incremental(self):
+        """Whether the rule has an incremental implementation"""
+        return self.requirements.incremental is not None
+
+    @property
+    def has_independent_scores(self):
+        """Whether the rule's incremental implementation scores each model group
+        from that group's own rows alone, so that adding or removing other
+        candidates leaves its score unchanged"""
+        return self.is_incremental and self.requirements.incremental.independent_scores
+
+    @property
+    def incremental_rule(self):
+        """The incremental implementation of the rule, bound with its arguments
+
+        Returns: (audition.incremental.IncrementalSelectionRule)
+        """
+        if not self.is_incremental:
+            raise ValueError('Selection rule {} has no incremental implementation'.format(self))
+        return self.requirements.incremental(**(self.args))
+
     @property
     def descriptive_name(self):
         if not self._descriptive_name:
@@ -443,3 +594,43 @@ class BoundSelectionRule(object):
         Returns: (int) a model group id
         """
         return self.function(dataframe, train_end_time, **(self.args))
+
+    def initial_state(self):
+        """Create an empty state for incremental picking
+
+        Returns: (dict) a state to pass to 'update_state' and 'pick_from_state'
+        """
+        return self.incremental_rule.initial_state()
+
+    def update_state(self, state, dataframe, train_end_time):
+        """Fold the rows for one train end time into an incremental state
+
+        Args:
+            state (dict) A state created by 'initial_state'
+            dataframe (pandas.DataFrame) Rows for the given train end time
+            train_end_time (timestamp) The train end time to add
+
+        Returns: (dict) the updated state
+        """
+        return self.incremental_rule.update(state, dataframe, train_end_time)
+
+    def scores_from_state(self, state):
+        """Score each model group in an incremental state
+
+        Args:
+            state (dict) A state created by 'initial_state'
+
+        Returns: (pandas.Series) scores indexed by model group id
+        """
+        return self.incremental_rule.scores(state)
+
+    def pick_from_state(self, state, train_end_time):
+        """Run the selection rule from an incremental state
+
+        Args:
+            state (dict) A state updated through the given train end time
+            train_end_time (timestamp) Current train end time
+
+        Returns: (int) a model group id
+        """
+        return self.incremental_rule.pick(state, train_end_time)
@@ -1,6 +1,8 @@
+import copy
 import logging
 
 from audition.metric_directionality import is_better_operator
+from audition.instrumentation import stage
 
 
 def _past_threshold(df, metric_filter):
@@ -27,7 +29,8 @@ class ModelGroupThresholder(object):
         distance_from_best_table,
         train_end_times,
         initial_model_group_ids,
-        initial_metric_filters
+        initial_metric_filters,
+        instrumentation=None
     ):
         """Iteratively narrow down a list of model groups by changing thresholds
         for max below best model and minimum absolute value with respect to
@@ -39,12 +42,21 @@ class ModelGroupThresholder(object):
             train_end_times (list) The set of train end times to consider during iteration
             initial_model_group_ids (list) The initial list of model group ids to
                 narrow down
+            instrumentation (audition.instrumentation.Instrumentation, optional)
+                Measures each thresholding pass
 
         """
         self.distance_from_best_table = distance_from_best_table
         self.train_end_times = train_end_times
         self._initial_model_group_ids = initial_model_group_ids
-        self._metric_filters = initial_metric_filters
+        self._metric_filters = copy.deepcopy(initial_metric_filters)
+        self._model_group_ids = None
+        self.instrumentation = instrumentation
+
+    def clear_cache(self):
+        """Forget the model groups passing the current filters, e.g. after the
+        distance table has been repopulated"""
+        self._model_group_ids = None
 
     def _filter_model_groups(self, df, filter_func):
         """Filter model groups by ensuring each of their metrics meets the given
@@ -142,10 +154,23 @@ class ModelGroupThresholder(object):
                 max_below_best (float) The maximum value that the given metric
                     can be below the best for a given train end time
                 min_value (float) The minimum value that the given metric can be
+
+        The filters are copied, so that editing them in place and passing them
+        again is seen as a change.
         """
         if new_metric_filters != self._metric_filters:
-            self._metric_filters = new_metric_filters
+            self._metric_filters = copy.deepcopy(new_metric_filters)
+            self._model_group_ids = None
 
     @property
     def model_group_ids(self):
-        return self.model_groups_passing_rules()
+        """The model groups passing the current filters, computed once per
+        filter configuration
+
+        Returns: (set) The passing model group ids
+        """
+        if self._model_group_ids is None:
+            with stage(self.instrumentation, 'thresholding') as record:
+                self._model_group_ids = self.model_groups_passing_rules()
+                record['rows'] = len(self._model_group_ids)
+        return set(self._model_group_ids)
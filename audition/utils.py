@@ -1,6 +1,63 @@
+import contextlib
+import threading
+
+import numpy
+
+# the generator selection rules in this thread break ties with
+_tie_breaking = threading.local()
+
+
 def make_list(a):
     return [a] if not isinstance(a, list) else a
 
 
 def str_in_sql(values):
     return ','.join(map(lambda x: "'{}'".format(x), values))
+
+
+def ecdf(values, thresholds, strict=False):
+    """The fraction of values at or below each of a set of thresholds
+
+    The values are sorted once and all thresholds are located with a
+    single binary search, rather than comparing every value to every threshold.
+
+    Args:
+        values (array-like) The observed values. Missing values count
+            towards the total but are never below a threshold
+        thresholds (array-like) The thresholds to evaluate the distribution at
+        strict (boolean, optional) Count values strictly below each threshold
+            instead of at or below it
+
+    Returns: (numpy.ndarray) one fraction per threshold, NaN if there are no values
+    """
+    values = numpy.sort(numpy.asarray(values, dtype=float))
+    thresholds = numpy.asarray(thresholds, dtype=float)
+    if len(values) == 0:
+        return numpy.full(len(thresholds), numpy.nan)
+    side = 'left' if strict else 'right'
+    return numpy.searchsorted(values, thresholds, side=side) / float(len(values))
+
+
+def random_state():
+    """The random number generator selection rules should break ties with
+
+    Returns: (numpy.random.RandomState) the generator set by 'tie_breaking'
+        in this thread, or None to use numpy's global one
+    """
+    return getattr(_tie_breaking, 'random_state', None)
+
+
+@contextlib.contextmanager
+def tie_breaking(generator):
+    """Break ties in selection rules run in this thread with a given generator
+
+    Args:
+        generator (numpy.random.RandomState or None) The generator, passed
+            as 'random_state' to the rules' shuffles. None uses numpy's global one
+    """
+    previous = random_state()
+    _tie_breaking.random_state = generator
+    try:
+        yield
+    finally:
+        _tie_breaking.random_state = previous
@@ -0,0 +1,319 @@
+"""Time audition's hot paths on a synthetic results schema
+
+Run against a temporary Postgres, or one given with --db-url:
+
+    python -m benchmarks.benchmark --model-groups 10000 --train-end-times 60 --metrics 20 \
+        --output benchmark.json
+
+The timings are written as JSON, with the sizes and the git commit, so runs
+can be compared across commits.
+"""
+import argparse
+from datetime import datetime
+import json
+import logging
+import platform
+import subprocess
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from audition.distance_from_best import DistanceFromBestTable, BestDistancePlotter
+from audition.instrumentation import Instrumentation, stage
+from audition.model_group_performance import ModelGroupPerformancePlotter
+from audition.regrets import SelectionRulePicker, SelectionRulePlotter
+from audition.selection_rule_grid import make_selection_rule_grid
+from audition.selection_rule_performance import SelectionRulePerformancePlotter
+from audition.thresholding import ModelGroupThresholder
+
+FIRST_TRAIN_END_TIME = datetime(2000, 1, 1)
+
+
+def synthetic_metrics(num_metrics):
+    """Alternating precision and recall at increasing list sizes
+
+    Returns: (list) dicts with the keys 'metric' and 'parameter'
+    """
+    return [
+        {
+            'metric': ('precision@', 'recall@')[i % 2],
+            'parameter': '{}_abs'.format(100 * (i // 2 + 1)),
+        }
+        for i in range(num_metrics)
+    ]
+
+
+def synthetic_train_end_times(num_train_end_times):
+    """Monthly train end times
+
+    Returns: (list) of datetimes
+    """
+    return list(pd.date_range(
+        FIRST_TRAIN_END_TIME,
+        periods=num_train_end_times,
+        freq='MS'
+    ).to_pydatetime())
+
+
+def generate_results(db_engine, num_model_groups, num_train_end_times, num_metrics, seed=0.5):
+    """Write a synthetic results schema: model groups with a model for each
+    train end time, evaluated on each metric
+
+    Each model group has an underlying skill, so some model groups are
+    consistently better than others, plus noise at each time. The rows are
+    generated by the database, so large schemas are quick to create.
+
+    Args:
+        db_engine (sqlalchemy.engine) A database with an empty results schema
+        num_model_groups (int)
+        num_train_end_times (int)
+        num_metrics (int)
+        seed (float, optional) Seeds the database's random number generator, between -1 and 1
+
+    Returns: (list, list, list) the model group ids, train end times and metrics
+    """
+    metrics = synthetic_metrics(num_metrics)
+    with db_engine.begin() as connection:
+        connection.execute('select setseed(%(seed)s)', {'seed': seed})
+        connection.execute('''
+            insert into results.model_groups
+                (model_group_id, model_type, model_parameters, feature_list)
+            select g, 'classifier type ' || mod(g, 10), '{{}}'::jsonb, array['feature']
+            from generate_series(1, {num_model_groups}) g
+        '''.format(num_model_groups=num_model_groups))
+        connection.execute('''
+            insert into results.models (model_id, model_group_id, model_hash, train_end_time)
+            select
+                (g - 1) * {num_train_end_times} + t,
+                g,
+                md5(g || '-' || t),
+                %(first_train_end_time)s::timestamp + (t - 1) * interval '1 month'
+            from generate_series(1, {num_model_groups}) g,
+                generate_series(1, {num_train_end_times}) t
+        '''.format(num_model_groups=num_model_groups, num_train_end_times=num_train_end_times),
+            {'first_train_end_time': FIRST_TRAIN_END_TIME})
+        connection.execute('''
+            insert into results.evaluations (
+                model_id, evaluation_start_time, evaluation_end_time, as_of_date_frequency,
+                metric, parameter, value
+            )
+            select
+                m.model_id,
+                m.train_end_time,
+                m.train_end_time + interval '1 month',
+                interval '1 day',
+                metrics.metric,
+                metrics.parameter,
+                least(1, mod(m.model_group_id, 97) / 194.0 + random() / 2)
+            from results.models m
+            cross join (values {metrics}) metrics (metric, parameter)
+        '''.format(metrics=','.join(
+            "('{}', '{}')".format(metric['metric'], metric['parameter']) for metric in metrics
+        )))
+    return (
+        list(range(1, num_model_groups + 1)),
+        synthetic_train_end_times(num_train_end_times),
+        metrics,
+    )
+
+
+def benchmark_rule_grid(metrics):
+    """A grid with one instance of each parameterized selection rule"""
+    metric, parameter = metrics[0]['metric'], metrics[0]['parameter']
+    metric2, parameter2 = metrics[-1]['metric'], metrics[-1]['parameter']
+    return [{
+        'shared_parameters': [{'metric': metric, 'parameter': parameter}],
+        'selection_rules': [
+            {'name': 'best_current_value'},
+            {'name': 'best_average_value'},
+            {'name': 'lowest_metric_variance'},
+            {'name': 'most_frequent_best_dist', 'dist_from_best_case': [0.05]},
+            {'name': 'best_avg_var_penalized', 'stdev_penalty': [0.5]},
+            {'name': 'best_avg_recency_weight', 'curr_weight': [1.5], 'decay_type': ['linear']},
+        ]
+    }, {
+        'shared_parameters': [{'metric1': metric, 'parameter1': parameter}],
+        'selection_rules': [{
+            'name': 'best_average_two_metrics',
+            'metric2': [metric2],
+            'parameter2': [parameter2],
+            'metric1_weight': [0.5],
+        }]
+    }]
+
+
+def run_benchmarks(db_engine, num_model_groups, num_train_end_times, num_metrics):
+    """Generate a synthetic results schema and time each of audition's stages on it
+
+    Args:
+        db_engine (sqlalchemy.engine) A database with an empty results schema
+        num_model_groups (int)
+        num_train_end_times (int)
+        num_metrics (int)
+
+    Returns: (list) a record per benchmark, as made by audition.instrumentation.Instrumentation,
+        with the benchmark's name as the stage
+    """
+    instrumentation = Instrumentation()
+    instrumentation.attach(db_engine)
+
+    try:
+        with stage(instrumentation, 'generate_results') as record:
+            model_group_ids, train_end_times, metrics = generate_results(
+                db_engine,
+                num_model_groups,
+                num_train_end_times,
+                num_metrics
+            )
+            record['rows'] = num_model_groups * num_train_end_times * num_metrics
+
+        table = DistanceFromBestTable(
+            db_engine,
+            models_table='models',
+            distance_table='benchmark_distance'
+        )
+        with stage(instrumentation, 'create_and_populate') as record:
+            table.create_and_populate(model_group_ids, train_end_times, metrics)
+            record['rows'] = sum(summary['count'] for summary in table.metric_summaries.values())
+
+        with stage(instrumentation, 'as_dataframe') as record:
+            record['rows'] = len(table.as_dataframe(model_group_ids))
+
+        thresholder = ModelGroupThresholder(
+            distance_from_best_table=table,
+            train_end_times=train_end_times,
+            initial_model_group_ids=model_group_ids,
+            initial_metric_filters=[
+                dict(metric, max_from_best=0.5, threshold_value=0.1)
+                for metric in metrics[:2]
+            ]
+        )
+        with stage(instrumentation, 'thresholding') as record:
+            record['rows'] = len(thresholder.model_groups_passing_rules())
+
+        rules = make_selection_rule_grid(benchmark_rule_grid(metrics))
+        backtest_times = train_end_times[:-1]
+        for rule in rules:
+            # a fresh picker, so each rule pays for its own fetch
+            picker = SelectionRulePicker(table)
+            with stage(instrumentation, 'selection_rule', rule=rule.descriptive_name) as record:
+                record['rows'] = len(picker.picks_for_rule(rule, model_group_ids, backtest_times))
+
+        picker = SelectionRulePicker(table)
+        regret_metrics = metrics[:2]
+        with stage(instrumentation, 'grid_backtest', rules=len(rules)) as record:
+            regret_results = picker.regret_results(
+                rules,
+                model_group_ids,
+                backtest_times,
+                regret_metrics
+            )
+            record['rows'] = len(regret_results.dataframe)
+
+        best_distance_plotter = BestDistancePlotter(table, client_side_ecdf=True)
+        with stage(instrumentation, 'plot_data', plot='best_distance') as record:
+            distances = best_distance_plotter.fetch_distances(
+                metrics,
+                model_group_ids,
+                train_end_times
+            )
+            record['rows'] = sum(
+                len(best_distance_plotter.ecdf_plot_data(
+                    distances,
+                    metric['metric'],
+                    metric['parameter']
+                ))
+                for metric in metrics
+            )
+        with stage(instrumentation, 'plot_data', plot='performance') as record:
+            record['rows'] = len(ModelGroupPerformancePlotter(table).fetch_plot_data(
+                metrics,
+                model_group_ids,
+                train_end_times
+            ))
+        common_kwargs = dict(
+            bound_selection_rules=rules,
+            model_group_ids=model_group_ids,
+            train_end_times=backtest_times,
+            regret_metric=regret_metrics[0]['metric'],
+            regret_parameter=regret_metrics[0]['parameter'],
+            regret_results=regret_results,
+        )
+        with stage(instrumentation, 'plot_data', plot='regret_cdf') as record:
+            record['rows'] = len(
+                SelectionRulePlotter(picker).create_plot_dataframe(**common_kwargs)
+            )
+        with stage(instrumentation, 'plot_data', plot='regret_over_time') as record:
+            record['rows'] = len(
+                SelectionRulePerformancePlotter(picker).generate_plot_data(**common_kwargs)
+            )
+    finally:
+        instrumentation.close()
+
+    return instrumentation.report()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Time audition on a synthetic results schema')
+    parser.add_argument('--model-groups', type=int, default=200)
+    parser.add_argument('--train-end-times', type=int, default=12)
+    parser.add_argument('--metrics', type=int, default=4)
+    parser.add_argument(
+        '--db-url',
+        help='an empty database to use instead of a temporary Postgres. '
+        'Its results schema is overwritten'
+    )
+    parser.add_argument('--output', help='where to write the timings, as JSON')
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+
+    def run(db_url):
+        from catwalk.db import ensure_db
+        db_engine = create_engine(db_url)
+        ensure_db(db_engine)
+        return run_benchmarks(db_engine, args.model_groups, args.train_end_times, args.metrics)
+
+    if args.db_url:
+        records = run(args.db_url)
+    else:
+        import testing.postgresql
+        with testing.postgresql.Postgresql() as postgresql:
+            records = run(postgresql.url())
+
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'run_at': datetime.now().isoformat(),
+        'sizes': {
+            'model_groups': args.model_groups,
+            'train_end_times': args.train_end_times,
+            'metrics': args.metrics,
+        },
+        'benchmarks': records,
+    }
+    for record in records:
+        print('{:<20} {:<50} {:>10.3f}s {:>10} rows {:>6} queries'.format(
+            record['stage'],
+            json.dumps(record['labels']),
+            record['seconds'],
+            record['rows'],
+            record['queries']
+        ))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -33,6 +33,9 @@ setup(
         'audition',
     ],
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['audition=audition.cli:main'],
+    },
     install_requires=requirements,
     license=license,
     zip_safe=False,
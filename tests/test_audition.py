@@ -1,62 +1,18 @@
 from audition import Auditioner
 from sqlalchemy import create_engine
 import testing.postgresql
-from results_schema.factories import EvaluationFactory,\
-    ModelFactory,\
-    ModelGroupFactory,\
-    init_engine,\
-    session
-from catwalk.db import ensure_db
-import factory
-from datetime import date, datetime
+from tests.utils import create_sample_results
 import tempfile
+import os
 import yaml
+from unittest.mock import patch
 
 
 def test_Auditioner():
     with testing.postgresql.Postgresql() as postgresql:
         db_engine = create_engine(postgresql.url())
-        ensure_db(db_engine)
-        init_engine(db_engine)
-        # set up data, randomly generated by the factories but conforming
-        # generally to what we expect results schema data to look like
         num_model_groups = 10
-        model_types = [
-            'classifier type {}'.format(i)
-            for i in range(0, num_model_groups)
-        ]
-        model_groups = [
-            ModelGroupFactory(model_type=model_type)
-            for model_type in model_types
-        ]
-        train_end_times = [
-            datetime(2013, 1, 1),
-            datetime(2014, 1, 1),
-            datetime(2015, 1, 1),
-            datetime(2016, 1, 1),
-        ]
-        models = [
-            ModelFactory(model_group_rel=model_group, train_end_time=train_end_time)
-            for model_group in model_groups
-            for train_end_time in train_end_times
-        ]
-        metrics = [
-            ('precision@', '100_abs'),
-            ('recall@', '100_abs'),
-            ('precision@', '50_abs'),
-            ('recall@', '50_abs'),
-            ('fpr@', '10_pct'),
-        ]
-
-        class ImmediateEvalFactory(EvaluationFactory):
-            evaluation_start_time = factory.LazyAttribute(lambda o: o.model_rel.train_end_time)
-
-        _ = [
-            ImmediateEvalFactory(model_rel=model, metric=metric, parameter=parameter)
-            for metric, parameter in metrics
-            for model in models
-        ]
-        session.commit()
+        model_group_ids, train_end_times = create_sample_results(db_engine, num_model_groups)
 
         # define a very loose filtering that should admit all model groups
         no_filtering = [
@@ -73,7 +29,6 @@ def test_Auditioner():
                 'threshold_value': 0.0
             }
         ]
-        model_group_ids = [mg.model_group_id for mg in model_groups]
         auditioner = Auditioner(
             db_engine,
             model_group_ids,
@@ -135,7 +90,36 @@ def test_Auditioner():
             ]
         }]
         auditioner.register_selection_rule_grid(rule_grid, plot=False)
-        final_model_group_ids = auditioner.selection_rule_model_group_ids
+        picker = auditioner.selection_rule_picker
+        with patch.object(
+            picker,
+            'model_group_from_rule',
+            wraps=picker.model_group_from_rule
+        ) as pick_patch:
+            final_model_group_ids = auditioner.selection_rule_model_group_ids
+            # the picks are reused until the rules or thresholded model groups change
+            assert auditioner.selection_rule_model_group_ids == final_model_group_ids
+            assert pick_patch.call_count == len(auditioner.selection_rules)
+
+        # the regrets are computed once for all rules and metrics, and reused
+        # until the configuration changes
+        regret_results = auditioner.regret_results
+        assert regret_results is auditioner.regret_results
+        assert len(regret_results.dataframe) == \
+            len(auditioner.selection_rules) * (len(train_end_times) - 1) * len(auditioner.metrics)
+        auditioner.plot_selection_rules()
+
+        # all plots can be written to files instead, in parallel
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest = auditioner.render_plots(output_dir, formats=['png', 'svg'])
+            assert len(manifest) == 5 * len(auditioner.metrics)
+            assert sorted(set(entry['plot'] for entry in manifest)) == [
+                'best_distance', 'metric_next_time', 'performance', 'regret_cdf', 'regret_over_time'
+            ]
+            for entry in manifest:
+                assert [path.split('.')[-1] for path in entry['paths']] == ['png', 'svg']
+                assert all(os.path.getsize(path) > 0 for path in entry['paths'])
+                assert entry['seconds'] >= 0
 
         # we expect the result to be a mapping of selection rule name to model group id
         assert isinstance(final_model_group_ids, dict)
@@ -153,3 +137,70 @@ def test_Auditioner():
             auditioner.write_tyra_config(tf.name)
             assert sorted(yaml.load(tf)['selection_rule_model_groups'].keys()) == \
                 sorted(final_model_group_ids.keys())
+
+
+def test_Auditioner_lazy():
+    with testing.postgresql.Postgresql() as postgresql:
+        db_engine = create_engine(postgresql.url())
+        model_group_ids, train_end_times = create_sample_results(db_engine, 3)
+        metric_filters = [{
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'max_from_best': 1.0,
+            'threshold_value': 0.0
+        }]
+        records = []
+        auditioner = Auditioner(
+            db_engine,
+            model_group_ids,
+            train_end_times,
+            metric_filters,
+            lazy=True,
+            hooks=[records.append]
+        )
+        # nothing is computed until the data is needed
+        assert db_engine.execute("select to_regclass('best_distance')").scalar() is None
+        assert auditioner._best_distance_plotter is None
+        assert auditioner.stage_report == []
+        assert sorted(auditioner.thresholded_model_group_ids) == sorted(model_group_ids)
+        stages = [record['stage'] for record in auditioner.stage_report]
+        assert stages[0] == 'population'
+        assert stages[-1] == 'thresholding'
+        assert 'as_dataframe' in stages
+        assert records == auditioner.stage_report
+        population = auditioner.stage_report[0]
+        assert population['rows'] == len(model_group_ids) * len(train_end_times)
+        assert population['queries'] > 0
+        assert db_engine.execute("select to_regclass('best_distance')").scalar() is not None
+        assert auditioner.best_distance_plotter is auditioner.best_distance_plotter
+        assert auditioner.populate().done()
+
+
+def test_Auditioner_background():
+    with testing.postgresql.Postgresql() as postgresql:
+        db_engine = create_engine(postgresql.url())
+        model_group_ids, train_end_times = create_sample_results(db_engine, 3)
+        metric_filters = [{
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'max_from_best': 1.0,
+            'threshold_value': 0.0
+        }]
+        auditioner = Auditioner(
+            db_engine,
+            model_group_ids,
+            train_end_times,
+            metric_filters,
+            background=True
+        )
+        population = auditioner.populate()
+        # configuration can happen while the table is populated
+        auditioner.register_selection_rule_grid([{
+            'shared_parameters': [{'metric': 'precision@', 'parameter': '100_abs'}],
+            'selection_rules': [{'name': 'best_current_value'}]
+        }], plot=False)
+        assert population.result() is None
+        # populating again is a no-op
+        assert auditioner.populate() is population
+        assert sorted(auditioner.thresholded_model_group_ids) == sorted(model_group_ids)
+        assert len(auditioner.selection_rule_model_group_ids) == 1
@@ -0,0 +1,138 @@
+from audition import Auditioner
+from audition.backends import backend_for, PostgresBackend, SQLiteBackend
+from audition.distance_from_best import DistanceFromBestTable, BestDistancePlotter
+from audition.model_group_performance import ModelGroupPerformancePlotter
+from sqlalchemy import create_engine
+import testing.postgresql
+from tests.utils import create_sample_results, export_results_to_sqlite
+from unittest.mock import patch
+import numpy
+import pandas as pd
+import tempfile
+
+METRICS = [
+    {'metric': 'precision@', 'parameter': '100_abs'},
+    {'metric': 'fpr@', 'parameter': '10_pct'},
+]
+
+
+def _sorted(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_backend_for():
+    assert isinstance(backend_for(create_engine('sqlite://')), SQLiteBackend)
+    assert type(backend_for(create_engine('postgresql://localhost/db'))) is PostgresBackend
+
+
+def test_sqlite_distance_table_matches_postgres():
+    with testing.postgresql.Postgresql() as postgresql, \
+            tempfile.NamedTemporaryFile(suffix='.db') as sqlite_file:
+        postgres_engine = create_engine(postgresql.url())
+        sqlite_engine = create_engine('sqlite:///' + sqlite_file.name)
+        model_group_ids, train_end_times = create_sample_results(postgres_engine, 4)
+        export_results_to_sqlite(postgres_engine, sqlite_engine)
+
+        tables = [
+            DistanceFromBestTable(engine, models_table='models', distance_table='dist_table')
+            for engine in (postgres_engine, sqlite_engine)
+        ]
+        for table in tables:
+            table.create_and_populate(model_group_ids, train_end_times, METRICS)
+        postgres_table, sqlite_table = tables
+        assert sqlite_table.results_schema == 'main'
+
+        postgres_df, sqlite_df = [_sorted(table.as_dataframe(model_group_ids)) for table in tables]
+        assert sqlite_df['train_end_time'].dtype == postgres_df['train_end_time'].dtype
+        pd.testing.assert_frame_equal(sqlite_df, postgres_df, check_dtype=False)
+        assert len(sqlite_table.dataframe_as_of(model_group_ids, train_end_times[0])) \
+            == 4 * len(METRICS)
+        assert sqlite_table.row_counts(model_group_ids) \
+            == postgres_table.row_counts(model_group_ids)
+        assert len(sqlite_table.as_dataframe(
+            model_group_ids,
+            train_end_times=[pd.Timestamp(train_end_times[0])]
+        )) == 4 * len(METRICS)
+
+        for metric, summary in postgres_table.metric_summaries.items():
+            sqlite_summary = sqlite_table.metric_summaries[metric]
+            assert sqlite_summary['count'] == summary['count']
+            assert numpy.isclose(sqlite_summary['min'], summary['min'])
+            for quantile, value in summary['quantiles'].items():
+                assert numpy.isclose(sqlite_summary['quantiles'][quantile], value)
+        assert sqlite_table.fingerprint.startswith('{}-'.format(len(sqlite_df)))
+
+        # SQLite has no GENERATE_SERIES, so the plot data is computed client-side
+        postgres_plot, sqlite_plot = [
+            BestDistancePlotter(table).generate_plot_data(
+                'precision@', '100_abs', model_group_ids, train_end_times[:2]
+            ).reset_index(drop=True)
+            for table in tables
+        ]
+        assert sqlite_plot.columns.tolist() == postgres_plot.columns.tolist()
+        assert sqlite_plot['model_group_id'].tolist() == postgres_plot['model_group_id'].tolist()
+        assert sqlite_plot['num_models'].tolist() == postgres_plot['num_models'].tolist()
+        # postgres subtracts the numeric values exactly and SQLite as floats, so
+        # distances landing on a plotted tick can fall either side of it
+        postgres_distances, sqlite_distances = [
+            _sorted(BestDistancePlotter(table).fetch_distances(
+                METRICS,
+                model_group_ids,
+                train_end_times
+            ))
+            for table in tables
+        ]
+        assert numpy.allclose(
+            sqlite_distances['dist_from_best_case'],
+            postgres_distances['dist_from_best_case']
+        )
+
+        postgres_performance, sqlite_performance = [
+            _sorted(ModelGroupPerformancePlotter(table).fetch_plot_data(
+                METRICS,
+                model_group_ids,
+                train_end_times
+            ))
+            for table in tables
+        ]
+        pd.testing.assert_frame_equal(sqlite_performance, postgres_performance, check_dtype=False)
+
+
+def test_Auditioner_on_sqlite():
+    with testing.postgresql.Postgresql() as postgresql, \
+            tempfile.NamedTemporaryFile(suffix='.db') as sqlite_file:
+        postgres_engine = create_engine(postgresql.url())
+        sqlite_engine = create_engine('sqlite:///' + sqlite_file.name)
+        model_group_ids, train_end_times = create_sample_results(postgres_engine, 5)
+        export_results_to_sqlite(postgres_engine, sqlite_engine)
+        metric_filters = [{
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'max_from_best': 0.5,
+            'threshold_value': 0.0
+        }]
+        rule_grid = [{
+            'shared_parameters': [{'metric': 'precision@', 'parameter': '100_abs'}],
+            'selection_rules': [
+                {'name': 'best_current_value'},
+                {'name': 'best_average_value'},
+                {'name': 'most_frequent_best_dist', 'dist_from_best_case': [0.1, 0.2]},
+            ]
+        }]
+        auditioners = [
+            Auditioner(engine, model_group_ids, train_end_times, metric_filters)
+            for engine in (postgres_engine, sqlite_engine)
+        ]
+        for auditioner in auditioners:
+            auditioner.register_selection_rule_grid(rule_grid, plot=False)
+        postgres_auditioner, sqlite_auditioner = auditioners
+
+        assert sqlite_auditioner.thresholded_model_group_ids == \
+            postgres_auditioner.thresholded_model_group_ids
+        # ties are broken at random, so the picks themselves may differ
+        sqlite_picks = sqlite_auditioner.selection_rule_model_group_ids
+        assert sorted(sqlite_picks) == sorted(postgres_auditioner.selection_rule_model_group_ids)
+        assert set(sqlite_picks.values()) <= set(sqlite_auditioner.thresholded_model_group_ids)
+        with patch('audition.distance_from_best.plot_cats'), \
+                patch('audition.model_group_performance.plot_cats'):
+            sqlite_auditioner.plot_model_groups()
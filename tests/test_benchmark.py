@@ -0,0 +1,18 @@
+from benchmarks.benchmark import run_benchmarks
+from catwalk.db import ensure_db
+from sqlalchemy import create_engine
+import testing.postgresql
+
+
+def test_run_benchmarks():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        ensure_db(engine)
+        records = run_benchmarks(engine, num_model_groups=5, num_train_end_times=3, num_metrics=2)
+    stages = [record['stage'] for record in records]
+    assert stages[:4] == ['generate_results', 'create_and_populate', 'as_dataframe', 'thresholding']
+    assert stages.count('selection_rule') == 7
+    assert stages.count('plot_data') == 4
+    by_stage = dict((record['stage'], record) for record in records)
+    assert by_stage['create_and_populate']['rows'] == 5 * 3 * 2
+    assert by_stage['grid_backtest']['rows'] == 7 * 2 * 2
@@ -0,0 +1,79 @@
+from audition.cli import load_config, main
+from sqlalchemy import create_engine
+import testing.postgresql
+from tests.utils import create_sample_results
+import json
+import os
+import pytest
+import tempfile
+import yaml
+
+
+def test_main():
+    with testing.postgresql.Postgresql() as postgresql:
+        db_engine = create_engine(postgresql.url())
+        model_group_ids, train_end_times = create_sample_results(db_engine, 3)
+        config = {
+            'db_url': postgresql.url(),
+            'model_groups_query': 'select model_group_id from results.model_groups',
+            'train_end_times': [str(train_end_time.date()) for train_end_time in train_end_times],
+            'metric_filters': [{
+                'metric': 'precision@',
+                'parameter': '100_abs',
+                'max_from_best': 1.0,
+                'threshold_value': 0.0
+            }],
+            'rule_grid': [{
+                'shared_parameters': [{'metric': 'precision@', 'parameter': '100_abs'}],
+                'selection_rules': [{'name': 'best_current_value'}, {'name': 'best_average_value'}]
+            }],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, 'audition.yaml')
+            tyra_path = os.path.join(directory, 'tyra.yaml')
+            results_path = os.path.join(directory, 'results.json')
+            query_log_path = os.path.join(directory, 'queries.json')
+            with open(config_path, 'w') as f:
+                yaml.dump(config, f)
+            assert main([
+                config_path,
+                '--tyra-config', tyra_path,
+                '--results', results_path,
+                '--query-log', query_log_path,
+                '--explain',
+            ]) == 0
+
+            with open(tyra_path) as f:
+                assert len(yaml.safe_load(f)['selection_rule_model_groups']) == 2
+            with open(results_path) as f:
+                results = json.load(f)
+            assert results['thresholded_model_group_ids'] == sorted(model_group_ids)
+            assert len(results['selection_rule_model_groups']) == 2
+            assert len(results['regrets']) == 2 * (len(train_end_times) - 1)
+            assert list(results['timings']) == [
+                'setup', 'population', 'thresholding', 'selection rules', 'regrets', 'tyra config'
+            ]
+            assert results['stages']['population']['count'] == 1
+            assert results['stages']['picks']['queries'] > 0
+            with open(query_log_path) as f:
+                queries = json.load(f)
+            # the population queries are explained
+            assert any(
+                query['sql'].strip().startswith('insert') and query['plan']
+                for query in queries
+            )
+
+
+def test_load_config_validates():
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml') as f:
+        yaml.dump({
+            'db_url': 'postgresql://',
+            'model_group_ids': [1],
+            'model_groups_query': 'select 1',
+            'train_end_times': ['2014-01-01'],
+            'metric_filters': [],
+            'rule_grid': [],
+        }, f)
+        f.flush()
+        with pytest.raises(ValueError):
+            load_config(f.name)
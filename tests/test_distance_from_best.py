@@ -9,7 +9,8 @@ from results_schema.factories import EvaluationFactory,\
 from catwalk.db import ensure_db
 import factory
 import numpy
-from tests.utils import create_sample_distance_table
+import pandas as pd
+from tests.utils import create_sample_distance_table, create_sample_results
 from unittest.mock import patch
 from datetime import datetime, timedelta
 
@@ -147,6 +148,52 @@ def test_DistanceFromBestTable():
             ('precision@', '100_abs'): (0.39, 0.8),
             ('recall@', '100_abs'): (0.34, 0.8),
         }
+        precision_summary = distance_table.metric_summaries[('precision@', '100_abs')]
+        assert precision_summary['count'] == 9
+        assert numpy.isclose(precision_summary['quantiles'][0.5], 0.43)
+
+        # repopulating replaces the cached summaries
+        distance_table.create_and_populate(
+            [model_groups['stable'].model_group_id],
+            ['2014-01-01', '2015-01-01', '2016-01-01'],
+            metrics[:1]
+        )
+        assert distance_table.observed_bounds == {
+            ('precision@', '100_abs'): (0.57, 0.6),
+        }
+
+
+def test_DistanceFromBestTable_as_dataframe_projection():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        df = distance_table.as_dataframe(
+            [model_groups['stable'].model_group_id],
+            metrics=[('recall@', '100_abs')],
+            columns=['model_group_id', 'train_end_time', 'metric', 'raw_value'],
+        )
+        assert list(df.columns) == ['model_group_id', 'train_end_time', 'metric', 'raw_value']
+        assert list(df['metric'].unique()) == ['recall@']
+        assert sorted(df['raw_value']) == [0.4, 0.5, 0.6]
+
+
+def test_DistanceFromBestTable_time_slices():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        model_group_ids = [model_groups['stable'].model_group_id]
+        metrics = [('recall@', '100_abs')]
+        row_counts = distance_table.row_counts(model_group_ids, metrics=metrics)
+        assert row_counts == dict(
+            (pd.Timestamp(train_end_time), 1)
+            for train_end_time in ['2014-01-01', '2015-01-01', '2016-01-01']
+        )
+        df = distance_table.as_dataframe(
+            model_group_ids,
+            metrics=metrics,
+            train_end_times=[pd.Timestamp('2015-01-01')]
+        )
+        assert list(df['train_end_time']) == [pd.Timestamp('2015-01-01')]
 
 
 def test_BestDistancePlotter():
@@ -178,6 +225,52 @@ def test_BestDistancePlotter():
             assert numpy.isclose(value, 0.5)
 
 
+def test_BestDistancePlotter_client_side_ecdf():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        kwargs = dict(
+            metric='precision@',
+            parameter='100_abs',
+            model_group_ids=[1, 2],
+            train_end_times=['2014-01-01', '2015-01-01']
+        )
+        sql_df = BestDistancePlotter(distance_table).generate_plot_data(**kwargs)
+        client_df = BestDistancePlotter(distance_table, client_side_ecdf=True)\
+            .generate_plot_data(**kwargs)
+        assert client_df.columns.tolist() == sql_df.columns.tolist()
+        assert client_df['distance'].tolist() == sql_df['distance'].tolist()
+        assert client_df['model_group_id'].tolist() == sql_df['model_group_id'].tolist()
+        assert client_df['model_type'].tolist() == sql_df['model_type'].tolist()
+        assert client_df['num_models'].tolist() == sql_df['num_models'].tolist()
+        assert numpy.allclose(client_df['pct_of_time'], sql_df['pct_of_time'])
+
+
+def test_BestDistancePlotter_client_side_ecdf_fetches_once():
+    with patch('audition.distance_from_best.plot_cats') as plot_patch:
+        with testing.postgresql.Postgresql() as postgresql:
+            engine = create_engine(postgresql.url())
+            distance_table, model_groups = create_sample_distance_table(engine)
+            plotter = BestDistancePlotter(distance_table, client_side_ecdf=True)
+            with patch.object(
+                plotter,
+                'fetch_distances',
+                wraps=plotter.fetch_distances
+            ) as fetch_patch:
+                plotter.plot_all_best_dist(
+                    [
+                        {'metric': 'precision@', 'parameter': '100_abs'},
+                        {'metric': 'recall@', 'parameter': '100_abs'},
+                    ],
+                    model_group_ids=[1, 2],
+                    train_end_times=['2014-01-01', '2015-01-01'],
+                )
+            assert fetch_patch.call_count == 1
+        assert plot_patch.call_count == 2
+        args, kwargs = plot_patch.call_args
+        assert kwargs['frame'].shape == (101 * 2, 5)
+
+
 def test_BestDistancePlotter_plot():
     with patch('audition.distance_from_best.plot_cats') as plot_patch:
         with testing.postgresql.Postgresql() as postgresql:
@@ -211,3 +304,37 @@ def test_BestDistancePlotter_plot_bounds():
     assert plotter.plot_bounds('precision@', '100_abs') == (0.0, 1.0)
     assert plotter.plot_bounds('recall@', '100_abs') == (0.0, 1.0)
     assert plotter.plot_bounds('false positives@', '300_abs') == (2, 178)
+
+
+def test_DistanceFromBestTable_fingerprint():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        fingerprint = distance_table.fingerprint
+        assert fingerprint == distance_table.fingerprint
+
+        # computed from the contents, so changes made by other means are seen
+        engine.execute(
+            'update {} set raw_value = raw_value + 0.01'.format(distance_table.distance_table)
+        )
+        assert distance_table.fingerprint != fingerprint
+
+
+def test_DistanceFromBestTable_fingerprint_after_repopulation():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        model_group_ids, train_end_times = create_sample_results(engine, 4)
+        metrics = [{'metric': 'precision@', 'parameter': '100_abs'}]
+        tables = [
+            DistanceFromBestTable(engine, models_table='models', distance_table='dist_table')
+            for _ in range(2)
+        ]
+        tables[0].create_and_populate(model_group_ids, train_end_times, metrics)
+        fingerprint = tables[0].fingerprint
+        assert tables[1].fingerprint == fingerprint
+        # population leaves no table beside the distance table
+        assert not engine.has_table('dist_table_fingerprint')
+
+        # another object repopulating the table changes every object's fingerprint
+        tables[1].create_and_populate(model_group_ids[:2], train_end_times, metrics)
+        assert tables[0].fingerprint == tables[1].fingerprint != fingerprint
@@ -0,0 +1,86 @@
+from audition.experiments import audition_experiments, experiment_configs, _engines
+from sqlalchemy import create_engine
+import testing.postgresql
+from tests.utils import create_sample_results
+import json
+import pytest
+import tempfile
+
+
+def _config(url, **kwargs):
+    return dict({
+        'db_url': url,
+        'model_groups_query': 'select model_group_id from results.model_groups',
+        'train_end_times_query': 'select distinct train_end_time from results.models',
+        'metric_filters': [{
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'max_from_best': 1.0,
+            'threshold_value': 0.0
+        }],
+        'rule_grid': [{
+            'shared_parameters': [{'metric': 'precision@', 'parameter': '100_abs'}],
+            'selection_rules': [{'name': 'best_current_value'}]
+        }],
+    }, **kwargs)
+
+
+def test_audition_experiments():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        model_group_ids, train_end_times = create_sample_results(engine, 3)
+        # a second experiment, in its own schema
+        engine.execute('create schema other')
+        for table in ('model_groups', 'models', 'evaluations'):
+            engine.execute('create table other.{0} as select * from results.{0}'.format(table))
+
+        configs = [
+            _config(postgresql.url()),
+            _config(postgresql.url(), results_schema='other'),
+            _config(postgresql.url(), name='broken', results_schema='missing'),
+        ]
+        with tempfile.NamedTemporaryFile() as f:
+            report = audition_experiments(configs, max_workers=2, report_path=f.name)
+            assert json.load(f) == report
+
+    assert sorted(report['experiments']) == ['experiment_0', 'other']
+    assert list(report['failed']) == ['broken']
+    for results in report['experiments'].values():
+        assert results['thresholded_model_group_ids'] == sorted(model_group_ids)
+        assert len(results['regrets']) == len(train_end_times) - 1
+    # the schemas hold the same data, so the experiments agree
+    assert report['experiments']['experiment_0']['selection_rule_model_groups'] == \
+        report['experiments']['other']['selection_rule_model_groups']
+
+
+def test_experiment_configs():
+    named = experiment_configs([
+        _config('postgresql://a'),
+        _config('postgresql://a', results_schema='other'),
+    ])
+    assert [name for name, _ in named] == ['experiment_0', 'other']
+    assert [config['distance_table'] for _, config in named] == [
+        'best_distance_experiment_0',
+        'best_distance_other'
+    ]
+    assert [config['rule_workers'] for _, config in named] == [1, 1]
+    with pytest.raises(ValueError):
+        experiment_configs([
+            _config('postgresql://a', name='x'),
+            _config('postgresql://b', name='x'),
+        ])
+    with pytest.raises(ValueError):
+        experiment_configs([
+            _config('postgresql://a', distance_table='shared'),
+            _config('postgresql://a', results_schema='other', distance_table='shared'),
+        ])
+
+
+def test_engines_pool_each_workers_rule_threads():
+    engines = _engines(experiment_configs([
+        _config('postgresql://a'),
+        _config('postgresql://a', results_schema='other', rule_workers=3),
+        _config('postgresql://b'),
+    ]), max_workers=2)
+    assert engines['postgresql://a'].pool.size() == 6
+    assert engines['postgresql://b'].pool.size() == 2
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+
+IMPORT_CHECK = '''
+import json, sys, time
+start = time.time()
+import audition
+print(json.dumps({
+    'seconds': time.time() - start,
+    'imported': [name for name in ('matplotlib', 'catwalk', 'sklearn') if name in sys.modules],
+}))
+'''
+
+
+def test_import_audition_is_light():
+    # run in a fresh interpreter, as this one has imported everything already
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_CHECK])
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    print('import audition took {:.3f}s'.format(result['seconds']))
+    assert result['imported'] == []
+
+
+def test_static_directionality_matches_catwalk():
+    from catwalk.evaluation import ModelEvaluator
+    from audition.metric_directionality import GREATER_IS_BETTER
+    for metric, greater_is_better in GREATER_IS_BETTER.items():
+        if metric in ModelEvaluator.available_metrics:
+            assert ModelEvaluator.available_metrics[metric].greater_is_better == greater_is_better
@@ -0,0 +1,215 @@
+from audition.incremental import IncrementalSelectionRulePicker
+from audition.selection_rules import BoundSelectionRule
+import pandas
+import numpy
+import tempfile
+import pytest
+
+
+def _history():
+    df = pandas.DataFrame.from_dict({
+        'model_group_id': [1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2],
+        'model_id': [1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6],
+        'train_end_time': [
+            '2011-01-01', '2011-01-01', '2012-01-01', '2012-01-01', '2013-01-01', '2013-01-01'
+        ] * 2,
+        'metric': ['precision@'] * 6 + ['recall@'] * 6,
+        'parameter': ['100_abs'] * 12,
+        'raw_value': [0.5, 0.4, 0.8, 0.3, 0.2, 0.5, 0.6, 0.3, 0.4, 0.6, 0.5, 0.7],
+        'dist_from_best_case': [0.0, 0.1, 0.0, 0.5, 0.3, 0.0, 0.0, 0.3, 0.0, 0.2, 0.2, 0.0],
+    })
+    df['train_end_time'] = pandas.to_datetime(df['train_end_time'])
+    return df
+
+
+RULES = [
+    BoundSelectionRule(
+        function_name='best_current_value',
+        args={'metric': 'precision@', 'parameter': '100_abs'},
+        descriptive_name='best_current_value'
+    ),
+    BoundSelectionRule(
+        function_name='best_average_value',
+        args={'metric': 'recall@', 'parameter': '100_abs'},
+        descriptive_name='best_average_value'
+    ),
+    BoundSelectionRule(
+        function_name='lowest_metric_variance',
+        args={'metric': 'precision@', 'parameter': '100_abs'},
+        descriptive_name='lowest_metric_variance'
+    ),
+    BoundSelectionRule(
+        function_name='most_frequent_best_dist',
+        args={'metric': 'recall@', 'parameter': '100_abs', 'dist_from_best_case': 0.1},
+        descriptive_name='most_frequent_best_dist'
+    ),
+    BoundSelectionRule(
+        function_name='best_average_two_metrics',
+        args={
+            'metric1': 'precision@',
+            'parameter1': '100_abs',
+            'metric2': 'recall@',
+            'parameter2': '100_abs',
+            'metric1_weight': 0.8
+        },
+        descriptive_name='best_average_two_metrics'
+    ),
+    BoundSelectionRule(
+        function_name='best_avg_var_penalized',
+        args={'metric': 'precision@', 'parameter': '100_abs', 'stdev_penalty': 0.5},
+        descriptive_name='best_avg_var_penalized'
+    ),
+    BoundSelectionRule(
+        function_name='best_avg_recency_weight',
+        args={
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'curr_weight': 1.5,
+            'decay_type': 'linear',
+        },
+        descriptive_name='best_avg_recency_weight_linear'
+    ),
+    BoundSelectionRule(
+        function_name='best_avg_recency_weight',
+        args={
+            'metric': 'recall@',
+            'parameter': '100_abs',
+            'curr_weight': 3.0,
+            'decay_type': 'exponential',
+        },
+        descriptive_name='best_avg_recency_weight_exponential'
+    ),
+]
+
+
+def test_incremental_scores_match_full_history():
+    df = _history()
+    train_end_times = sorted(df['train_end_time'].unique())
+    for rule in RULES:
+        incremental = rule.incremental_rule
+        state = rule.initial_state()
+        for train_end_time in train_end_times:
+            rule.update_state(state, df[df['train_end_time'] == train_end_time], train_end_time)
+            first_time = train_end_time == train_end_times[0]
+            if first_time and rule.function_name == 'lowest_metric_variance':
+                # a single observation has no variance, so the pick is random
+                continue
+            assert rule.pick_from_state(state, train_end_time) == \
+                rule.pick(df[df['train_end_time'] <= train_end_time].copy(), train_end_time), \
+                '{} differs at {}'.format(rule.descriptive_name, train_end_time)
+        assert not incremental.scores(state).isnull().any()
+
+
+def test_incremental_best_current_value_with_several_models_per_group():
+    df = _history()
+    # a second model for each group at every time, listed first, which is
+    # worse by precision and better by false positive rate
+    other = df.copy()
+    other['model_id'] += 10
+    other['raw_value'] -= 0.45
+    df = pandas.concat([other, df], ignore_index=True)
+    for metric in ('precision@', 'fpr@'):
+        rule = BoundSelectionRule(
+            function_name='best_current_value',
+            args={'metric': metric, 'parameter': '100_abs'}
+        )
+        metric_df = df.assign(metric=df['metric'].replace('precision@', metric))
+        state = rule.initial_state()
+        for train_end_time in sorted(metric_df['train_end_time'].unique()):
+            rule.update_state(
+                state,
+                metric_df[metric_df['train_end_time'] == train_end_time],
+                train_end_time
+            )
+            history = metric_df[metric_df['train_end_time'] <= train_end_time].copy()
+            assert rule.pick_from_state(state, train_end_time) == \
+                rule.pick(history, train_end_time)
+
+
+def test_incremental_moments():
+    df = _history()
+    rule = RULES[2]
+    state = rule.initial_state()
+    for train_end_time in sorted(df['train_end_time'].unique()):
+        rule.update_state(state, df[df['train_end_time'] == train_end_time], train_end_time)
+    expected = df[df['metric'] == 'precision@'].groupby('model_group_id')['raw_value'].std()
+    assert numpy.allclose(rule.incremental_rule.scores(state).sort_index(), expected.sort_index())
+
+
+def test_incremental_update_out_of_order():
+    df = _history()
+    rule = RULES[1]
+    state = rule.initial_state()
+    rule.update_state(state, df[df['train_end_time'] == '2012-01-01'], '2012-01-01')
+    with pytest.raises(ValueError):
+        rule.update_state(state, df[df['train_end_time'] == '2011-01-01'], '2011-01-01')
+
+
+def test_custom_function_not_incremental():
+    rule = BoundSelectionRule(
+        descriptive_name='custom',
+        function=lambda df, train_end_time: 1,
+        args={}
+    )
+    assert not rule.is_incremental
+    with pytest.raises(ValueError):
+        rule.incremental_rule
+
+
+def test_IncrementalSelectionRulePicker_hides_future_columns():
+    df = _history()
+    df['raw_value_next_time'] = 1.0
+    df['dist_from_best_case_next_time'] = 0.0
+    seen_columns = []
+
+    def spy(df, train_end_time):
+        seen_columns.extend(df.columns)
+        return df['model_group_id'].max()
+
+    picker = IncrementalSelectionRulePicker([
+        BoundSelectionRule(descriptive_name='spy', function=spy, args={})
+    ])
+    picker.update(df, '2011-01-01')
+    assert picker.model_group_ids == {'spy': 2}
+    assert 'raw_value_next_time' not in seen_columns
+    assert 'dist_from_best_case_next_time' not in seen_columns
+
+
+def test_IncrementalSelectionRulePicker_save_and_load():
+    df = _history()
+    custom_rule = BoundSelectionRule(
+        descriptive_name='most_recent_group',
+        function=lambda df, train_end_time: df['model_group_id'].max(),
+        args={}
+    )
+    rules = RULES[:2] + [custom_rule]
+    picker = IncrementalSelectionRulePicker(rules)
+    picker.update(df, '2011-01-01')
+    picker.update(df, '2012-01-01')
+    with tempfile.NamedTemporaryFile() as tf:
+        picker.save(tf.name)
+        restored = IncrementalSelectionRulePicker.load(tf.name, rules)
+
+    restored.update(df, '2013-01-01')
+    picker.update(df, '2013-01-01')
+    assert restored.model_group_ids == picker.model_group_ids
+    assert restored.model_group_ids == {
+        'best_current_value': 2,
+        'best_average_value': 2,
+        'most_recent_group': 2,
+    }
+
+
+def test_IncrementalSelectionRulePicker_load_mismatched_args():
+    df = _history()
+    picker = IncrementalSelectionRulePicker(RULES[:1])
+    picker.update(df, '2011-01-01')
+    changed_rule = BoundSelectionRule(
+        function_name='best_current_value',
+        args={'metric': 'recall@', 'parameter': '100_abs'},
+        descriptive_name='best_current_value'
+    )
+    with tempfile.NamedTemporaryFile() as tf:
+        picker.save(tf.name)
+        with pytest.raises(ValueError):
+            IncrementalSelectionRulePicker.load(tf.name, [changed_rule])
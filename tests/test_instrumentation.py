@@ -0,0 +1,147 @@
+from audition.instrumentation import Instrumentation, stage
+from sqlalchemy import create_engine, event
+import gc
+import pytest
+import threading
+import tracemalloc
+
+
+def test_stage_records():
+    records = []
+    instrumentation = Instrumentation(hooks=[records.append])
+    with stage(instrumentation, 'as_dataframe', metric='precision@') as record:
+        record['rows'] = 5
+    assert len(records) == 1
+    assert records == instrumentation.report()
+    assert records[0]['stage'] == 'as_dataframe'
+    assert records[0]['labels'] == {'metric': 'precision@'}
+    assert records[0]['rows'] == 5
+    assert records[0]['seconds'] >= 0
+    assert records[0]['queries'] == 0
+
+
+def test_stage_counts_queries_of_nested_stages():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation()
+    instrumentation.attach(engine)
+    instrumentation.attach(engine)
+    with stage(instrumentation, 'outer'):
+        engine.execute('select 1')
+        with stage(instrumentation, 'inner'):
+            engine.execute('select 1')
+    # queries outside of any stage aren't counted
+    engine.execute('select 1')
+    inner, outer = instrumentation.report()
+    assert inner['queries'] == 1
+    assert outer['queries'] == 2
+
+
+def test_close_detaches_engines():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation()
+    instrumentation.attach(engine)
+    instrumentation.close()
+    with stage(instrumentation, 'after'):
+        engine.execute('select 1')
+    assert instrumentation.report()[0]['queries'] == 0
+    # attaching again counts queries again
+    instrumentation.attach(engine)
+    with stage(instrumentation, 'reattached'):
+        engine.execute('select 1')
+    assert instrumentation.report()[1]['queries'] == 1
+    instrumentation.detach(engine)
+
+
+def test_collected_instrumentation_detaches_engines():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation()
+    instrumentation.attach(engine)
+    _, _, (_, _, listener), _ = instrumentation._engines[0][1].peek()
+    assert event.contains(engine, 'before_cursor_execute', listener)
+    # never closed, but no longer referenced
+    del instrumentation
+    gc.collect()
+    assert not event.contains(engine, 'before_cursor_execute', listener)
+
+
+def test_stage_queries_are_per_thread():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation()
+    instrumentation.attach(engine)
+    with stage(instrumentation, 'main'):
+        thread = threading.Thread(target=lambda: engine.execute('select 1'))
+        thread.start()
+        thread.join()
+    assert instrumentation.report()[0]['queries'] == 0
+
+
+def test_summary():
+    instrumentation = Instrumentation()
+    for rows in (2, 3):
+        with stage(instrumentation, 'picks') as record:
+            record['rows'] = rows
+    instrumentation.record('plot', 1.5, plot='regret_cdf')
+    summary = instrumentation.summary()
+    assert summary['picks']['count'] == 2
+    assert summary['picks']['rows'] == 5
+    assert summary['plot']['seconds'] == 1.5
+    instrumentation.clear()
+    assert instrumentation.summary() == {}
+
+
+@pytest.mark.skipif(
+    not hasattr(tracemalloc, 'reset_peak'),
+    reason='allocation peaks need tracemalloc.reset_peak, from Python 3.9'
+)
+def test_stage_tracks_memory():
+    instrumentation = Instrumentation(track_memory=True)
+    with stage(instrumentation, 'outer'):
+        with stage(instrumentation, 'big'):
+            big = bytearray(21 * 1024 * 1024)
+            del big
+        with stage(instrumentation, 'small'):
+            small = bytearray(1024)
+            del small
+    big, small, outer = instrumentation.report()
+    assert big['allocated_peak_mb'] >= 20
+    assert small['allocated_peak_mb'] < 1
+    # a stage's peak includes those of the stages within it
+    assert outer['allocated_peak_mb'] >= 20
+    assert sorted(record['stage'] for record in instrumentation.top_memory(2)) == ['big', 'outer']
+    assert instrumentation.summary()['big']['allocated_peak_mb'] >= 20
+    instrumentation.close()
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.skipif(
+    not hasattr(tracemalloc, 'reset_peak'),
+    reason='allocation peaks need tracemalloc.reset_peak, from Python 3.9'
+)
+def test_memory_peaks_survive_other_threads_sampling():
+    instrumentation = Instrumentation(track_memory=True)
+    allocated = threading.Event()
+    sampled = threading.Event()
+
+    def allocate():
+        with stage(instrumentation, 'big'):
+            big = bytearray(21 * 1024 * 1024)
+            del big
+            allocated.set()
+            sampled.wait()
+
+    thread = threading.Thread(target=allocate)
+    thread.start()
+    allocated.wait()
+    # another thread's stage starts and ends, resetting the process-wide peak
+    with stage(instrumentation, 'small'):
+        pass
+    sampled.set()
+    thread.join()
+    instrumentation.close()
+    records = dict((record['stage'], record) for record in instrumentation.report())
+    assert records['big']['allocated_peak_mb'] >= 20
+
+
+def test_stage_without_instrumentation():
+    with stage(None, 'picks') as record:
+        record['rows'] = 1
@@ -0,0 +1,35 @@
+from audition.metric_directionality import greater_is_better, \
+    register_metric_directionality, \
+    clear_metric_directionality, \
+    sql_rank_order, \
+    idxbest
+from unittest.mock import patch
+
+
+def test_greater_is_better_known_metrics():
+    assert greater_is_better('precision@')
+    assert not greater_is_better('fpr@')
+    assert sql_rank_order('false positives@') == 'asc'
+
+
+def test_greater_is_better_warns_once():
+    clear_metric_directionality()
+    with patch('audition.metric_directionality.logging') as logging_patch:
+        for _ in range(3):
+            assert greater_is_better('my custom metric')
+        assert logging_patch.warning.call_count == 1
+    clear_metric_directionality()
+
+
+def test_register_metric_directionality():
+    clear_metric_directionality()
+    assert greater_is_better('lift@')
+    register_metric_directionality('lift@', False)
+    assert not greater_is_better('lift@')
+    assert idxbest('lift@') == 'idxmin'
+
+    # overrides take precedence over the known metrics
+    register_metric_directionality('precision@', False)
+    assert not greater_is_better('precision@')
+    clear_metric_directionality()
+    assert greater_is_better('precision@')
@@ -39,3 +39,53 @@ def test_ModelGroupPerformancePlotter_plot_all():
         assert 'train_end_time' in kwargs['frame']
         assert kwargs['x_col'] == 'train_end_time'
         assert kwargs['y_col'] == 'raw_value'
+
+
+def test_ModelGroupPerformancePlotter_plot_all_fetches_once():
+    with patch('audition.model_group_performance.plot_cats') as plot_patch:
+        with testing.postgresql.Postgresql() as postgresql:
+            engine = create_engine(postgresql.url())
+            distance_table, model_groups = create_sample_distance_table(engine)
+            plotter = ModelGroupPerformancePlotter(distance_table)
+            with patch.object(
+                plotter,
+                'fetch_plot_data',
+                wraps=plotter.fetch_plot_data
+            ) as fetch_patch:
+                plotter.plot_all(
+                    [
+                        {'metric': 'precision@', 'parameter': '100_abs'},
+                        {'metric': 'recall@', 'parameter': '100_abs'},
+                    ],
+                    model_group_ids=[1, 2],
+                    train_end_times=['2014-01-01', '2015-01-01'],
+                )
+            assert fetch_patch.call_count == 1
+        assert plot_patch.call_count == 2
+        args, kwargs = plot_patch.call_args
+        df = kwargs['frame']
+        assert df['metric'].unique().tolist() == ['recall@']
+        # one row per model group and train end time, plus the best cases
+        assert len(df[df['model_group_id'] != 0]) == 2 * 2
+        assert df[df['model_group_id'] == 0]['model_type'].unique().tolist() == ['best case']
+
+
+def test_ModelGroupPerformancePlotter_plot_aggregates():
+    with patch('audition.model_group_performance.plot_cats') as plot_patch:
+        with testing.postgresql.Postgresql() as postgresql:
+            engine = create_engine(postgresql.url())
+            distance_table, model_groups = create_sample_distance_table(engine)
+            plotter = ModelGroupPerformancePlotter(
+                distance_table,
+                aggregate_above=1,
+                aggregate_top_k=1
+            )
+            plotter.plot_all(
+                [{'metric': 'precision@', 'parameter': '100_abs'}],
+                model_group_ids=[1, 2],
+                train_end_times=['2014-01-01', '2015-01-01'],
+            )
+        args, kwargs = plot_patch.call_args
+        assert kwargs['aggregate_above'] == 1
+        assert kwargs['top_k'] == 1
+        assert kwargs['top_k_greater_is_better']
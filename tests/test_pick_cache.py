@@ -0,0 +1,86 @@
+from audition.pick_cache import PickCache, rule_signature
+from audition.selection_rules import BoundSelectionRule
+import os
+import tempfile
+
+
+RULE = BoundSelectionRule(
+    function_name='best_current_value',
+    args={'metric': 'precision@', 'parameter': '100_abs'}
+)
+
+
+def test_PickCache_get_and_set():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PickCache(cache_dir)
+        key = cache.key('abc', [2, 1], RULE, '2015-01-01', seed=1)
+        assert cache.get(key) is None
+        cache.set(key, 5)
+        assert cache.get(key) == 5
+
+        # the order of the model group ids doesn't matter, but everything else does
+        assert cache.key('abc', [1, 2], RULE, '2015-01-01 00:00:00', seed=1) == key
+        assert cache.get(cache.key('abc', [1, 2], RULE, '2015-01-01', seed=2)) is None
+        assert cache.get(cache.key('abc', [1, 2, 3], RULE, '2015-01-01', seed=1)) is None
+        assert cache.get(cache.key('def', [1, 2], RULE, '2015-01-01', seed=1)) is None
+        other_rule = BoundSelectionRule(
+            function_name='best_current_value',
+            args={'metric': 'recall@', 'parameter': '100_abs'}
+        )
+        assert cache.get(cache.key('abc', [1, 2], other_rule, '2015-01-01', seed=1)) is None
+
+        # a new cache object on the same directory sees the picks
+        assert PickCache(cache_dir).get(key) == 5
+
+
+def test_PickCache_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PickCache(cache_dir, max_entries=2)
+        keys = [
+            cache.key('abc', [1, 2], RULE, '201{}-01-01'.format(year), seed=1)
+            for year in range(3)
+        ]
+        cache.set(keys[0], 1)
+        cache.set(keys[1], 2)
+        os.utime(cache._path(keys[0]), (1000, 1000))
+        os.utime(cache._path(keys[1]), (2000, 2000))
+        cache.set(keys[2], 3)
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[1]) == 2
+        assert cache.get(keys[2]) == 3
+
+
+def test_PickCache_invalidate():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PickCache(cache_dir)
+        first_key = cache.key('abc', [1, 2], RULE, '2015-01-01')
+        second_key = cache.key('def', [1, 2], RULE, '2015-01-01')
+        cache.set(first_key, 1)
+        cache.set(second_key, 2)
+        cache.invalidate('abc')
+        assert cache.get(first_key) is None
+        assert cache.get(second_key) == 2
+        cache.invalidate()
+        assert cache.get(second_key) is None
+
+
+def _rule_picking(model_group_id):
+    return BoundSelectionRule(
+        function=lambda df, train_end_time: model_group_id,
+        descriptive_name='constant',
+        args={}
+    )
+
+
+def test_rule_signature_tells_closures_apart():
+    assert rule_signature(_rule_picking(1)) == rule_signature(_rule_picking(1))
+    assert rule_signature(_rule_picking(1)) != rule_signature(_rule_picking(2))
+    assert rule_signature(BoundSelectionRule(
+        function=lambda df, train_end_time: 1,
+        descriptive_name='constant',
+        args={}
+    )) != rule_signature(BoundSelectionRule(
+        function=lambda df, train_end_time: 2,
+        descriptive_name='constant',
+        args={}
+    ))
@@ -1,7 +1,10 @@
-from audition.plotting import generate_plot_lines, category_colordict, category_styledict, plot_cats
+from audition.plotting import generate_plot_lines, category_colordict, category_styledict, \
+    plot_cats, get_pyplot
 import matplotlib.lines as mlines
 import pandas
 from unittest.mock import patch
+from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
 
 
 def test_generate_plot_lines():
@@ -73,6 +76,86 @@ def test_plot_cats():
     })
     # hard to make many assertions, but we can make sure it gets to the end
     # and shows the contents
-    with patch('audition.plotting.plt.show') as show_patch:
+    with patch.object(get_pyplot(), 'show') as show_patch:
         plot_cats(test_df, 'col1', 'col2', cat_col='cats', grp_col='groups')
         assert show_patch.called
+
+
+def test_plot_cats_one_collection_per_category():
+    test_df = pandas.DataFrame.from_dict({
+        'cats': ['tuxedo'] * 4 + ['lion!'] * 2,
+        'groups': [1, 1, 2, 2, 3, 3],
+        'col1': pandas.to_datetime(['2014-01-01', '2015-01-01'] * 3),
+        'col2': [4, 5, 6, 7, 8, 9],
+    })
+    with patch.object(get_pyplot(), 'show'):
+        plot_cats(
+            test_df,
+            'col1',
+            'col2',
+            cat_col='cats',
+            grp_col='groups',
+            x_ticks=['2014-01-01', '2015-01-01']
+        )
+        ax = plt.gca()
+        collections = [
+            collection for collection in ax.collections
+            if isinstance(collection, LineCollection)
+        ]
+        assert len(collections) == 2
+        assert sorted(len(collection.get_segments()) for collection in collections) == [1, 2]
+        assert sum(
+            len(segment) for collection in collections for segment in collection.get_segments()
+        ) == 6
+        plt.close('all')
+
+
+def test_plot_cats_aggregates_many_groups():
+    test_df = pandas.DataFrame.from_dict({
+        'cats': ['tuxedo'] * 6 + ['lion!'] * 2,
+        'groups': [1, 1, 2, 2, 3, 3, 4, 4],
+        'col1': [0.0, 1.0] * 4,
+        'col2': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8],
+    })
+    with patch.object(get_pyplot(), 'show'):
+        plot_cats(
+            test_df, 'col1', 'col2', cat_col='cats', grp_col='groups', aggregate_above=3, top_k=1
+        )
+        ax = plt.gca()
+        # one median line per category, with a band around it
+        assert len(ax.lines) == 2
+        assert sorted(line.get_ydata().tolist() for line in ax.lines) == [[0.3, 0.4], [0.7, 0.8]]
+        assert len([c for c in ax.collections if not isinstance(c, LineCollection)]) == 2
+        # and the single best group drawn individually
+        top_lines = [c for c in ax.collections if isinstance(c, LineCollection)]
+        assert [segment.tolist() for c in top_lines for segment in c.get_segments()] == \
+            [[[0.0, 0.7], [1.0, 0.8]]]
+        plt.close('all')
+
+    with patch.object(get_pyplot(), 'show'):
+        plot_cats(test_df, 'col1', 'col2', cat_col='cats', grp_col='groups', aggregate_above=4)
+        assert len(plt.gca().lines) == 0
+        plt.close('all')
+
+
+def test_plot_cats_aggregation_leaves_out_highlighted_category():
+    test_df = pandas.DataFrame.from_dict({
+        'cats': ['tuxedo'] * 6 + ['best case'] * 2,
+        'groups': [1, 1, 2, 2, 3, 3, 0, 0],
+        'col1': [0.0, 1.0] * 4,
+        'col2': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.9, 1.0],
+    })
+    with patch.object(get_pyplot(), 'show'):
+        # three model groups and the best case aren't more than three groups
+        plot_cats(test_df, 'col1', 'col2', cat_col='cats', grp_col='groups',
+                  highlight_grp='best case', aggregate_above=3)
+        assert len(plt.gca().lines) == 0
+        plt.close('all')
+
+    with patch.object(get_pyplot(), 'show'):
+        plot_cats(test_df, 'col1', 'col2', cat_col='cats', grp_col='groups',
+                  highlight_grp='best case', aggregate_above=2, top_k=1)
+        top_lines = [c for c in plt.gca().collections if isinstance(c, LineCollection)]
+        assert [segment.tolist() for c in top_lines for segment in c.get_segments()] == \
+            [[[0.0, 0.5], [1.0, 0.6]]]
+        plt.close('all')
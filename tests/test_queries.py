@@ -0,0 +1,51 @@
+from audition.queries import QueryExecutor
+from sqlalchemy import create_engine
+import testing.postgresql
+import json
+import tempfile
+
+
+def test_QueryExecutor_records():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        executor = QueryExecutor(engine, record=True)
+        executor.execute('create table things (id int)')
+        executor.execute('insert into things values (1), (2)')
+        assert executor.execute('select * from things where id > %(id)s', {'id': 1}) == [(2,)]
+        assert len(executor.read_sql('select * from things')) == 2
+
+        assert [record['rows'] for record in executor.records[1:]] == [2, 1, 2]
+        assert executor.records[2]['params'] == {'id': 1}
+        assert all(record['seconds'] >= 0 for record in executor.records)
+        assert all(record['plan'] is None for record in executor.records)
+
+        with tempfile.NamedTemporaryFile() as f:
+            executor.dump(f.name)
+            assert [record['sql'] for record in json.load(f)] == [
+                record['sql'] for record in executor.records
+            ]
+        executor.clear()
+        assert executor.records == []
+
+
+def test_QueryExecutor_explains():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        executor = QueryExecutor(engine, record=True, explain=True)
+        executor.execute('create table things (id int)')
+        executor.execute('insert into things values (1), (2)')
+        executor.read_sql('select * from things')
+        create, insert, select = executor.records
+        # statements that can't be explained are still run and recorded
+        assert create['plan'] is None
+        assert any('Insert on things' in line for line in insert['plan'])
+        assert any('Buffers' in line or 'actual time' in line for line in select['plan'])
+        # explaining a statement doesn't apply its changes
+        assert executor.execute('select count(*) from things') == [(2,)]
+
+
+def test_QueryExecutor_records_nothing_by_default():
+    with testing.postgresql.Postgresql() as postgresql:
+        executor = QueryExecutor(create_engine(postgresql.url()))
+        executor.execute('select 1')
+        assert executor.records == []
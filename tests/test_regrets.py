@@ -1,10 +1,18 @@
-from audition.regrets import SelectionRulePicker, SelectionRulePlotter, BoundSelectionRule
+from audition.regrets import SelectionRulePicker, SelectionRulePlotter, BoundSelectionRule, \
+    HistoryView, RegretResults
+from audition import history
+from audition.history import incremental_picks, picks_from_history, picks_from_snapshot
 import testing.postgresql
 from sqlalchemy import create_engine
 from tests.utils import create_sample_distance_table
 from audition.selection_rules import best_current_value, best_average_value
 import numpy
+import pandas
 from unittest.mock import patch
+from concurrent.futures import ProcessPoolExecutor
+import tempfile
+from audition.pick_cache import PickCache, rule_signature
+import pytest
 
 
 def test_selection_rule_picker():
@@ -138,3 +146,421 @@ def test_SelectionPlotter_plot():
         assert 'pct_of_time' in kwargs['frame']
         assert kwargs['x_col'] == 'regret'
         assert kwargs['y_col'] == 'pct_of_time'
+
+
+def test_selection_rule_picker_incremental_matches_full_history():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        selection_rule_picker = SelectionRulePicker(
+            distance_from_best_table=distance_table
+        )
+        model_group_ids = [mg.model_group_id for mg in model_groups.values()]
+        train_end_times = ['2014-01-01', '2015-01-01', '2016-01-01']
+        args = {'metric': 'recall@', 'parameter': '100_abs'}
+
+        incremental_rule = BoundSelectionRule(function_name='best_average_value', args=args)
+        full_history_rule = BoundSelectionRule(
+            descriptive_name='best_average_value_full_history',
+            function=lambda df, train_end_time, **kwargs:
+                best_average_value(df, train_end_time, **kwargs),
+            args=args
+        )
+        assert incremental_rule.is_incremental
+        assert not full_history_rule.is_incremental
+
+        incremental_results, full_history_results = [
+            selection_rule_picker.results_for_rule(
+                bound_selection_rule=rule,
+                model_group_ids=model_group_ids,
+                train_end_times=train_end_times,
+                regret_metric='precision@',
+                regret_parameter='100_abs',
+            )
+            for rule in (incremental_rule, full_history_rule)
+        ]
+        assert [result['model_group_id'] for result in incremental_results] == \
+            [result['model_group_id'] for result in full_history_results]
+        assert [result['dist_from_best_case_next_time'] for result in incremental_results] == \
+            [0.19, 0.3, 0.12]
+
+
+def _distance_dataframe():
+    df = pandas.DataFrame.from_dict({
+        'model_group_id': [1, 2, 1, 2, 1, 2],
+        'model_id': [4, 5, 2, 3, 0, 1],
+        'train_end_time': [
+            '2016-01-01', '2016-01-01', '2015-01-01', '2015-01-01', '2014-01-01', '2014-01-01'
+        ],
+        'metric': ['precision@'] * 6,
+        'parameter': ['100_abs'] * 6,
+        'raw_value': [0.5, 0.4, 0.6, 0.7, 0.2, 0.1],
+        'dist_from_best_case': [0.0, 0.1, 0.1, 0.0, 0.0, 0.1],
+        'raw_value_next_time': [None, None, 0.5, 0.4, 0.6, 0.7],
+        'dist_from_best_case_next_time': [None, None, 0.0, 0.1, 0.1, 0.0],
+    })
+    df['train_end_time'] = pandas.to_datetime(df['train_end_time'])
+    return df
+
+
+def test_HistoryView():
+    view = HistoryView(_distance_dataframe())
+    as_of_2015 = view.as_of('2015-01-01')
+    assert sorted(as_of_2015['model_id']) == [0, 1, 2, 3]
+    assert 'dist_from_best_case_next_time' not in as_of_2015.columns
+    assert 'raw_value_next_time' not in as_of_2015.columns
+    assert numpy.shares_memory(as_of_2015['raw_value'].values, view.dataframe['raw_value'].values)
+    assert len(view.as_of('2013-01-01')) == 0
+    assert len(view.as_of('2017-01-01')) == 6
+
+
+def test_selection_rule_picker_reuses_fetch():
+    class FakeDistanceTable(object):
+        def __init__(self):
+            self.fetches = 0
+
+        def as_dataframe(self, model_group_ids, metrics=None, columns=None):
+            self.fetches += 1
+            df = _distance_dataframe()
+            return df[columns] if columns else df
+
+    distance_table = FakeDistanceTable()
+    selection_rule_picker = SelectionRulePicker(distance_from_best_table=distance_table)
+    rule = BoundSelectionRule(
+        function_name='best_avg_recency_weight',
+        args={
+            'metric': 'precision@',
+            'parameter': '100_abs',
+            'curr_weight': 1.0,
+            'decay_type': 'linear',
+        }
+    )
+    for train_end_time in ['2014-01-01', '2015-01-01', '2016-01-01']:
+        selection_rule_picker.model_group_from_rule(rule, [1, 2], train_end_time)
+    assert distance_table.fetches == 1
+
+    # the rule adds columns to its input, so it should have been given a copy
+    view = selection_rule_picker._history_view(rule, [1, 2])
+    assert 'weight' not in view.dataframe.columns
+
+
+def test_selection_rule_picker_memory_budget():
+    class FakeDistanceTable(object):
+        def __init__(self):
+            self.fetched_times = []
+
+        def as_dataframe(self, model_group_ids, metrics=None, columns=None, train_end_times=None):
+            self.fetched_times.append(train_end_times)
+            df = _distance_dataframe()
+            if train_end_times:
+                df = df[df['train_end_time'].isin(pandas.to_datetime(train_end_times))]
+            return df[columns] if columns else df
+
+        def row_counts(self, model_group_ids, metrics=None):
+            return _distance_dataframe().groupby('train_end_time').size().to_dict()
+
+    rules = [
+        BoundSelectionRule(
+            function_name='best_current_value',
+            args={'metric': 'precision@', 'parameter': '100_abs'}
+        ),
+        BoundSelectionRule(
+            function_name='most_frequent_best_dist',
+            args={'metric': 'precision@', 'parameter': '100_abs', 'dist_from_best_case': 0.05}
+        ),
+    ]
+    times = ['2014-01-01', '2015-01-01']
+    unbudgeted_picks = SelectionRulePicker(FakeDistanceTable(), seed=0) \
+        .picks_for_rules(rules, [1, 2], times)
+
+    # a budget too small for any history keeps none, and fetches them one
+    # train end time at a time, but gives the same picks
+    distance_table = FakeDistanceTable()
+    selection_rule_picker = SelectionRulePicker(distance_table, memory_budget_mb=1e-6, seed=0)
+    assert selection_rule_picker.picks_for_rules(rules, [1, 2], times) == unbudgeted_picks
+    assert len(selection_rule_picker._history_views) == 0
+    assert all(len(fetched_times) == 1 for fetched_times in distance_table.fetched_times)
+
+    # rules without an incremental implementation can't read a history in slices
+    full_history_rule = BoundSelectionRule(
+        descriptive_name='best_current_value_full_history',
+        function=lambda df, train_end_time, **kwargs:
+            best_current_value(df, train_end_time, **kwargs),
+        args={'metric': 'precision@', 'parameter': '100_abs'}
+    )
+    with pytest.raises(ValueError, match='memory budget'):
+        selection_rule_picker.picks_for_rule(full_history_rule, [1, 2], times)
+
+    # a budget for one history keeps the most recently used one
+    one_view = SelectionRulePicker(FakeDistanceTable())._history_view(rules[0], [1, 2]).nbytes
+    selection_rule_picker = SelectionRulePicker(
+        FakeDistanceTable(),
+        memory_budget_mb=1.5 * one_view / (1024 * 1024),
+        seed=0
+    )
+    assert selection_rule_picker.picks_for_rules(rules, [1, 2], times) == unbudgeted_picks
+    assert list(selection_rule_picker._history_views) == [
+        selection_rule_picker._history_view_key(rules[1], [1, 2])
+    ]
+
+    # a history too big for the budget on its own doesn't release the others
+    small_rule = BoundSelectionRule(function_name='random_model_group', args={})
+    small_view = selection_rule_picker._history_view(small_rule, [1, 2]).nbytes
+    assert one_view > small_view
+    selection_rule_picker = SelectionRulePicker(
+        FakeDistanceTable(),
+        memory_budget_mb=(one_view + small_view) / 2.0 / (1024 * 1024),
+        seed=0
+    )
+    selection_rule_picker.picks_for_rule(small_rule, [1, 2], times)
+    selection_rule_picker.picks_for_rule(rules[0], [1, 2], times)
+    assert list(selection_rule_picker._history_views) == [
+        selection_rule_picker._history_view_key(small_rule, [1, 2])
+    ]
+
+
+def test_selection_rule_picker_reuses_last_backtest():
+    times = pandas.to_datetime(['2013-01-01', '2014-01-01', '2015-01-01', '2016-01-01'])
+
+    class FakeDistanceTable(object):
+        def as_dataframe(self, model_group_ids, metrics=None, columns=None):
+            # the higher the model group id, the better, with no ties in raw value
+            df = pandas.DataFrame([
+                {
+                    'model_group_id': model_group_id,
+                    'train_end_time': train_end_time,
+                    'metric': 'precision@',
+                    'parameter': '100_abs',
+                    'raw_value': model_group_id / 100.0 + position / 1000.0,
+                    'dist_from_best_case': (20 - model_group_id) / 100.0,
+                }
+                for model_group_id in model_group_ids
+                for position, train_end_time in enumerate(times)
+            ])
+            return df[columns] if columns else df
+
+    args = {'metric': 'precision@', 'parameter': '100_abs'}
+    rules = [
+        BoundSelectionRule(function_name='best_current_value', args=args),
+        BoundSelectionRule(function_name='best_average_value', args=args),
+        BoundSelectionRule(
+            function_name='most_frequent_best_dist',
+            args=dict(args, dist_from_best_case=0.1)
+        ),
+        # scores depend on the other candidates, so it is always run again
+        BoundSelectionRule(
+            function_name='best_avg_var_penalized',
+            args=dict(args, stdev_penalty=0.5)
+        ),
+    ]
+    selection_rule_picker = SelectionRulePicker(FakeDistanceTable(), seed=0)
+
+    def backtest(model_group_ids):
+        with patch('audition.regrets.incremental_picks', wraps=incremental_picks) as rerun_patch:
+            picks = selection_rule_picker.picks_for_rules(rules, model_group_ids, times)
+        assert picks == SelectionRulePicker(FakeDistanceTable(), seed=0).picks_for_rules(
+            rules, model_group_ids, times
+        )
+        return picks, dict(
+            (call[0][1].descriptive_name, len(call[0][2])) for call in rerun_patch.call_args_list
+        )
+
+    picks, reruns = backtest(list(range(1, 11)))
+    assert picks[0] == [10] * len(times)
+    every_time = dict((rule.descriptive_name, len(times)) for rule in rules[:3])
+    assert reruns == every_time
+    # only each pick, its score and its ties are kept, not every candidate's score
+    kept = selection_rule_picker._backtests[rule_signature(rules[0])]['picks']
+    assert kept[times[0]] == (10, pytest.approx(0.1), frozenset())
+
+    # removing a group that wasn't picked and admitting a worse one keeps the picks
+    picks, reruns = backtest([0] + list(range(1, 3)) + list(range(4, 11)))
+    assert picks[0] == [10] * len(times)
+    assert reruns == {}
+
+    # removing the picked group, or admitting a better one, makes them again
+    assert backtest(list(range(1, 10)))[1] == every_time
+    picks, reruns = backtest(list(range(1, 10)) + [15])
+    assert picks[0] == [15] * len(times)
+    assert reruns == every_time
+
+
+def test_selection_rule_picker_regret_results():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        selection_rule_picker = SelectionRulePicker(
+            distance_from_best_table=distance_table
+        )
+        model_group_ids = [mg.model_group_id for mg in model_groups.values()]
+        train_end_times = ['2014-01-01', '2015-01-01']
+        rules = [
+            BoundSelectionRule(
+                descriptive_name='spiky',
+                function=lambda df, train_end_time: model_groups['spiky'].model_group_id,
+                args={}
+            ),
+            BoundSelectionRule(
+                descriptive_name='stable',
+                function=lambda df, train_end_time: model_groups['stable'].model_group_id,
+                args={}
+            ),
+        ]
+        regret_results = selection_rule_picker.regret_results(
+            bound_selection_rules=rules,
+            model_group_ids=model_group_ids,
+            train_end_times=train_end_times,
+            regret_metrics=[
+                {'metric': 'precision@', 'parameter': '100_abs'},
+                {'metric': 'recall@', 'parameter': '100_abs'},
+            ]
+        )
+        assert isinstance(regret_results, RegretResults)
+        assert len(regret_results.dataframe) == 2 * 2 * 2
+
+        precision = regret_results.for_metric('precision@', '100_abs')
+        assert precision['selection_rule'].tolist() == ['spiky', 'spiky', 'stable', 'stable']
+        assert precision['regret'].tolist() == [0.19, 0.3, 0.15, 0.18]
+        for rule in rules:
+            rule_precision = precision[precision['selection_rule'] == rule.descriptive_name]
+            assert rule_precision['regret'].tolist() == [
+                result['dist_from_best_case_next_time'] for result in
+                selection_rule_picker.results_for_rule(
+                    rule, model_group_ids, train_end_times, 'precision@', '100_abs'
+                )
+            ]
+        assert regret_results.regrets('recall@', '100_abs').values.tolist() == \
+            [[0.0, 0.0], [0.0, 0.0]]
+        assert regret_results.picks.loc['stable'].tolist() == \
+            [model_groups['stable'].model_group_id] * 2
+
+
+def test_HistoryView_save_and_load():
+    view = HistoryView(_distance_dataframe())
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        view.save(snapshot_dir)
+        loaded = HistoryView.load(snapshot_dir)
+        assert loaded.dataframe.columns.tolist() == view.dataframe.columns.tolist()
+        pandas.testing.assert_frame_equal(loaded.as_of('2015-01-01'), view.as_of('2015-01-01'))
+
+
+def test_picks_from_snapshot_loads_each_history_once():
+    views = [HistoryView(_distance_dataframe()), HistoryView(_distance_dataframe().iloc[:4])]
+    rule = BoundSelectionRule(function_name='random_model_group', args={})
+    with tempfile.TemporaryDirectory() as first_dir, tempfile.TemporaryDirectory() as second_dir:
+        for view, snapshot_dir in zip(views, [first_dir, second_dir]):
+            view.save(snapshot_dir)
+        with patch('audition.history.HistoryView.load', wraps=HistoryView.load) as load_patch:
+            # tasks from different histories interleave in a worker
+            for snapshot_dir in [first_dir, second_dir, first_dir, second_dir]:
+                picks_from_snapshot(snapshot_dir, rule, ['2016-01-01'], seed=0)
+            assert load_patch.call_count == 2
+            # beyond the memory budget, only the snapshot in use is kept
+            picks_from_snapshot(first_dir, rule, ['2016-01-01'], seed=0, memory_budget_mb=1e-6)
+            picks_from_snapshot(second_dir, rule, ['2016-01-01'], seed=0)
+            assert load_patch.call_count == 3
+    # the snapshots of removed directories are forgotten
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        views[0].save(snapshot_dir)
+        picks_from_snapshot(snapshot_dir, rule, ['2016-01-01'], seed=0)
+    assert list(history._loaded_snapshots) == [snapshot_dir]
+
+
+def test_HistoryView_load_keeps_missing_text():
+    df = _distance_dataframe()
+    df['parameter'] = ['100_abs', None] * 3
+    view = HistoryView(df)
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        view.save(snapshot_dir)
+        loaded = HistoryView.load(snapshot_dir)
+        assert loaded.dataframe['parameter'].isnull().tolist() == \
+            view.dataframe['parameter'].isnull().tolist()
+
+
+def test_seeded_picks_leave_global_generator_alone():
+    view = HistoryView(_distance_dataframe())
+    rule = BoundSelectionRule(function_name='random_model_group', args={})
+    times = ['2014-01-01', '2015-01-01', '2016-01-01']
+    numpy.random.seed(3)
+    expected = numpy.random.rand()
+    numpy.random.seed(3)
+    picks = picks_from_history(view, rule, times, seed=1)
+    assert numpy.random.rand() == expected
+    assert picks_from_history(view, rule, times, seed=1) == picks
+
+
+def test_selection_rule_picker_parallel_matches_serial():
+    with testing.postgresql.Postgresql() as postgresql:
+        engine = create_engine(postgresql.url())
+        distance_table, model_groups = create_sample_distance_table(engine)
+        model_group_ids = [mg.model_group_id for mg in model_groups.values()]
+        train_end_times = ['2014-01-01', '2015-01-01', '2016-01-01']
+        rules = [
+            BoundSelectionRule(
+                function_name='best_average_value',
+                args={'metric': 'precision@', 'parameter': '100_abs'}
+            ),
+            BoundSelectionRule(
+                function_name='best_avg_recency_weight',
+                args={
+                    'metric': 'precision@',
+                    'parameter': '100_abs',
+                    'curr_weight': 2.0,
+                    'decay_type': 'linear',
+                }
+            ),
+            BoundSelectionRule(function_name='random_model_group', args={}),
+            BoundSelectionRule(
+                descriptive_name='spiky',
+                function=lambda df, train_end_time: model_groups['spiky'].model_group_id,
+                args={}
+            ),
+        ]
+        serial_picks = SelectionRulePicker(distance_table, seed=5)\
+            .picks_for_rules(rules, model_group_ids, train_end_times)
+        with ProcessPoolExecutor(2) as executor:
+            parallel_picks = SelectionRulePicker(distance_table, executor=executor, seed=5)\
+                .picks_for_rules(rules, model_group_ids, train_end_times)
+        assert parallel_picks == serial_picks
+        assert serial_picks[3] == [model_groups['spiky'].model_group_id] * 3
+
+
+def test_selection_rule_picker_pick_cache():
+    class FakeDistanceTable(object):
+        fingerprint = 'abc'
+
+        def __init__(self):
+            self.fetches = 0
+
+        def as_dataframe(self, model_group_ids, metrics=None, columns=None):
+            self.fetches += 1
+            df = _distance_dataframe()
+            return df[columns] if columns else df
+
+    rule = BoundSelectionRule(
+        function_name='best_current_value',
+        args={'metric': 'precision@', 'parameter': '100_abs'}
+    )
+    train_end_times = ['2014-01-01', '2015-01-01', '2016-01-01']
+    with tempfile.TemporaryDirectory() as cache_dir:
+        distance_table = FakeDistanceTable()
+        picks = SelectionRulePicker(distance_table, pick_cache=PickCache(cache_dir), seed=0)\
+            .picks_for_rule(rule, [1, 2], train_end_times)
+        assert distance_table.fetches == 1
+
+        # a new picker, as after restarting a notebook, looks the picks up
+        distance_table = FakeDistanceTable()
+        picker = SelectionRulePicker(distance_table, pick_cache=PickCache(cache_dir), seed=0)
+        assert picker.picks_for_rule(rule, [1, 2], train_end_times) == picks
+        assert picker.model_group_from_rule(rule, [1, 2], '2016-01-01') == picks[-1]
+        assert distance_table.fetches == 0
+
+        distance_table.fingerprint = 'def'
+        assert picker.picks_for_rule(rule, [1, 2], train_end_times) == picks
+        assert distance_table.fetches == 1
+
+        # unseeded picks break ties differently each time, so they aren't cached
+        distance_table = FakeDistanceTable()
+        SelectionRulePicker(distance_table, pick_cache=PickCache(cache_dir))\
+            .picks_for_rule(rule, [1, 2], train_end_times)
+        assert distance_table.fetches == 1
@@ -1,10 +1,11 @@
-from audition.regrets import SelectionRulePicker
+from audition.regrets import SelectionRulePicker, RegretResults
 from audition.selection_rule_performance import SelectionRulePerformancePlotter
 from audition.selection_rules import BoundSelectionRule
 import testing.postgresql
 from sqlalchemy import create_engine
 from tests.utils import create_sample_distance_table
 from unittest.mock import patch
+import pandas
 
 TRAIN_END_TIMES = ['2014-01-01', '2015-01-01']
 
@@ -53,6 +54,36 @@ def test_SelectionRulePerformancePlotter_generate_plot_data():
     }
 
 
+def test_SelectionRulePerformancePlotter_generate_plot_data_from_regret_results():
+    regret_results = RegretResults(pandas.DataFrame.from_dict({
+        'selection_rule': ['rule_a', 'rule_a', 'rule_b', 'rule_b'] * 2,
+        'train_end_time': TRAIN_END_TIMES * 4,
+        'model_group_id': [1, 2, 2, 2, 1, 2, 2, 2],
+        'metric': ['precision@'] * 4 + ['recall@'] * 4,
+        'parameter': ['100_abs'] * 8,
+        'regret': [0.15, 0.30, 0.1, 0.2, 0.0, 0.0, 0.05, 0.05],
+        'raw_value_next_time': [0.5, 0.4, 0.6, 0.5, 0.3, 0.3, 0.25, 0.25],
+    }))
+    plotter = SelectionRulePerformancePlotter(MockSelectionRulePicker())
+    df = plotter.generate_plot_data(
+        bound_selection_rules=[
+            BoundSelectionRule(descriptive_name='rule_a', function=lambda df, t: 1, args={}),
+            BoundSelectionRule(descriptive_name='rule_b', function=lambda df, t: 2, args={}),
+        ],
+        regret_metric='precision@',
+        regret_parameter='100_abs',
+        model_group_ids=[1, 2],
+        train_end_times=TRAIN_END_TIMES,
+        regret_results=regret_results,
+    )
+    assert df.to_dict('list') == {
+        'selection_rule': ['rule_a', 'rule_a', 'rule_b', 'rule_b'],
+        'train_end_time': TRAIN_END_TIMES + TRAIN_END_TIMES,
+        'regret': [0.15, 0.30, 0.1, 0.2],
+        'raw_value_next_time': [0.5, 0.4, 0.6, 0.5]
+    }
+
+
 def test_SelectionRulePerformancePlotter_plot_regrets():
     with patch('audition.selection_rule_performance.plot_cats') as plot_patch:
         with testing.postgresql.Postgresql() as postgresql:
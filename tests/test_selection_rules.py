@@ -1,7 +1,8 @@
-from audition.selection_rules import best_current_value, best_average_value,\
-    most_frequent_best_dist, best_average_two_metrics,\
-    best_avg_var_penalized, best_avg_recency_weight,\
-    lowest_metric_variance
+from audition.selection_rules import best_current_value, best_average_value, \
+    most_frequent_best_dist, best_average_two_metrics, \
+    best_avg_var_penalized, best_avg_recency_weight, \
+    lowest_metric_variance, register_selection_rule, BoundSelectionRule, \
+    SELECTION_RULES
 import pandas
 
 
@@ -181,6 +182,65 @@ def test_best_avg_recency_weight_lesser_is_better():
     })
     df['train_end_time'] = pandas.to_datetime(df['train_end_time'])
 
-    assert best_avg_recency_weight(df, '2013-01-01', 'false positives@', '100_abs', 1.00, 'linear') == '1'
-    assert best_avg_recency_weight(df, '2013-01-01', 'false positives@', '100_abs', 1.15, 'linear') == '1'
-    assert best_avg_recency_weight(df, '2013-01-01', 'false positives@', '100_abs', 1.50, 'linear') == '2'
\ No newline at end of file
+    for curr_weight, expected in [(1.00, '1'), (1.15, '1'), (1.50, '2')]:
+        assert best_avg_recency_weight(
+            df, '2013-01-01', 'false positives@', '100_abs', curr_weight, 'linear'
+        ) == expected
+
+
+def test_register_selection_rule():
+    @register_selection_rule(
+        metric_args=[('metric1', 'parameter1'), ('metric2', 'parameter2')],
+        columns=['raw_value', 'dist_from_best_case'],
+    )
+    def _test_closest_pair(df, train_end_time, metric1, parameter1, metric2, parameter2):
+        return df['model_group_id'].iloc[0]
+
+    try:
+        rule = BoundSelectionRule(
+            function_name='_test_closest_pair',
+            args={
+                'metric1': 'precision@',
+                'parameter1': '100_abs',
+                'metric2': 'recall@',
+                'parameter2': '100_abs',
+            }
+        )
+        assert rule.function is _test_closest_pair
+        assert rule.required_metrics == [('precision@', '100_abs'), ('recall@', '100_abs')]
+        assert rule.required_columns == [
+            'model_group_id',
+            'train_end_time',
+            'metric',
+            'parameter',
+            'raw_value',
+            'dist_from_best_case',
+        ]
+        assert not rule.is_incremental
+    finally:
+        del SELECTION_RULES['_test_closest_pair']
+
+
+def test_unregistered_function_requirements():
+    rule = BoundSelectionRule(
+        descriptive_name='custom',
+        function=lambda df, train_end_time, metric, parameter: 1,
+        args={'metric': 'precision@', 'parameter': '100_abs'},
+    )
+    assert rule.required_metrics is None
+    assert rule.required_columns is None
+    assert not rule.is_incremental
+
+
+def test_builtin_rule_requirements():
+    rule = BoundSelectionRule(
+        function_name='most_frequent_best_dist',
+        args={'metric': 'precision@', 'parameter': '100_abs', 'dist_from_best_case': 0.1},
+    )
+    assert rule.required_metrics == [('precision@', '100_abs')]
+    assert 'dist_from_best_case' in rule.required_columns
+    assert 'dist_from_best_case_next_time' not in rule.required_columns
+    assert rule.is_incremental
+
+    random_rule = BoundSelectionRule(function_name='random_model_group', args={})
+    assert random_rule.required_metrics is None
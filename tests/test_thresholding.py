@@ -5,6 +5,8 @@ from sqlalchemy import create_engine
 from results_schema.factories import ModelGroupFactory, init_engine, session
 from catwalk.db import ensure_db
 from unittest import TestCase
+from unittest.mock import patch
+import copy
 
 
 class ModelGroupThresholderTest(TestCase):
@@ -178,3 +180,38 @@ class ModelGroupThresholderTest(TestCase):
             assert thresholder.model_group_ids == set([1])
             thresholder.update_filters([])
             assert thresholder.model_group_ids == set([1, 2, 4, 5, 6])
+
+    def test_model_group_ids_memoized(self):
+        with testing.postgresql.Postgresql() as postgresql:
+            engine = create_engine(postgresql.url())
+            thresholder = self.setup_data(engine)
+            with patch.object(
+                thresholder,
+                'model_groups_passing_rules',
+                wraps=thresholder.model_groups_passing_rules
+            ) as passing_patch:
+                assert thresholder.model_group_ids == set([1])
+                assert thresholder.model_group_ids == set([1])
+                assert passing_patch.call_count == 1
+                # unchanged filters keep the result
+                thresholder.update_filters(list(self.metric_filters))
+                assert thresholder.model_group_ids == set([1])
+                assert passing_patch.call_count == 1
+                thresholder.update_filters([])
+                assert thresholder.model_group_ids == set([1, 2, 4, 5, 6])
+                assert passing_patch.call_count == 2
+
+    def test_update_filters_edited_in_place(self):
+        with testing.postgresql.Postgresql() as postgresql:
+            engine = create_engine(postgresql.url())
+            thresholder = self.setup_data(engine)
+            metric_filters = copy.deepcopy(self.metric_filters)
+            thresholder.update_filters(metric_filters)
+            assert thresholder.model_group_ids == set([1])
+            # loosen every filter in place, so that all model groups pass
+            for metric_filter in metric_filters:
+                metric_filter['max_from_best'] = 1000
+                metric_filter['threshold_value'] = 0
+            metric_filters[2]['threshold_value'] = 1000
+            thresholder.update_filters(metric_filters)
+            assert thresholder.model_group_ids == set([1, 2, 4, 5, 6])
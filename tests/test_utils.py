@@ -0,0 +1,22 @@
+from audition.utils import ecdf
+import numpy
+
+
+def test_ecdf():
+    values = [0.3, 0.1, 0.2, 0.2, float('nan')]
+    thresholds = numpy.arange(0.0, 0.5, 0.05)
+    assert numpy.allclose(
+        ecdf(values, thresholds),
+        [
+            numpy.mean([1 if value <= threshold else 0 for value in values])
+            for threshold in thresholds
+        ]
+    )
+    assert numpy.allclose(
+        ecdf(values, thresholds, strict=True),
+        [
+            numpy.mean([1 if value < threshold else 0 for value in values])
+            for threshold in thresholds
+        ]
+    )
+    assert numpy.isnan(ecdf([], [0.1, 0.2])).all()
@@ -1,6 +1,10 @@
 from audition.distance_from_best import DistanceFromBestTable
-from results_schema.factories import ModelFactory, ModelGroupFactory, init_engine, session
+from results_schema.factories import EvaluationFactory, ModelFactory, ModelGroupFactory, \
+    init_engine, session
 from catwalk.db import ensure_db
+from datetime import datetime
+from decimal import Decimal
+import factory
 
 
 def create_sample_distance_table(engine):
@@ -66,3 +70,78 @@ def create_sample_distance_table(engine):
             dist_row
         )
     return distance_table, model_groups
+
+
+def create_sample_results(db_engine, num_model_groups=10):
+    """Create model groups, models and evaluations for four yearly train end times
+
+    Returns: (tuple) the model group ids and the train end times
+    """
+    ensure_db(db_engine)
+    init_engine(db_engine)
+    # set up data, randomly generated by the factories but conforming
+    # generally to what we expect results schema data to look like
+    model_types = [
+        'classifier type {}'.format(i)
+        for i in range(0, num_model_groups)
+    ]
+    model_groups = [
+        ModelGroupFactory(model_type=model_type)
+        for model_type in model_types
+    ]
+    train_end_times = [
+        datetime(2013, 1, 1),
+        datetime(2014, 1, 1),
+        datetime(2015, 1, 1),
+        datetime(2016, 1, 1),
+    ]
+    models = [
+        ModelFactory(model_group_rel=model_group, train_end_time=train_end_time)
+        for model_group in model_groups
+        for train_end_time in train_end_times
+    ]
+    metrics = [
+        ('precision@', '100_abs'),
+        ('recall@', '100_abs'),
+        ('precision@', '50_abs'),
+        ('recall@', '50_abs'),
+        ('fpr@', '10_pct'),
+    ]
+
+    class ImmediateEvalFactory(EvaluationFactory):
+        evaluation_start_time = factory.LazyAttribute(lambda o: o.model_rel.train_end_time)
+
+    _ = [
+        ImmediateEvalFactory(model_rel=model, metric=metric, parameter=parameter)
+        for metric, parameter in metrics
+        for model in models
+    ]
+    session.commit()
+
+    return [mg.model_group_id for mg in model_groups], train_end_times
+
+
+def _exported(value):
+    if isinstance(value, datetime):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_results_to_sqlite(db_engine, sqlite_engine):
+    """Copy the results tables audition reads to a SQLite database, as an export would"""
+    tables = {
+        'model_groups': 'model_group_id int, model_type text',
+        'models': 'model_id int, model_group_id int, train_end_time timestamp',
+        'evaluations': 'model_id int, evaluation_start_time timestamp, '
+                       'evaluation_end_time timestamp, metric text, parameter text, value float',
+    }
+    for table, columns in tables.items():
+        sqlite_engine.execute('create table {} ({})'.format(table, columns))
+        column_names = [column.split()[0] for column in columns.split(', ')]
+        rows = db_engine.execute('select {} from results.{}'.format(', '.join(column_names), table))
+        sqlite_engine.execute(
+            'insert into {} values ({})'.format(table, ', '.join('?' for _ in column_names)),
+            [tuple(_exported(value) for value in row) for row in rows]
+        )